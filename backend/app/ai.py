@@ -1,27 +1,44 @@
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, AsyncIterator
+import asyncio
 import logging
 
 from .memory import memory_store, element_store
 from .context_manager import get_context_for_generation
-from .model_infer import model_inference
-from .novel_flow import run_novel_flow
+from .model_infer import model_inference_async, model_inference_stream
+from .novel_flow import run_novel_flow, run_chapter_batch, run_novel_flow_stream
 
-# 配置日志
-logging.basicConfig(level=logging.INFO)
+# 日志配置由应用入口统一完成，这里只获取记录器
 logger = logging.getLogger(__name__)
 
 
-def generate_text(memory_id: str, user_prompt: str) -> str:
+async def generate_text(memory_id: str, user_prompt: str) -> str:
     """
     生成文本：先存储输入，再获取上下文，然后调用统一推理接口。
+    数据库操作在线程池中执行，模型调用异步等待，都不阻塞事件循环。
     """
-    memory_store.add(memory_id, user_prompt)
-    full_context = get_context_for_generation(memory_id, user_prompt)
-    result = model_inference(user_prompt, full_context)
-    memory_store.add(memory_id, result)
+    await asyncio.to_thread(memory_store.add, memory_id, user_prompt)
+    full_context = await asyncio.to_thread(get_context_for_generation, memory_id, user_prompt)
+    result = await model_inference_async(user_prompt, full_context)
+    await asyncio.to_thread(memory_store.add, memory_id, result)
     return result
 
 
+async def generate_text_stream(memory_id: str, user_prompt: str) -> AsyncIterator[bytes]:
+    """
+    流式生成文本：边生成边返回，生成结束后再把完整结果存入记忆。
+    """
+    await asyncio.to_thread(memory_store.add, memory_id, user_prompt)
+    full_context = await asyncio.to_thread(get_context_for_generation, memory_id, user_prompt)
+    
+    chunks = []
+    async for chunk in model_inference_stream(user_prompt, full_context):
+        chunks.append(chunk)
+        yield chunk
+    
+    result = b"".join(chunks).decode("utf-8").strip()
+    await asyncio.to_thread(memory_store.add, memory_id, result)
+
+
 def generate_outline(novel_id: str, style: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """
     生成小说大纲
@@ -59,6 +76,46 @@ def generate_chapter(novel_id: str, chapter_id: str, style: Optional[Dict[str, A
     return run_novel_flow(novel_id, "chapter", **kwargs)
 
 
+def generate_chapters(
+    novel_id: str,
+    chapter_ids: List[str],
+    style: Optional[Dict[str, Any]] = None,
+    polish: bool = False
+) -> List[Dict[str, Any]]:
+    """
+    并行生成多个章节的内容
+    
+    参数:
+        novel_id: 小说ID
+        chapter_ids: 章节ID列表
+        style: 可选的风格信息
+        polish: 是否在每章生成后立即润色（生成与润色分阶段流水线执行）
+    
+    返回:
+        与chapter_ids顺序一致的生成结果列表；中断后重新调用时跳过已完成的章节
+    """
+    return run_chapter_batch(novel_id, chapter_ids, style, polish=polish)
+
+
+def generate_chapter_stream(novel_id: str, chapter_id: str, style: Optional[Dict[str, Any]] = None) -> AsyncIterator[bytes]:
+    """
+    流式生成章节内容，生成结束后与 generate_chapter 一样保存
+    
+    参数:
+        novel_id: 小说ID
+        chapter_id: 章节ID
+        style: 可选的风格信息
+    
+    返回:
+        章节文本片段的异步迭代器
+    """
+    kwargs = {"chapter_id": chapter_id}
+    if style:
+        kwargs["style"] = style
+    
+    return run_novel_flow_stream(novel_id, "chapter", **kwargs)
+
+
 def polish_content(novel_id: str, chapter_id: str, content: str, style: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
     """
     优化章节内容
@@ -79,6 +136,26 @@ def polish_content(novel_id: str, chapter_id: str, content: str, style: Optional
     return run_novel_flow(novel_id, "polish", **kwargs)
 
 
+def polish_content_stream(novel_id: str, chapter_id: str, content: str, style: Optional[Dict[str, Any]] = None) -> AsyncIterator[bytes]:
+    """
+    流式优化章节内容，优化结束后与 polish_content 一样保存
+    
+    参数:
+        novel_id: 小说ID
+        chapter_id: 章节ID
+        content: 当前内容
+        style: 可选的风格信息
+    
+    返回:
+        优化后文本片段的异步迭代器
+    """
+    kwargs = {"chapter_id": chapter_id, "content": content}
+    if style:
+        kwargs["style"] = style
+    
+    return run_novel_flow_stream(novel_id, "polish", **kwargs)
+
+
 def continue_content(novel_id: str, chapter_id: str, content: str) -> Dict[str, Any]:
     """
     续写章节内容
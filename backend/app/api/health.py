@@ -4,7 +4,7 @@
 from fastapi import APIRouter, Depends, Request
 from typing import Dict, Any
 
-from ..utils.app_state import get_app_state, ServiceStatus
+from ..utils.app_state import app_state, ServiceStatus
 from ..utils.logging_utils import get_logger
 
 # 获取日志记录器
@@ -22,8 +22,6 @@ async def health_check(request: Request) -> Dict[str, Any]:
     """
     健康检查接口，返回应用的基本健康状态
     """
-    app_state = get_app_state()
-    
     # 获取基本健康状态
     health_data = {
         "status": app_state.status,
@@ -38,7 +36,6 @@ async def detailed_status() -> Dict[str, Any]:
     """
     获取详细的应用状态信息，包括各组件状态和性能指标
     """
-    app_state = get_app_state()
     return app_state.get_health_status()
 
 @router.post("/maintenance", status_code=202)
@@ -50,8 +47,6 @@ async def set_maintenance_mode(enable: bool = True, message: str = None) -> Dict
         enable: 是否启用维护模式
         message: 维护说明信息
     """
-    app_state = get_app_state()
-    
     if enable:
         app_state.enter_maintenance_mode(message)
         logger.warning(f"手动设置应用进入维护模式: {message}")
@@ -64,7 +59,6 @@ async def set_maintenance_mode(enable: bool = True, message: str = None) -> Dict
 @router.post("/reset-metrics", status_code=202)
 async def reset_metrics() -> Dict[str, str]:
     """重置应用性能指标"""
-    app_state = get_app_state()
     app_state.reset_metrics()
     
     return {"message": "应用性能指标已重置"}
@@ -2,6 +2,7 @@
 记忆系统API - 提供记忆系统功能的REST接口
 """
 import logging
+from datetime import datetime
 from typing import Dict, Any, List, Optional
 
 from fastapi import APIRouter, HTTPException, Depends
@@ -10,8 +11,7 @@ from pydantic import BaseModel, Field
 from ..memory_system import memory_system
 from ..vector_store import vector_store
 
-# 配置日志
-logging.basicConfig(level=logging.INFO)
+# 日志配置由应用入口统一完成，这里只获取记录器
 logger = logging.getLogger(__name__)
 
 # 创建路由器
@@ -311,7 +311,10 @@ async def get_generation_context(request: ContextRequest):
 async def get_short_term_memories(project_id: str, limit: Optional[int] = None):
     """获取短期记忆"""
     try:
-        memories = memory_system.short_term.get(project_id, limit)
+        memories = [
+            {**memory, "timestamp": datetime.fromtimestamp(memory["timestamp"]).isoformat()}
+            for memory in memory_system.short_term.get(project_id, limit)
+        ]
         return {"success": True, "memories": memories}
     except Exception as e:
         logger.error(f"获取短期记忆失败: {str(e)}")
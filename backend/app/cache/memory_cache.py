@@ -7,8 +7,7 @@ import logging
 import threading
 from typing import Any, Dict, List, Optional, Union, Tuple
 
-# 配置日志
-logging.basicConfig(level=logging.INFO)
+# 日志配置由应用入口统一完成，这里只获取记录器
 logger = logging.getLogger(__name__)
 
 
@@ -3,6 +3,7 @@ Redis缓存模块 - 提供基于Redis的缓存功能
 """
 import json
 import time
+import pickle
 from typing import Dict, Any, Optional, Union, List
 
 import redis
@@ -45,7 +45,7 @@ class Settings(BaseSettings):
     # 日志配置
     log_level: LogLevel = LogLevel(os.getenv("LOG_LEVEL", "info"))
     log_file: Optional[str] = os.getenv("LOG_FILE", None)
-    log_format: str = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    log_format: str = "%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] - %(message)s"
     
     # 数据库配置
     postgres_db: str = os.getenv("POSTGRES_DB", "novel_forge")
@@ -73,6 +73,18 @@ class Settings(BaseSettings):
     local_model_path: str = os.getenv("LOCAL_MODEL_PATH", "")
     ollama_base_url: str = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434")
     ollama_model: str = os.getenv("OLLAMA_MODEL", "llama2")
+    max_concurrent_llm: int = int(os.getenv("MAX_CONCURRENT_LLM", "10"))  # 同时进行的异步模型调用上限
+    # 并行生成后端：thread适合调用远程API的IO密集型生成，process/ray适合本地CPU密集型生成
+    parallel_backend: str = os.getenv("NOVELFORGE_PARALLEL_BACKEND", "thread")
+    knowledge_graph_cache_size: int = int(os.getenv("KNOWLEDGE_GRAPH_CACHE_SIZE", "32"))  # 内存中保留的知识图谱数量
+    
+    # LLM响应缓存配置
+    llm_cache_enabled: bool = os.getenv("LLM_CACHE_ENABLED", "true").lower() == "true"
+    # 语义匹配层默认关闭：章节号等细微差异的写作要求向量相近，可能互相命中
+    llm_semantic_cache_enabled: bool = os.getenv("LLM_SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+    llm_cache_size: int = int(os.getenv("LLM_CACHE_SIZE", "1024"))
+    llm_cache_ttl: int = int(os.getenv("LLM_CACHE_TTL", "86400"))  # 默认24小时
+    llm_cache_threshold: float = float(os.getenv("LLM_CACHE_THRESHOLD", "0.92"))
     
     # 向量存储配置
     vector_store_provider: Optional[str] = os.getenv("VECTOR_STORE_PROVIDER")  # pinecone, weaviate, chroma等
@@ -104,6 +116,11 @@ class Settings(BaseSettings):
     algorithm: str = os.getenv("ALGORITHM", "HS256")
     access_token_expire_minutes: int = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
     
+    @property
+    def mode(self) -> str:
+        """AI运行模式（api或local），推理入口据此选择云端API或本地模型"""
+        return ModelMode(self.ai_mode).value
+    
     @property
     def database_url(self) -> str:
         """PostgreSQL连接URL"""
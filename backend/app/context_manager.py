@@ -17,8 +17,7 @@ from .config import settings
 from .cache.cache_factory import cache
 from .model_infer import model_inference
 
-# 配置日志
-logging.basicConfig(level=logging.INFO)
+# 日志配置由应用入口统一完成，这里只获取记录器
 logger = logging.getLogger(__name__)
 
 # 上下文窗口配置
@@ -5,18 +5,20 @@
 import os
 import logging
 import time
+import random
 from typing import Dict, Any, List, Optional, Tuple, Union, Callable
 import json
 import contextlib
 from functools import wraps
 
+import numpy as np
 import psycopg2
-from psycopg2.extras import Json, RealDictCursor
+from psycopg2 import errors as pg_errors
+from psycopg2.extras import Json, RealDictCursor, execute_values, register_default_json, register_default_jsonb
 from psycopg2.pool import SimpleConnectionPool
 from psycopg2.extensions import ISOLATION_LEVEL_SERIALIZABLE, ISOLATION_LEVEL_READ_COMMITTED
 
-# 配置日志
-logging.basicConfig(level=logging.INFO)
+# 日志配置由应用入口统一完成，这里只获取记录器
 logger = logging.getLogger(__name__)
 
 # 导入统一配置
@@ -26,9 +28,65 @@ from ..utils.logging_utils import get_logger
 # 获取日志记录器
 logger = get_logger(__name__)
 
+# 尝试导入orjson，用于加速JSONB字段的编码和解码
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    logger.warning("orjson未安装，JSONB字段将使用标准库json序列化")
+    ORJSON_AVAILABLE = False
+
+
+class OJson(Json):
+    """使用orjson序列化的JSONB参数适配器，未安装orjson时与Json相同"""
+    
+    def dumps(self, obj):
+        if ORJSON_AVAILABLE:
+            return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS).decode()
+        return super().dumps(obj)
+
+
+# 尝试导入pgvector的psycopg2适配器，用于直接传递numpy向量
+try:
+    from pgvector.psycopg2 import register_vector
+    PGVECTOR_AVAILABLE = True
+except ImportError:
+    logger.warning("pgvector未安装，向量参数将转换为Python列表传递")
+    PGVECTOR_AVAILABLE = False
+
+# register_vector注册的numpy适配器是全局的，只需执行一次
+_vector_registered = False
+
+if ORJSON_AVAILABLE:
+    # 查询结果中的json/jsonb字段也用orjson解码
+    register_default_json(globally=True, loads=orjson.loads)
+    register_default_jsonb(globally=True, loads=orjson.loads)
+
 # 全局连接池
 connection_pool = None
 
+# HNSW向量检索的候选列表大小，越大召回率越高、查询越慢
+# 项目过滤在HNSW检索之后进行，需要比默认值(40)更大的候选列表才能凑够结果
+HNSW_EF_SEARCH = 100
+# 向量数少于该值的项目先按project_id过滤再精确排序，不走HNSW索引
+PREFILTER_MAX_ROWS = 1000
+# 项目向量数缓存的有效期（秒）
+VECTOR_COUNT_TTL = 60
+
+# 项目ID -> (向量数, 统计时间)，近似值，仅用于选择查询计划
+_vector_counts = {}
+
+# 已在服务端准备好的语句：(后端进程ID, 语句名称)
+_prepared_statements = set()
+
+# 可重试的瞬时错误：序列化冲突、死锁、连接中断等
+# IntegrityError、ProgrammingError等永久性错误重试也不会成功，直接抛出
+RETRYABLE_ERRORS = (
+    pg_errors.SerializationFailure,
+    pg_errors.DeadlockDetected,
+    psycopg2.OperationalError,
+)
+
 def init_db_pool(min_conn: int = None, max_conn: int = None, **kwargs) -> bool:
     """
     初始化数据库连接池
@@ -144,7 +202,7 @@ def db_transaction(isolation_level=ISOLATION_LEVEL_READ_COMMITTED):
     try:
         conn = get_db_connection()
         if not conn:
-            raise Exception("无法获取数据库连接")
+            raise psycopg2.OperationalError("无法获取数据库连接")
         
         # 设置隔离级别
         conn.set_isolation_level(isolation_level)
@@ -163,13 +221,17 @@ def db_transaction(isolation_level=ISOLATION_LEVEL_READ_COMMITTED):
         if conn:
             release_db_connection(conn)
 
-def retry_on_error(max_retries=3, retry_delay=0.5):
+def retry_on_error(max_retries=3, retry_delay=0.01, max_delay=1.0):
     """
     数据库操作重试装饰器
     
+    只重试RETRYABLE_ERRORS中的瞬时错误，退避时间按指数增长并加入随机抖动，
+    避免并发写入冲突后所有请求同时重试
+    
     参数:
         max_retries: 最大重试次数
-        retry_delay: 重试延迟（秒）
+        retry_delay: 初始重试延迟（秒）
+        max_delay: 单次重试延迟上限（秒）
     
     用法:
         @retry_on_error(max_retries=3)
@@ -183,11 +245,13 @@ def retry_on_error(max_retries=3, retry_delay=0.5):
             for attempt in range(max_retries):
                 try:
                     return func(*args, **kwargs)
-                except Exception as e:
+                except RETRYABLE_ERRORS as e:
                     last_error = e
                     logger.warning(f"操作失败 (尝试 {attempt+1}/{max_retries}): {str(e)}")
                     if attempt < max_retries - 1:
-                        time.sleep(retry_delay * (2 ** attempt))  # 指数退避
+                        # 指数退避 + 抖动
+                        delay = min(max_delay, retry_delay * (2 ** attempt))
+                        time.sleep(delay * (0.5 + random.random()))
             
             # 所有重试都失败
             logger.error(f"操作在 {max_retries} 次尝试后失败: {str(last_error)}")
@@ -238,6 +302,33 @@ def execute_query(query: str, params: tuple = None, fetch: bool = True,
             release_db_connection(conn)
 
 
+def _execute_prepared(cursor, name: str, statement: str, params: tuple) -> None:
+    """
+    以服务端预备语句执行SQL，每个数据库连接只PREPARE一次
+    
+    参数:
+        cursor: 数据库游标
+        name: 预备语句名称
+        statement: 使用$1、$2...占位符的SQL语句
+        params: 语句参数
+    """
+    key = (cursor.connection.info.backend_pid, name)
+    if key not in _prepared_statements:
+        # PREPARE不随事务回滚，未记录的连接上也可能已存在同名语句，先查询确认
+        cursor.execute("SELECT 1 FROM pg_prepared_statements WHERE name = %s", (name,))
+        if not cursor.fetchone():
+            cursor.execute(f"PREPARE {name} AS {statement}")
+        _prepared_statements.add(key)
+    placeholders = ", ".join(["%s"] * len(params))
+    try:
+        cursor.execute(f"EXECUTE {name} ({placeholders})", params)
+    except pg_errors.InvalidSqlStatementName:
+        # 语句不存在（后端进程ID被新连接复用），下次重新PREPARE
+        # 其他执行错误不影响已准备的语句，保留记录
+        _prepared_statements.discard(key)
+        raise
+
+
 def create_project(title: str, description: str, author_id: str) -> Tuple[bool, str]:
     """
     创建新项目
@@ -298,18 +389,57 @@ def save_memory_entry(project_id: str, entry_type: str, content: str,
     返回:
         (成功标志, 记忆ID或错误信息)
     """
-    query = """
-    INSERT INTO memory_entries (project_id, entry_type, content, metadata)
-    VALUES (%s, %s, %s, %s)
-    RETURNING id
-    """
-    success, result = execute_query(query, (project_id, entry_type, content, Json(metadata or {})))
+    try:
+        with db_transaction() as (conn, cursor):
+            _execute_prepared(
+                cursor, "save_memory_entry",
+                "INSERT INTO memory_entries (project_id, entry_type, content, metadata) "
+                "VALUES ($1, $2, $3, $4) RETURNING id",
+                (project_id, entry_type, content, OJson(metadata or {}))
+            )
+            result = cursor.fetchall()
+        success = True
+    except Exception as e:
+        logger.error(f"保存记忆条目失败: {str(e)}")
+        success, result = False, None
     
     if success and result:
         return True, result[0]['id']
     return False, "保存记忆条目失败" if not success else "未返回记忆ID"
 
 
+def save_memory_entries(project_id: str, items: List[Dict[str, Any]]) -> Tuple[bool, Any]:
+    """
+    批量保存记忆条目，所有条目在一次往返中插入
+    
+    参数:
+        project_id: 项目ID
+        items: 记忆条目列表，每项包含content、entry_type和可选的metadata
+    
+    返回:
+        (成功标志, 与items一一对应的记忆ID列表或错误信息)
+    """
+    if not items:
+        return True, []
+    
+    rows = [
+        (project_id, item["entry_type"], item["content"], OJson(item.get("metadata") or {}))
+        for item in items
+    ]
+    query = """
+    INSERT INTO memory_entries (project_id, entry_type, content, metadata)
+    VALUES %s
+    RETURNING id
+    """
+    try:
+        with db_transaction() as (conn, cursor):
+            result = execute_values(cursor, query, rows, page_size=100, fetch=True)
+        return True, [row['id'] for row in result]
+    except Exception as e:
+        logger.error(f"批量保存记忆条目失败: {str(e)}\nProject: {project_id}\nCount: {len(items)}")
+        return False, str(e)
+
+
 def get_memory_entries(project_id: str, entry_type: Optional[str] = None, 
                       limit: int = 100) -> Tuple[bool, List[Dict[str, Any]]]:
     """
@@ -377,7 +507,7 @@ def save_novel_element(project_id: str, element_type: str, element_id: str,
             WHERE project_id = %s AND element_type = %s AND element_id = %s
             RETURNING id
             """
-            success, result = execute_query(update_query, (Json(data), project_id, element_type, element_id))
+            success, result = execute_query(update_query, (OJson(data), project_id, element_type, element_id))
         else:
             # 创建新元素
             insert_query = """
@@ -385,7 +515,7 @@ def save_novel_element(project_id: str, element_type: str, element_id: str,
             VALUES (%s, %s, %s, %s)
             RETURNING id
             """
-            success, result = execute_query(insert_query, (project_id, element_type, element_id, Json(data)))
+            success, result = execute_query(insert_query, (project_id, element_type, element_id, OJson(data)))
     
     if success and result:
         return True, result[0]['id']
@@ -440,6 +570,133 @@ def get_novel_elements_by_type(project_id: str, element_type: str) -> Tuple[bool
     return False, result
 
 
+def save_relationships(project_id: str, relationships: List[Dict[str, Any]],
+                       update_existing: bool = True) -> Tuple[bool, Any]:
+    """
+    批量保存知识图谱关系，相同ID的关系只更新属性
+    
+    参数:
+        project_id: 项目ID
+        relationships: 关系列表，每项包含id、from_node、to_node、type和properties
+        update_existing: 已存在相同ID的关系时是否更新属性，为False时保留已有关系
+    
+    返回:
+        (成功标志, 保存的关系数量或错误信息)
+    """
+    if not relationships:
+        return True, 0
+    
+    rows = [
+        (project_id, rel["id"], rel["from_node"]["type"], rel["from_node"]["id"],
+         rel["to_node"]["type"], rel["to_node"]["id"], rel["type"], OJson(rel.get("properties") or {}))
+        for rel in relationships
+    ]
+    conflict_action = "DO UPDATE SET properties = EXCLUDED.properties" if update_existing else "DO NOTHING"
+    query = f"""
+    INSERT INTO relationships (project_id, id, from_type, from_id, to_type, to_id, rel_type, properties)
+    VALUES %s
+    ON CONFLICT (project_id, id) {conflict_action}
+    """
+    try:
+        with db_transaction() as (conn, cursor):
+            execute_values(cursor, query, rows)
+        return True, len(rows)
+    except Exception as e:
+        logger.error(f"保存项目 {project_id} 的知识图谱关系失败: {str(e)}")
+        return False, str(e)
+
+
+def import_legacy_relationships(project_id: str) -> Tuple[bool, Any]:
+    """
+    把graph_states图状态中的旧版关系迁移到relationships表，并从图状态中删除
+    
+    读取、写入和删除在同一事务中完成，并锁定图状态行，多个进程同时迁移时只有一个会写入；
+    已存在的关系保留表中的版本，不被旧数据覆盖
+    
+    参数:
+        project_id: 项目ID，即旧版图状态的thread_id
+    
+    返回:
+        (成功标志, 迁移的关系数量或错误信息)
+    """
+    try:
+        with db_transaction() as (conn, cursor):
+            cursor.execute(
+                "SELECT state->'relationships' AS relationships FROM graph_states "
+                "WHERE thread_id = %s AND state ? 'relationships' FOR UPDATE",
+                (project_id,)
+            )
+            row = cursor.fetchone()
+            if row is None:
+                return True, 0
+            
+            legacy = row["relationships"] or []
+            if legacy:
+                execute_values(cursor, """
+                INSERT INTO relationships (project_id, id, from_type, from_id, to_type, to_id, rel_type, properties)
+                VALUES %s
+                ON CONFLICT (project_id, id) DO NOTHING
+                """, [
+                    (project_id, rel["id"], rel["from_node"]["type"], rel["from_node"]["id"],
+                     rel["to_node"]["type"], rel["to_node"]["id"], rel["type"], OJson(rel.get("properties") or {}))
+                    for rel in legacy
+                ])
+            cursor.execute(
+                "UPDATE graph_states SET state = state - 'relationships', updated_at = CURRENT_TIMESTAMP "
+                "WHERE thread_id = %s",
+                (project_id,)
+            )
+        return True, len(legacy)
+    except Exception as e:
+        logger.error(f"迁移项目 {project_id} 的旧版知识图谱关系失败: {str(e)}")
+        return False, str(e)
+
+
+def get_relationships_for_node(project_id: str, node_type: Optional[str] = None, 
+                               node_id: Optional[str] = None) -> Tuple[bool, List[Dict[str, Any]]]:
+    """
+    获取与节点相关的知识图谱关系，过滤在数据库中通过索引完成
+    
+    参数:
+        project_id: 项目ID
+        node_type: 可选的节点类型过滤
+        node_id: 可选的节点ID过滤（需同时指定node_type）
+    
+    返回:
+        (成功标志, 关系列表或错误信息)
+    """
+    if node_type and node_id:
+        condition = "AND ((from_type = %s AND from_id = %s) OR (to_type = %s AND to_id = %s))"
+        params = (project_id, node_type, node_id, node_type, node_id)
+    elif node_type:
+        condition = "AND (from_type = %s OR to_type = %s)"
+        params = (project_id, node_type, node_type)
+    else:
+        condition = ""
+        params = (project_id,)
+    
+    query = f"""
+    SELECT id, from_type, from_id, to_type, to_id, rel_type, properties
+    FROM relationships
+    WHERE project_id = %s {condition}
+    ORDER BY seq
+    """
+    success, result = execute_query(query, params)
+    
+    if success:
+        return True, [
+            {
+                "id": row["id"],
+                "from_node": {"type": row["from_type"], "id": row["from_id"]},
+                "to_node": {"type": row["to_type"], "id": row["to_id"]},
+                "type": row["rel_type"],
+                "properties": row["properties"] or {}
+            }
+            for row in result
+        ]
+    return False, result
+
+
 def save_chapter(project_id: str, chapter_number: int, title: str, 
                 summary: Optional[str] = None, content: Optional[str] = None,
                 status: str = 'draft') -> Tuple[bool, str]:
@@ -564,7 +821,7 @@ def save_outline(project_id: str, skeleton: str, structure: Dict[str, Any]) -> T
             WHERE project_id = %s
             RETURNING id
             """
-            success, result = execute_query(update_query, (skeleton, Json(structure), project_id))
+            success, result = execute_query(update_query, (skeleton, OJson(structure), project_id))
         else:
             # 创建新大纲
             insert_query = """
@@ -572,7 +829,7 @@ def save_outline(project_id: str, skeleton: str, structure: Dict[str, Any]) -> T
             VALUES (%s, %s, %s)
             RETURNING id
             """
-            success, result = execute_query(insert_query, (project_id, skeleton, Json(structure)))
+            success, result = execute_query(insert_query, (project_id, skeleton, OJson(structure)))
     
     if success and result:
         return True, result[0]['id']
@@ -622,7 +879,7 @@ def save_version_history(project_id: str, entity_type: str, entity_id: str,
     VALUES (%s, %s, %s, %s, %s)
     RETURNING id
     """
-    success, result = execute_query(query, (project_id, entity_type, entity_id, Json(version_data), comment))
+    success, result = execute_query(query, (project_id, entity_type, entity_id, OJson(version_data), comment))
     
     if success and result:
         return True, result[0]['id']
@@ -688,30 +945,60 @@ def get_project_summary(project_id: str) -> Tuple[bool, Dict[str, Any]]:
 # 向量数据库相关函数
 # 注意：这些函数需要实际的向量嵌入模型支持
 
-def save_vector_memory(memory_id: str, embedding: List[float]) -> Tuple[bool, str]:
+def _vector_param(cursor, embedding) -> Any:
+    """
+    把向量转换为SQL参数
+    
+    安装了pgvector时直接传递float32数组，由适配器生成向量字面量；
+    否则转换为Python列表
+    
+    参数:
+        cursor: 数据库游标（首次使用时用于注册pgvector类型）
+        embedding: 向量（numpy数组或列表）
+    
+    返回:
+        可传给cursor.execute的参数
+    """
+    global _vector_registered
+    if PGVECTOR_AVAILABLE:
+        if not _vector_registered:
+            register_vector(cursor)
+            _vector_registered = True
+        return np.asarray(embedding, dtype=np.float32)
+    return [float(x) for x in embedding]
+
+
+def save_vector_memory(memory_id: str, embedding: np.ndarray) -> Tuple[bool, str]:
     """
     保存向量记忆
     
     参数:
         memory_id: 记忆ID
-        embedding: 向量嵌入
+        embedding: 向量嵌入（numpy数组或列表）
     
     返回:
         (成功标志, 向量ID或错误信息)
     """
+    # 冗余保存project_id，检索时可以直接按项目过滤而无需先连接memory_entries
+    # 向量以半精度(halfvec)存储，检索时读取和传输的数据量减半
     query = """
-    INSERT INTO vector_memories (memory_id, embedding)
-    VALUES (%s, %s)
+    INSERT INTO vector_memories (memory_id, project_id, embedding)
+    SELECT id, project_id, %s::halfvec FROM memory_entries WHERE id = %s
     RETURNING id
     """
-    success, result = execute_query(query, (memory_id, embedding))
+    try:
+        with db_transaction() as (conn, cursor):
+            cursor.execute(query, (_vector_param(cursor, embedding), memory_id))
+            result = cursor.fetchall()
+    except Exception as e:
+        return False, str(e)
     
-    if success and result:
+    if result:
         return True, result[0]['id']
-    return False, "保存向量记忆失败" if not success else "未返回向量ID"
+    return False, "未返回向量ID"
 
 
-def search_related_memories(project_id: str, query_embedding: List[float], 
+def search_related_memories(project_id: str, query_embedding: np.ndarray, 
                           limit: int = 5) -> Tuple[bool, List[Dict[str, Any]]]:
     """
     搜索相关记忆
@@ -724,25 +1011,63 @@ def search_related_memories(project_id: str, query_embedding: List[float],
     返回:
         (成功标志, 相关记忆列表或错误信息)
     """
+    # 直接按距离运算符排序（而不是按similarity表达式），HNSW索引才会生效
     query = """
     SELECT 
         me.id AS memory_id,
         me.entry_type,
         me.content,
         me.metadata,
-        1 - (vm.embedding <=> %s) AS similarity
+        1 - (vm.embedding <=> %(embedding)s::halfvec) AS similarity
     FROM 
-        memory_entries me
+        vector_memories vm
     JOIN 
-        vector_memories vm ON me.id = vm.memory_id
+        memory_entries me ON me.id = vm.memory_id
     WHERE 
-        me.project_id = %s
+        vm.project_id = %(project_id)s
     ORDER BY 
-        similarity DESC
-    LIMIT %s
+        vm.embedding <=> %(embedding)s::halfvec
+    LIMIT %(limit)s
     """
-    success, result = execute_query(query, (query_embedding, project_id, limit))
-    
-    if success:
+    try:
+        prefilter = _get_vector_count(project_id) < PREFILTER_MAX_ROWS
+        with db_transaction() as (conn, cursor):
+            params = {
+                "embedding": _vector_param(cursor, query_embedding),
+                "project_id": project_id,
+                "limit": limit
+            }
+            if prefilter:
+                # 小项目：按project_id索引做位图扫描后精确排序，避免HNSW后过滤丢结果
+                cursor.execute("SET LOCAL enable_indexscan = off")
+            else:
+                # 大项目：HNSW检索后按项目过滤，放大候选列表保证召回率
+                cursor.execute("SET LOCAL hnsw.ef_search = %s", (HNSW_EF_SEARCH,))
+            cursor.execute(query, params)
+            result = cursor.fetchall()
         return True, [dict(item) for item in result]
-    return False, result
+    except Exception as e:
+        return False, str(e)
+
+
+def _get_vector_count(project_id: str) -> int:
+    """
+    获取项目的近似向量数，结果缓存VECTOR_COUNT_TTL秒
+    
+    参数:
+        project_id: 项目ID
+    
+    返回:
+        向量数，统计失败时返回0
+    """
+    cached = _vector_counts.get(project_id)
+    now = time.monotonic()
+    if cached is not None and now - cached[1] < VECTOR_COUNT_TTL:
+        return cached[0]
+    
+    success, result = execute_query(
+        "SELECT COUNT(*) AS count FROM vector_memories WHERE project_id = %s", (project_id,)
+    )
+    count = result[0]["count"] if success and result else 0
+    _vector_counts[project_id] = (count, now)
+    return count
@@ -2,17 +2,55 @@
 向量嵌入模块 - 提供统一的文本嵌入功能
 """
 import os
+import hashlib
 import logging
 import numpy as np
-from typing import List, Optional
+from functools import lru_cache
+from typing import List, Optional, Union
 
-# 配置日志
-logging.basicConfig(level=logging.INFO)
+# 日志配置由应用入口统一完成，这里只获取记录器
 logger = logging.getLogger(__name__)
 
 # 全局嵌入模型
 EMBEDDING_MODEL = None
 
+# 统一的向量维度
+EMBEDDING_DIM = 1536
+
+# 本地模型批量编码的批大小
+ENCODE_BATCH_SIZE = 32
+
+# 本地模型推理精度：auto（GPU上FP16，CPU上int8动态量化）或fp32
+EMBEDDING_PRECISION = os.environ.get("EMBEDDING_PRECISION", "auto").lower()
+
+def _reduce_precision(model):
+    """
+    降低本地模型的推理精度以提高吞吐量
+    
+    GPU上转换为FP16；CPU上对Linear层做int8动态量化。
+    encode的输出仍统一转换为float32，不影响下游计算
+    
+    参数:
+        model: SentenceTransformer模型
+    
+    返回:
+        转换后的模型，失败时返回原模型
+    """
+    if EMBEDDING_PRECISION == "fp32":
+        return model
+    
+    try:
+        import torch
+        if torch.cuda.is_available():
+            model = model.to("cuda").half()
+            logger.info("本地Embedding模型使用GPU FP16推理")
+        else:
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            logger.info("本地Embedding模型使用CPU int8动态量化推理")
+    except Exception as e:
+        logger.warning(f"降低Embedding模型精度失败: {str(e)}，使用FP32推理")
+    return model
+
 def init_embedding_model():
     """初始化嵌入模型"""
     global EMBEDDING_MODEL
@@ -20,7 +58,7 @@ def init_embedding_model():
     # 尝试加载本地模型
     try:
         from sentence_transformers import SentenceTransformer
-        EMBEDDING_MODEL = SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2')
+        EMBEDDING_MODEL = _reduce_precision(SentenceTransformer('paraphrase-multilingual-MiniLM-L12-v2'))
         logger.info("成功加载本地Embedding模型")
         return True
     except Exception as e:
@@ -36,59 +74,123 @@ def init_embedding_model():
     except Exception as e:
         logger.warning(f"配置OpenAI API失败: {str(e)}")
     
-    logger.warning("无法初始化任何嵌入模型，将使用随机向量（仅用于测试）")
+    logger.warning("无法初始化任何嵌入模型，将使用哈希向量（仅用于测试）")
     return False
 
-def get_embedding(text: str, model: Optional[str] = None) -> List[float]:
+def fallback_embedding(text: str) -> np.ndarray:
     """
-    获取文本的向量嵌入表示
+    无可用模型时的后备向量
+    
+    由文本哈希确定性地生成并归一化：相同文本得到相同向量，
+    不会像随机向量那样让相似度检索结果每次都不同
     
     参数:
         text: 输入文本
+    
+    返回:
+        1536维float32单位向量
+    """
+    digest = hashlib.shake_256(text.encode("utf-8")).digest(EMBEDDING_DIM)
+    vector = np.frombuffer(digest, dtype=np.int8).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+def _fallback_embeddings(texts: List[str]) -> np.ndarray:
+    """批量生成后备向量"""
+    return np.vstack([fallback_embedding(text) for text in texts])
+
+def _fit_dimension(embeddings: np.ndarray) -> np.ndarray:
+    """将二维向量矩阵填充或截断到统一维度"""
+    dim = embeddings.shape[1]
+    if dim < EMBEDDING_DIM:
+        padding = np.zeros((embeddings.shape[0], EMBEDDING_DIM - dim), dtype=embeddings.dtype)
+        return np.hstack([embeddings, padding])
+    if dim > EMBEDDING_DIM:
+        return embeddings[:, :EMBEDDING_DIM]
+    return embeddings
+
+@lru_cache(maxsize=1)
+def _get_openai_client(api_key: str):
+    """按API密钥缓存OpenAI客户端，复用其HTTP连接池"""
+    from openai import OpenAI
+    return OpenAI(api_key=api_key)
+
+
+def get_embeddings(texts: Union[str, List[str]], model: Optional[str] = None) -> np.ndarray:
+    """
+    批量获取文本的向量嵌入
+    
+    一次调用完成整批文本的编码，避免逐条调用模型
+    
+    参数:
+        texts: 单个文本或文本列表
         model: 可选的模型名称
     
     返回:
-        向量嵌入（1536维浮点数列表）
+        单个文本返回一维向量，文本列表返回 (N, 1536) 的矩阵
     """
     global EMBEDDING_MODEL
     
+    single = isinstance(texts, str)
+    batch = [texts] if single else list(texts)
+    
+    def _result(embeddings: np.ndarray) -> np.ndarray:
+        return embeddings[0] if single else embeddings
+    
+    if not batch:
+        return np.zeros((0, EMBEDDING_DIM), dtype=np.float32)
+    
     # 如果模型未初始化，尝试初始化
     if EMBEDDING_MODEL is None and not init_embedding_model():
-        # 使用随机向量作为后备方案
-        logger.warning("使用随机向量作为嵌入，仅用于测试")
-        return np.random.randn(1536).tolist()
+        # 使用哈希向量作为后备方案
+        logger.warning("使用哈希向量作为嵌入，仅用于测试")
+        return _result(_fallback_embeddings(batch))
     
     # 使用本地模型
     if EMBEDDING_MODEL:
         try:
-            embedding = EMBEDDING_MODEL.encode(text)
+            embeddings = EMBEDDING_MODEL.encode(
+                batch,
+                batch_size=ENCODE_BATCH_SIZE,
+                convert_to_numpy=True,
+                normalize_embeddings=True
+            )
+            # 半精度模型的输出统一转换为float32
+            embeddings = np.atleast_2d(embeddings).astype(np.float32, copy=False)
             # 确保维度一致（如果本地模型维度不是1536，进行填充或截断）
-            if len(embedding) < 1536:
-                padding = np.zeros(1536 - len(embedding))
-                embedding = np.concatenate([embedding, padding])
-            elif len(embedding) > 1536:
-                embedding = embedding[:1536]
-            return embedding.tolist()
+            return _result(_fit_dimension(embeddings))
         except Exception as e:
             logger.error(f"本地模型嵌入失败: {str(e)}")
     
     # 使用OpenAI API
     try:
-        from openai import OpenAI
         api_key = os.environ.get("OPENAI_API_KEY")
         if api_key:
-            client = OpenAI(api_key=api_key)
+            client = _get_openai_client(api_key)
             response = client.embeddings.create(
-                model="text-embedding-ada-002",
-                input=text
+                model=model or "text-embedding-ada-002",
+                input=batch
             )
-            return response.data[0].embedding
+            return _result(np.array([item.embedding for item in response.data]))
     except Exception as e:
         logger.error(f"OpenAI API嵌入失败: {str(e)}")
     
-    # 所有方法都失败，返回随机向量
-    logger.warning("所有嵌入方法都失败，使用随机向量")
-    return np.random.randn(1536).tolist()
+    # 所有方法都失败，返回哈希向量
+    logger.warning("所有嵌入方法都失败，使用哈希向量")
+    return _result(_fallback_embeddings(batch))
+
+
+def get_embedding(text: str, model: Optional[str] = None) -> np.ndarray:
+    """
+    获取文本的向量嵌入表示
+    
+    参数:
+        text: 输入文本
+        model: 可选的模型名称
+    
+    返回:
+        向量嵌入（1536维float32数组，需要JSON时由调用方转换）
+    """
+    return get_embeddings(text, model).astype(np.float32, copy=False)
 
 # 初始化嵌入模型
 init_embedding_model()
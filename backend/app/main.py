@@ -3,19 +3,21 @@ import logging
 import uvicorn
 from typing import Dict, Any, List, Optional
 from fastapi import FastAPI, HTTPException, Request, Depends
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 
 # 导入应用模块
 from .ai import (
-    generate_text, generate_outline, generate_chapter, 
-    polish_content, continue_content, save_novel_element,
+    generate_text, generate_text_stream, generate_outline, generate_chapter, 
+    generate_chapter_stream, polish_content, polish_content_stream,
+    continue_content, save_novel_element,
     get_novel_element, get_novel_elements_by_type, get_novel_data
 )
 from .memory import memory_store
 from .routers import style
 from app.api import knowledge_graph_api, memory_api
 from .middleware.middleware import setup_middlewares
-from .middleware.error_handler import APIException, NotFoundError, BadRequestError
+from .middleware.error_handler import APIException, NotFoundError, BadRequestError, FastJSONResponse
 from .database.db_utils import init_db_pool
 from .embeddings import init_embedding_model
 from .vector_db_init import init_vector_db, check_external_vector_db
@@ -24,6 +26,7 @@ from .config import settings
 
 # 使用统一日志配置
 from .utils.logging_utils import get_logger, configure_logging
+from .utils.streaming import SSE_MEDIA_TYPE, eloquent_wrap
 
 # 配置日志
 configure_logging(
@@ -37,14 +40,11 @@ logger = get_logger(__name__)
 from .utils.config_validator import validate_config
 
 # 导入应用状态管理模块
-from .utils.app_state import get_app_state, ServiceStatus
+from .utils.app_state import app_state, ServiceStatus
 
 # 导入错误处理模块
 from .utils.error_handler import register_exception_handlers
 
-# 获取应用状态实例
-app_state = get_app_state()
-
 # 在启动前验证配置
 # 如果在生产环境中，可以设置 exit_on_error 为 True
 is_valid = validate_config(exit_on_error=settings.strict_config_validation)
@@ -54,6 +54,7 @@ if not is_valid:
 # 创建 FastAPI 应用
 app = FastAPI(
     title="NovelForge API",
+    default_response_class=FastJSONResponse,
     description="小说创作辅助AI API",
     version="0.1.0",
     docs_url="/api/docs",
@@ -153,6 +154,14 @@ async def shutdown_event():
     logger.info("应用关闭中...")
     app_state.status = ServiceStatus.STOPPING
     
+    # 写入尚未落库的版本历史
+    try:
+        from .memory import history_writer
+        history_writer.flush()
+        logger.info("版本历史已全部写入")
+    except Exception as e:
+        logger.error(f"写入版本历史时出错: {e}")
+    
     # 关闭数据库连接
     try:
         from .database.db_utils import close_db_pool
@@ -265,11 +274,21 @@ async def generate_endpoint(req: GenerateRequest):
     调用 AI 生成文本，并追加到指定 memory_id。
     """
     try:
-        result = generate_text(req.memory_id, req.prompt)
+        result = await generate_text(req.memory_id, req.prompt)
         return GenerateResponse(text=result)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/generate/stream")
+async def generate_stream_endpoint(req: GenerateRequest):
+    """
+    流式调用 AI 生成文本，生成结束后追加到指定 memory_id。
+    """
+    return StreamingResponse(
+        generate_text_stream(req.memory_id, req.prompt),
+        media_type="text/plain; charset=utf-8"
+    )
+
 @app.post("/memory", status_code=204)
 async def save_memory(req: MemoryRequest):
     """
@@ -324,6 +343,28 @@ async def generate_chapter_endpoint(req: ChapterRequest):
         return ChapterResponse(success=False, novel_id=req.novel_id, chapter_id=req.chapter_id, error=str(e))
 
 
+@app.post("/api/chapter/generate/stream")
+async def generate_chapter_stream_endpoint(req: ChapterRequest):
+    """
+    流式生成章节内容，生成结束后保存。
+    """
+    return StreamingResponse(
+        generate_chapter_stream(req.novel_id, req.chapter_id, req.style.dict() if req.style else None),
+        media_type="text/plain; charset=utf-8"
+    )
+
+
+@app.post("/api/chapter/generate/sse")
+async def generate_chapter_sse_endpoint(req: ChapterRequest):
+    """
+    以SSE事件流生成章节内容，每个事件携带最近若干片段，丢失个别事件不影响渲染。
+    """
+    return StreamingResponse(
+        eloquent_wrap(generate_chapter_stream(req.novel_id, req.chapter_id, req.style.dict() if req.style else None)),
+        media_type=SSE_MEDIA_TYPE
+    )
+
+
 # 内容优化接口
 @app.post("/api/chapter/polish", response_model=ChapterResponse)
 async def polish_chapter_endpoint(req: ContentRequest):
@@ -343,6 +384,17 @@ async def polish_chapter_endpoint(req: ContentRequest):
         return ChapterResponse(success=False, novel_id=req.novel_id, chapter_id=req.chapter_id, error=str(e))
 
 
+@app.post("/api/chapter/polish/stream")
+async def polish_chapter_stream_endpoint(req: ContentRequest):
+    """
+    流式优化章节内容，优化结束后保存。
+    """
+    return StreamingResponse(
+        polish_content_stream(req.novel_id, req.chapter_id, req.content, req.style.dict() if req.style else None),
+        media_type="text/plain; charset=utf-8"
+    )
+
+
 # 续写接口
 @app.post("/api/chapter/continue", response_model=ChapterResponse)
 async def continue_chapter_endpoint(req: ContentRequest):
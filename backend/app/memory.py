@@ -1,74 +1,310 @@
 import os
+import time
+import atexit
+import zlib
+import queue
 import logging
-from typing import Dict, Any, List, Optional
+import threading
+from typing import Dict, Any, List, Optional, Tuple
 
-from psycopg2.extras import Json, RealDictCursor
+import psycopg2
+from psycopg2.extras import RealDictCursor, execute_values
 
 # 导入统一的数据库连接管理
 from .database.db_utils import (
     get_db_connection, release_db_connection, execute_query, 
-    db_transaction, retry_on_error
+    db_transaction, retry_on_error, OJson
 )
 
-# 配置日志
-logging.basicConfig(level=logging.INFO)
+# 日志配置由应用入口统一完成，这里只获取记录器
 logger = logging.getLogger(__name__)
 
+# 尝试导入zstd，不可用时退回标准库zlib
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    logger.warning("zstandard库未安装，版本历史将使用zlib压缩")
+    ZSTD_AVAILABLE = False
+
+# 每隔多少个版本保存一次完整快照，其余版本只保存追加的增量
+VERSION_SNAPSHOT_INTERVAL = 50
+
+
+# 数据库表结构，作为一条多语句SQL一次性发送；只包含幂等的CREATE ... IF NOT EXISTS，
+# 旧表结构的升级见 migrations/versions/008_legacy_store_upgrade.py
+# 开头的事务级咨询锁让多个进程同时启动时依次执行DDL，避免争抢系统表锁
+SCHEMA_SQL = """
+SELECT pg_advisory_xact_lock(hashtext('novel_forge_init_db'));
+
+-- 存储文本内容的表
+CREATE TABLE IF NOT EXISTS memories (
+    memory_id VARCHAR(255) PRIMARY KEY,
+    text TEXT NOT NULL DEFAULT '',       -- 基础文本，追加内容存放在memory_chunks
+    version INT NOT NULL DEFAULT 1,      -- 当前版本号，用于分配version_history的版本
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- 追加写入的文本分块表，避免每次追加都读写整段文本
+CREATE TABLE IF NOT EXISTS memory_chunks (
+    memory_id VARCHAR(255) NOT NULL,
+    seq BIGSERIAL,
+    text TEXT NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (memory_id, seq)
+);
+
+-- 存储小说结构化数据的表
+CREATE TABLE IF NOT EXISTS novel_elements (
+    id SERIAL PRIMARY KEY,
+    novel_id VARCHAR(255) NOT NULL,
+    element_type VARCHAR(50) NOT NULL,  -- character, location, item, outline, chapter
+    element_id VARCHAR(255) NOT NULL,    -- 如character_1, location_2等
+    data JSONB NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE(novel_id, element_type, element_id)
+);
+
+-- 存储LangGraph状态的表
+-- 状态是可重建的检查点，使用UNLOGGED表跳过WAL以提升写入吞吐；
+-- 代价是数据库崩溃后表会被清空，工作流需从头开始
+CREATE UNLOGGED TABLE IF NOT EXISTS graph_states (
+    thread_id VARCHAR(255) PRIMARY KEY,
+    state JSONB NOT NULL,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+-- 版本历史表
+CREATE TABLE IF NOT EXISTS version_history (
+    id SERIAL PRIMARY KEY,
+    memory_id VARCHAR(255) NOT NULL,
+    version INT NOT NULL,
+    kind VARCHAR(10) NOT NULL DEFAULT 'full',   -- full: 完整快照, append: 相对上一版本的追加内容
+    codec VARCHAR(10) NOT NULL DEFAULT 'none',  -- zstd, zlib, none(旧数据，内容在text列)
+    data BYTEA,
+    text TEXT,
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    UNIQUE(memory_id, version)
+);
+"""
+
+
+_db_initialized = False
+_init_db_lock = threading.Lock()
+
 
 def init_db():
-    """初始化数据库表结构"""
-    try:
-        with db_transaction() as (conn, cursor):
-            # 创建存储文本内容的表
-            cursor.execute("""
-            CREATE TABLE IF NOT EXISTS memories (
-                memory_id VARCHAR(255) PRIMARY KEY,
-                text TEXT NOT NULL,
-                created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
-            );
-            """)
-            
-            # 创建存储小说结构化数据的表
-            cursor.execute("""
-            CREATE TABLE IF NOT EXISTS novel_elements (
-                id SERIAL PRIMARY KEY,
-                novel_id VARCHAR(255) NOT NULL,
-                element_type VARCHAR(50) NOT NULL,  -- character, location, item, outline, chapter
-                element_id VARCHAR(255) NOT NULL,    -- 如character_1, location_2等
-                data JSONB NOT NULL,
-                created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(novel_id, element_type, element_id)
-            );
-            """)
-            
-            # 创建存储LangGraph状态的表
-            cursor.execute("""
-            CREATE TABLE IF NOT EXISTS graph_states (
-                thread_id VARCHAR(255) PRIMARY KEY,
-                state JSONB NOT NULL,
-                created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
-            );
-            """)
-            
-            # 创建版本历史表
-            cursor.execute("""
-            CREATE TABLE IF NOT EXISTS version_history (
-                id SERIAL PRIMARY KEY,
-                memory_id VARCHAR(255) NOT NULL,
-                version INT NOT NULL,
-                text TEXT NOT NULL,
-                created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
-                UNIQUE(memory_id, version)
-            );
-            """)
+    """初始化数据库表结构，每个进程只执行一次"""
+    global _db_initialized
+    with _init_db_lock:
+        if _db_initialized:
+            return
+        try:
+            with db_transaction() as (conn, cursor):
+                cursor.execute(SCHEMA_SQL)
+                
+                logger.info("数据库表初始化完成")
+        except Exception as e:
+            logger.error("初始化数据库失败: %s", e)
+            raise
+        _db_initialized = True
+
+
+# 在数据库端拼接完整文本：基础文本 + 按序号聚合的追加分块
+FULL_TEXT_SQL = """
+SELECT m.text || COALESCE(string_agg(c.text, '' ORDER BY c.seq), '') AS text
+FROM memories m
+LEFT JOIN memory_chunks c ON c.memory_id = m.memory_id
+WHERE m.memory_id = %s
+GROUP BY m.memory_id, m.text
+"""
+
+
+def compress_text(text: str) -> Tuple[str, bytes]:
+    """压缩版本文本，返回(编码方式, 压缩后的字节)"""
+    raw = text.encode("utf-8")
+    if ZSTD_AVAILABLE:
+        return "zstd", zstandard.ZstdCompressor(level=3).compress(raw)
+    return "zlib", zlib.compress(raw, 6)
+
+
+def decompress_text(codec: str, data: Optional[bytes], text: Optional[str] = None) -> str:
+    """解压版本文本，旧数据(codec为none)直接返回text列"""
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().decompress(bytes(data)).decode("utf-8")
+    if codec == "zlib":
+        return zlib.decompress(bytes(data)).decode("utf-8")
+    return text or ""
+
+
+def _insert_version(cursor, memory_id: str, version: int, kind: str, text: str):
+    """写入一条压缩后的版本记录"""
+    codec, data = compress_text(text)
+    cursor.execute(
+        """INSERT INTO version_history (memory_id, version, kind, codec, data)
+           VALUES (%s, %s, %s, %s, %s)""",
+        (memory_id, version, kind, codec, psycopg2.Binary(data))
+    )
+
+
+def _rebuild_versions(rows: List[Dict[str, Any]]) -> Dict[int, str]:
+    """
+    按版本号升序回放快照与增量，得到每个版本的完整文本
+    
+    增量只能接在上一个版本之后回放：版本号不连续（中间的记录写入失败）时，
+    到下一个完整快照之前的增量都无法还原，不出现在结果中
+    
+    参数:
+        rows: 按版本号升序排列的版本记录
+    
+    返回:
+        版本号 -> 完整文本
+    """
+    texts = {}
+    current = None
+    previous = None
+    for row in rows:
+        content = decompress_text(row['codec'], row['data'], row['text'])
+        if row['kind'] == 'full':
+            current = content
+        elif current is not None and row['version'] == previous + 1:
+            current += content
+        else:
+            if current is not None:
+                logger.warning("版本 %d 之前的版本记录缺失，到下一个完整快照之前的版本无法还原", row['version'])
+            current = None
+        previous = row['version']
+        if current is not None:
+            texts[row['version']] = current
+    return texts
+
+
+class BatchWriter:
+    """后台批量写入器基类
+    
+    记录只放入队列，由后台线程按数量或时间凑批后调用_write()写入，
+    把数据库写入移出请求路径
+    """
+    
+    # 后台线程名称和日志中的记录类别，由子类覆盖
+    thread_name = "batch-writer"
+    label = "记录"
+    
+    def __init__(self, batch_size: int = 500, flush_interval: float = 0.2):
+        """
+        参数:
+            batch_size: 单批最多写入的记录数
+            flush_interval: 凑批的最长等待时间（秒）
+        """
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+    
+    def _put(self, item):
+        """放入一条待写入的记录"""
+        self._ensure_started()
+        self._queue.put(item)
+    
+    def flush(self):
+        """阻塞直到队列中的记录全部写入（读取前和关闭时调用）"""
+        # 后台线程自身写入时可能经过同样的读写路径，不能等待自己
+        if self._thread is not None and threading.current_thread() is not self._thread:
+            self._queue.join()
+    
+    def _ensure_started(self):
+        """首次使用时启动后台线程"""
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(
+                        target=self._drain, name=self.thread_name, daemon=True
+                    )
+                    self._thread.start()
+    
+    def _drain(self):
+        """后台线程：按数量或时间凑批后写入"""
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
             
-            logger.info("数据库表初始化完成")
-    except Exception as e:
-        logger.error(f"初始化数据库失败: {e}")
-        raise
+            try:
+                self._write(batch)
+            except Exception as e:
+                self._on_failure(batch, e)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+    
+    def _write(self, batch: list):
+        """写入一批记录"""
+        raise NotImplementedError()
+    
+    def _on_failure(self, batch: list, error: Exception):
+        """一批记录重试后仍写入失败时调用，子类可覆盖以补救"""
+        logger.error("批量写入%s失败，丢失 %d 条记录: %s", self.label, len(batch), error)
+
+
+class VersionHistoryWriter(BatchWriter):
+    """版本历史异步批量写入器
+    
+    add()只负责把版本记录放入队列，由后台线程压缩并批量写入，
+    把version_history的插入移出请求路径
+    """
+    
+    thread_name = "version-history-writer"
+    label = "版本历史"
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # 版本记录写入失败、增量链已断开的内存，下次写入时保存完整快照
+        self._needs_snapshot = set()
+        self._snapshot_lock = threading.Lock()
+    
+    def needs_snapshot(self, memory_id: str) -> bool:
+        """该内存的下一个版本是否需要保存完整快照"""
+        with self._snapshot_lock:
+            return memory_id in self._needs_snapshot
+    
+    def put(self, memory_id: str, version: int, kind: str, text: str):
+        """放入一条待写入的版本记录"""
+        if kind == 'full':
+            with self._snapshot_lock:
+                self._needs_snapshot.discard(memory_id)
+        self._put((memory_id, version, kind, text))
+    
+    def _on_failure(self, batch: List[Tuple[str, int, str, str]], error: Exception):
+        """丢失的版本之后的增量无法回放，让相关内存的下一个版本保存完整快照"""
+        super()._on_failure(batch, error)
+        with self._snapshot_lock:
+            self._needs_snapshot.update(memory_id for memory_id, _, _, _ in batch)
+    
+    @retry_on_error(max_retries=3)
+    def _write(self, batch: List[Tuple[str, int, str, str]]):
+        """压缩并用一条INSERT写入整批版本记录"""
+        rows = []
+        for memory_id, version, kind, text in batch:
+            codec, data = compress_text(text)
+            rows.append((memory_id, version, kind, codec, psycopg2.Binary(data)))
+        
+        with db_transaction() as (conn, cursor):
+            execute_values(
+                cursor,
+                "INSERT INTO version_history (memory_id, version, kind, codec, data) VALUES %s",
+                rows
+            )
 
 
 class BaseMemoryStore:
@@ -94,112 +330,151 @@ class PostgresMemoryStore(BaseMemoryStore):
     def get(self, memory_id: str) -> str:
         """获取内存内容"""
         try:
-            query = "SELECT text FROM memories WHERE memory_id = %s"
-            result = execute_query(query, (memory_id,))
-            row = result.fetchone()
-            return row[0] if row else ""
+            generation_writer.flush()
+            success, rows = execute_query(FULL_TEXT_SQL, (memory_id,))
+            return rows[0]['text'] if success and rows else ""
         except Exception as e:
-            logger.error(f"获取内存失败: {e}")
+            logger.error("获取内存失败: %s", e)
             return ""
     
     @retry_on_error(max_retries=3)
     def add(self, memory_id: str, text: str):
-        """添加或更新内存内容"""
+        """追加内存内容（只写入新增部分，不回读整段文本）"""
         try:
+            # 先写完排队中的追加，保证同一内存的内容按调用顺序追加
+            generation_writer.flush()
             with db_transaction() as (conn, cursor):
-                # 先检查是否存在
+                # 快速路径：大多数调用是新建内存，直接插入，冲突时不做任何操作
                 cursor.execute(
-                    "SELECT text FROM memories WHERE memory_id = %s",
-                    (memory_id,)
+                    """INSERT INTO memories (memory_id, text)
+                       VALUES (%s, %s)
+                       ON CONFLICT (memory_id) DO NOTHING
+                       RETURNING version""",
+                    (memory_id, text)
                 )
                 result = cursor.fetchone()
                 
                 if result:
-                    # 存在则更新
-                    prev_text = result[0]
-                    new_text = prev_text + text
-                    cursor.execute(
-                        """UPDATE memories 
-                           SET text = %s, updated_at = CURRENT_TIMESTAMP 
-                           WHERE memory_id = %s""",
-                        (new_text, memory_id)
-                    )
-                    # 添加版本历史
-                    cursor.execute(
-                        """INSERT INTO version_history (memory_id, version, text)
-                           VALUES (%s, (SELECT COUNT(*) FROM version_history WHERE memory_id = %s) + 1, %s)""",
-                        (memory_id, memory_id, new_text)
-                    )
+                    # 新建成功，即初始版本
+                    version, kind, version_text = result['version'], 'full', text
                 else:
-                    # 不存在则插入
+                    # 已存在则追加分块，并在同一条语句中分配新版本号
                     cursor.execute(
-                        """INSERT INTO memories (memory_id, text)
-                           VALUES (%s, %s)""",
-                        (memory_id, text)
-                    )
-                    # 添加初始版本
-                    cursor.execute(
-                        """INSERT INTO version_history (memory_id, version, text)
-                           VALUES (%s, 1, %s)""",
-                        (memory_id, text)
+                        """WITH chunk AS (
+                               INSERT INTO memory_chunks (memory_id, text)
+                               VALUES (%s, %s)
+                           )
+                           UPDATE memories 
+                           SET version = version + 1, updated_at = CURRENT_TIMESTAMP 
+                           WHERE memory_id = %s
+                           RETURNING version""",
+                        (memory_id, text, memory_id)
                     )
+                    version = cursor.fetchone()['version']
+                    # 定期保存完整快照，其余只保存本次追加的增量；之前的版本记录写入失败时也保存快照
+                    if version % VERSION_SNAPSHOT_INTERVAL == 1 or history_writer.needs_snapshot(memory_id):
+                        cursor.execute(FULL_TEXT_SQL, (memory_id,))
+                        kind, version_text = 'full', cursor.fetchone()['text']
+                    else:
+                        kind, version_text = 'append', text
+            
+            # 事务提交后再交给后台线程写入版本历史
+            history_writer.put(memory_id, version, kind, version_text)
         except Exception as e:
-            logger.error(f"添加内存失败: {e}")
+            logger.error("添加内存失败: %s", e)
             raise
     
     @retry_on_error(max_retries=3)
     def get_version_history(self, memory_id: str) -> List[Dict[str, Any]]:
         """获取内存版本历史"""
         try:
+            generation_writer.flush()
+            history_writer.flush()
             query = """
-            SELECT version, text, created_at 
+            SELECT version, kind, codec, data, text, created_at 
             FROM version_history 
             WHERE memory_id = %s 
-            ORDER BY version DESC
+            ORDER BY version
             """
-            result = execute_query(query, (memory_id,), cursor_factory=RealDictCursor)
-            return result.fetchall() if result else []
+            success, rows = execute_query(query, (memory_id,), cursor_factory=RealDictCursor)
+            if not success or not rows:
+                return []
+            texts = _rebuild_versions(rows)
+            return [
+                {"version": row['version'], "text": texts[row['version']], "created_at": row['created_at']}
+                for row in reversed(rows) if row['version'] in texts
+            ]
         except Exception as e:
-            logger.error(f"获取版本历史失败: {e}")
+            logger.error("获取版本历史失败: %s", e)
             return []
     
     @retry_on_error(max_retries=3)
     def restore_version(self, memory_id: str, version: int) -> bool:
         """恢复到指定版本"""
         try:
+            generation_writer.flush()
+            history_writer.flush()
             with db_transaction() as (conn, cursor):
-                # 获取指定版本内容
+                # 获取指定版本之前最近的完整快照及其后的增量
                 cursor.execute(
-                    "SELECT text FROM version_history WHERE memory_id = %s AND version = %s",
-                    (memory_id, version)
+                    """SELECT version, kind, codec, data, text FROM version_history
+                       WHERE memory_id = %s AND version <= %s AND version >= (
+                           SELECT MAX(version) FROM version_history
+                           WHERE memory_id = %s AND version <= %s AND kind = 'full'
+                       )
+                       ORDER BY version""",
+                    (memory_id, version, memory_id, version)
                 )
-                result = cursor.fetchone()
+                rows = cursor.fetchall()
                 
-                if not result:
+                restored_text = _rebuild_versions(rows).get(version)
+                if restored_text is None:
                     return False
                     
-                # 更新当前内容
+                # 更新当前内容，并清空已合并进基础文本的追加分块
                 cursor.execute(
                     """UPDATE memories 
-                       SET text = %s, updated_at = CURRENT_TIMESTAMP 
-                       WHERE memory_id = %s""",
-                    (result[0], memory_id)
+                       SET text = %s, version = version + 1, updated_at = CURRENT_TIMESTAMP 
+                       WHERE memory_id = %s
+                       RETURNING version""",
+                    (restored_text, memory_id)
                 )
-                
-                # 添加新版本（恢复操作也会生成新版本）
+                new_version = cursor.fetchone()['version']
                 cursor.execute(
-                    """INSERT INTO version_history (memory_id, version, text)
-                       VALUES (%s, (SELECT COUNT(*) FROM version_history WHERE memory_id = %s) + 1, %s)""",
-                    (memory_id, memory_id, result[0])
+                    "DELETE FROM memory_chunks WHERE memory_id = %s",
+                    (memory_id,)
                 )
                 
+                # 添加新版本（恢复操作也会生成新版本）
+                _insert_version(cursor, memory_id, new_version, 'full', restored_text)
+                
                 return True
                 
         except Exception as e:
-            logger.error(f"恢复版本失败: {e}")
+            logger.error("恢复版本失败: %s", e)
             return False
 
 
+# 元素类型到get_novel_data返回结构中列表字段的映射（outline单独处理）
+ELEMENT_LIST_KEYS = {
+    'character': 'characters',
+    'location': 'locations',
+    'item': 'items',
+    'chapter': 'chapters',
+}
+
+
+def _empty_novel_data() -> Dict[str, Any]:
+    """get_novel_data的空结果"""
+    return {
+        "characters": [],
+        "locations": [],
+        "items": [],
+        "outline": None,
+        "chapters": []
+    }
+
+
 class NovelElementStore:
     """小说元素存储（角色、地点、物品、大纲等）"""
     
@@ -212,7 +487,8 @@ class NovelElementStore:
         """保存小说元素"""
         conn = None
         try:
-            conn = get_connection()
+            generation_writer.flush()
+            conn = get_db_connection()
             cursor = conn.cursor()
             
             cursor.execute(
@@ -220,7 +496,7 @@ class NovelElementStore:
                    VALUES (%s, %s, %s, %s)
                    ON CONFLICT (novel_id, element_type, element_id)
                    DO UPDATE SET data = %s, updated_at = CURRENT_TIMESTAMP""",
-                (novel_id, element_type, element_id, Json(data), Json(data))
+                (novel_id, element_type, element_id, OJson(data), OJson(data))
             )
             
             conn.commit()
@@ -228,17 +504,46 @@ class NovelElementStore:
         except Exception as e:
             if conn:
                 conn.rollback()
-            logger.error(f"保存元素失败: {e}")
+            logger.error("保存元素失败: %s", e)
             return False
         finally:
             if conn:
-                release_connection(conn)
+                release_db_connection(conn)
+    
+    @retry_on_error(max_retries=3)
+    def save_elements(self, elements: List[Tuple[str, str, str, Dict[str, Any]]]) -> bool:
+        """
+        用一条UPSERT批量保存小说元素
+        
+        参数:
+            elements: (novel_id, element_type, element_id, data) 列表，同一元素出现多次时以最后一次为准
+        
+        返回:
+            是否保存成功
+        """
+        # 同一条INSERT ... ON CONFLICT 不能两次更新同一行，先按键去重
+        latest = {element[:3]: element[3] for element in elements}
+        try:
+            with db_transaction() as (conn, cursor):
+                execute_values(
+                    cursor,
+                    """INSERT INTO novel_elements (novel_id, element_type, element_id, data)
+                       VALUES %s
+                       ON CONFLICT (novel_id, element_type, element_id)
+                       DO UPDATE SET data = EXCLUDED.data, updated_at = CURRENT_TIMESTAMP""",
+                    [(*key, OJson(data)) for key, data in latest.items()]
+                )
+            return True
+        except Exception as e:
+            logger.error("批量保存元素失败: %s", e)
+            return False
     
     def get_element(self, novel_id: str, element_type: str, element_id: str) -> Optional[Dict[str, Any]]:
         """获取小说元素"""
         conn = None
         try:
-            conn = get_connection()
+            generation_writer.flush()
+            conn = get_db_connection()
             cursor = conn.cursor(cursor_factory=RealDictCursor)
             
             cursor.execute(
@@ -250,17 +555,18 @@ class NovelElementStore:
             result = cursor.fetchone()
             return result['data'] if result else None
         except Exception as e:
-            logger.error(f"获取元素失败: {e}")
+            logger.error("获取元素失败: %s", e)
             return None
         finally:
             if conn:
-                release_connection(conn)
+                release_db_connection(conn)
     
     def get_elements_by_type(self, novel_id: str, element_type: str) -> List[Dict[str, Any]]:
         """获取指定类型的所有元素"""
         conn = None
         try:
-            conn = get_connection()
+            generation_writer.flush()
+            conn = get_db_connection()
             cursor = conn.cursor(cursor_factory=RealDictCursor)
             
             cursor.execute(
@@ -273,17 +579,17 @@ class NovelElementStore:
             results = cursor.fetchall()
             return [item['data'] for item in results] if results else []
         except Exception as e:
-            logger.error(f"获取元素列表失败: {e}")
+            logger.error("获取元素列表失败: %s", e)
             return []
         finally:
             if conn:
-                release_connection(conn)
+                release_db_connection(conn)
     
     def delete_element(self, novel_id: str, element_type: str, element_id: str) -> bool:
         """删除小说元素"""
         conn = None
         try:
-            conn = get_connection()
+            conn = get_db_connection()
             cursor = conn.cursor()
             
             cursor.execute(
@@ -297,18 +603,20 @@ class NovelElementStore:
         except Exception as e:
             if conn:
                 conn.rollback()
-            logger.error(f"删除元素失败: {e}")
+            logger.error("删除元素失败: %s", e)
             return False
         finally:
             if conn:
-                release_connection(conn)
+                release_db_connection(conn)
     
     def get_novel_data(self, novel_id: str) -> Dict[str, Any]:
         """获取小说的所有数据"""
         conn = None
         try:
-            conn = get_connection()
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
+            generation_writer.flush()
+            conn = get_db_connection()
+            # 使用普通元组游标，避免每行分配一个字典
+            cursor = conn.cursor()
             
             # 获取所有元素
             cursor.execute(
@@ -321,39 +629,96 @@ class NovelElementStore:
             results = cursor.fetchall()
             
             # 组织数据结构
-            novel_data = {
-                "characters": [],
-                "locations": [],
-                "items": [],
-                "outline": None,
-                "chapters": []
-            }
+            novel_data = _empty_novel_data()
             
-            for item in results:
-                if item['element_type'] == 'character':
-                    novel_data['characters'].append(item['data'])
-                elif item['element_type'] == 'location':
-                    novel_data['locations'].append(item['data'])
-                elif item['element_type'] == 'item':
-                    novel_data['items'].append(item['data'])
-                elif item['element_type'] == 'outline':
-                    novel_data['outline'] = item['data']
-                elif item['element_type'] == 'chapter':
-                    novel_data['chapters'].append(item['data'])
+            for element_type, _, data in results:
+                if element_type == 'outline':
+                    novel_data['outline'] = data
+                else:
+                    key = ELEMENT_LIST_KEYS.get(element_type)
+                    if key:
+                        novel_data[key].append(data)
             
             return novel_data
         except Exception as e:
-            logger.error(f"获取小说数据失败: {e}")
-            return {
-                "characters": [],
-                "locations": [],
-                "items": [],
-                "outline": None,
-                "chapters": []
-            }
+            logger.error("获取小说数据失败: %s", e)
+            return _empty_novel_data()
         finally:
             if conn:
-                release_connection(conn)
+                release_db_connection(conn)
+
+
+class GenerationWriter(BatchWriter):
+    """生成结果异步写入器
+    
+    章节生成、润色、续写得到的正文和章节元数据放入队列后立即返回，
+    由后台线程在短时间窗口内凑批写入：正文按放入顺序追加，元素合并为一条UPSERT；
+    写入失败的记录按键登记，调用方通过pop_failures()得知生成结果没有保存
+    """
+    
+    thread_name = "generation-writer"
+    label = "生成结果"
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # 键 -> 写入失败的错误信息
+        self._failures = {}
+        self._failures_lock = threading.Lock()
+    
+    @staticmethod
+    def element_key(novel_id: str, element_type: str, element_id: str) -> str:
+        """小说元素在失败登记中的键"""
+        return f"{novel_id}:{element_type}:{element_id}"
+    
+    def put_memory(self, memory_id: str, text: str):
+        """放入一条待追加的内存内容，失败登记的键为memory_id"""
+        self._put(("memory", (memory_id, text)))
+    
+    def put_element(self, novel_id: str, element_type: str, element_id: str, data: Dict[str, Any]):
+        """放入一个待保存的小说元素，失败登记的键见element_key()"""
+        self._put(("element", (novel_id, element_type, element_id, data)))
+    
+    def pop_failures(self, *keys: str) -> List[str]:
+        """
+        等待队列中的记录写完，取出并清除这些键的写入失败信息
+        
+        参数:
+            keys: put_memory的memory_id或element_key()
+        
+        返回:
+            错误信息列表，全部写入成功时为空
+        """
+        self.flush()
+        with self._failures_lock:
+            return [self._failures.pop(key) for key in keys if key in self._failures]
+    
+    def _fail(self, key: str, error: Any):
+        """登记一个写入失败的键"""
+        with self._failures_lock:
+            self._failures[key] = str(error)
+    
+    def _write(self, batch: List[Tuple[str, tuple]]):
+        """按顺序追加内存内容，再批量保存元素"""
+        elements = []
+        for kind, args in batch:
+            if kind == "element":
+                elements.append(args)
+                continue
+            try:
+                memory_store.add(*args)
+            except Exception as e:
+                logger.error("写入生成内容 %s 失败: %s", args[0], e)
+                self._fail(args[0], e)
+        
+        if elements and not element_store.save_elements(elements):
+            for element in elements:
+                self._fail(self.element_key(*element[:3]), "批量保存元素失败")
+    
+    def _on_failure(self, batch: List[Tuple[str, tuple]], error: Exception):
+        """整批写入意外失败时，登记批中的所有键"""
+        super()._on_failure(batch, error)
+        for kind, args in batch:
+            self._fail(args[0] if kind == "memory" else self.element_key(*args[:3]), error)
 
 
 class LangGraphStateStore:
@@ -368,7 +733,7 @@ class LangGraphStateStore:
         """保存LangGraph状态"""
         conn = None
         try:
-            conn = get_connection()
+            conn = get_db_connection()
             cursor = conn.cursor()
             
             cursor.execute(
@@ -376,7 +741,7 @@ class LangGraphStateStore:
                    VALUES (%s, %s)
                    ON CONFLICT (thread_id)
                    DO UPDATE SET state = %s, updated_at = CURRENT_TIMESTAMP""",
-                (thread_id, Json(state), Json(state))
+                (thread_id, OJson(state), OJson(state))
             )
             
             conn.commit()
@@ -384,17 +749,17 @@ class LangGraphStateStore:
         except Exception as e:
             if conn:
                 conn.rollback()
-            logger.error(f"保存状态失败: {e}")
+            logger.error("保存状态失败: %s", e)
             return False
         finally:
             if conn:
-                release_connection(conn)
+                release_db_connection(conn)
     
     def load_state(self, thread_id: str) -> Optional[Dict[str, Any]]:
         """加载LangGraph状态"""
         conn = None
         try:
-            conn = get_connection()
+            conn = get_db_connection()
             cursor = conn.cursor(cursor_factory=RealDictCursor)
             
             cursor.execute(
@@ -405,17 +770,17 @@ class LangGraphStateStore:
             result = cursor.fetchone()
             return result['state'] if result else None
         except Exception as e:
-            logger.error(f"加载状态失败: {e}")
+            logger.error("加载状态失败: %s", e)
             return None
         finally:
             if conn:
-                release_connection(conn)
+                release_db_connection(conn)
     
     def delete_state(self, thread_id: str) -> bool:
         """删除LangGraph状态"""
         conn = None
         try:
-            conn = get_connection()
+            conn = get_db_connection()
             cursor = conn.cursor()
             
             cursor.execute(
@@ -428,20 +793,26 @@ class LangGraphStateStore:
         except Exception as e:
             if conn:
                 conn.rollback()
-            logger.error(f"删除状态失败: {e}")
+            logger.error("删除状态失败: %s", e)
             return False
         finally:
             if conn:
-                release_connection(conn)
+                release_db_connection(conn)
 
 
 # 创建存储实例
+history_writer = VersionHistoryWriter()
+generation_writer = GenerationWriter(flush_interval=0.05)
 memory_store = PostgresMemoryStore()
 element_store = NovelElementStore()
 graph_store = LangGraphStateStore()
 
+# 正常退出时写完队列中的记录；生成结果的写入会产生版本历史，需先于版本历史完成
+atexit.register(history_writer.flush)
+atexit.register(generation_writer.flush)
+
 # 确保应用启动时初始化数据库
 try:
     init_db()
 except Exception as e:
-    logger.error(f"数据库初始化失败，应用可能无法正常工作: {e}")
+    logger.error("数据库初始化失败，应用可能无法正常工作: %s", e)
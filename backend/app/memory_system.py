@@ -3,10 +3,17 @@
 基于PostgreSQL + 向量数据库设计
 """
 import os
+import atexit
 import logging
 import json
 import time
-from datetime import datetime
+import hashlib
+import itertools
+import re
+import threading
+from operator import itemgetter
+from collections import OrderedDict, defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, wait
 from typing import Dict, Any, List, Optional, Tuple, Union
 
 import numpy as np
@@ -18,36 +25,210 @@ from psycopg2.pool import SimpleConnectionPool
 from .memory import memory_store, element_store, graph_store
 from .database.db_utils import (
     execute_query, get_db_connection, release_db_connection,
-    save_memory_entry, get_memory_entries, save_vector_memory,
+    save_memory_entry, save_memory_entries, get_memory_entries, save_vector_memory,
     search_related_memories, save_novel_element, get_novel_element,
-    get_novel_elements_by_type, save_version_history, get_version_history
+    get_novel_elements_by_type, save_version_history, get_version_history,
+    save_relationships, get_relationships_for_node, import_legacy_relationships
 )
-from .embeddings import get_embedding
+from .embeddings import get_embedding, fallback_embedding
 
-# 配置日志
-logging.basicConfig(level=logging.INFO)
+# 日志配置由应用入口统一完成，这里只获取记录器
 logger = logging.getLogger(__name__)
 
+# 尝试导入Aho-Corasick多模式匹配
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    logger.warning("pyahocorasick未安装，角色名匹配将使用正则表达式")
+    AHOCORASICK_AVAILABLE = False
+
 # 使用统一的嵌入函数，减少代码冗余
 from .embeddings import get_embeddings as get_embedding_vector
 
-def get_embedding(text: str) -> List[float]:
+# 上下文每行的格式化模板，模块加载时绑定format方法，避免逐行解析f-string
+MEMORY_LINE = "- {}: {}\n".format
+RELATIONSHIP_LINE = "- ({}:{}) -[{}]-> ({}:{})\n".format
+_memory_fields = itemgetter("entry_type", "content")
+
+class EmbeddingCache:
+    """按文本SHA-256摘要缓存嵌入向量的LRU缓存，避免重复的模型前向计算"""
+    
+    def __init__(self, maxsize: int = 4096):
+        """
+        参数:
+            maxsize: 最多缓存的向量数量
+        """
+        self.maxsize = maxsize
+        self._data = OrderedDict()  # 文本摘要 -> 向量
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def key(text: str) -> bytes:
+        """计算文本的缓存键"""
+        return hashlib.sha256(text.encode("utf-8")).digest()
+    
+    def get(self, text: str) -> Optional[np.ndarray]:
+        """获取缓存的向量，未命中返回None"""
+        key = self.key(text)
+        with self._lock:
+            embedding = self._data.get(key)
+            if embedding is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return embedding
+    
+    def put(self, text: str, embedding: np.ndarray) -> None:
+        """写入向量，超出容量时淘汰最久未使用的条目"""
+        key = self.key(text)
+        with self._lock:
+            self._data[key] = embedding
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+    
+    def cache_info(self) -> Dict[str, int]:
+        """缓存统计信息，用于监控命中率"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "maxsize": self.maxsize,
+                "currsize": len(self._data)
+            }
+
+
+# 全局嵌入缓存
+embedding_cache = EmbeddingCache()
+
+class ContextCache:
+    """生成上下文的LRU + TTL缓存
+    
+    以(项目ID, 上下文开关, 查询文本摘要)为键，只有完全相同的查询才命中：
+    知识图谱部分取决于查询中出现的角色名，相近的查询也可能得到不同的上下文
+    """
+    
+    def __init__(self, maxsize: int = 2048, ttl: float = 300):
+        """
+        参数:
+            maxsize: 最多缓存的上下文数量
+            ttl: 缓存有效期（秒）
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()             # (项目ID, 开关, 查询摘要) -> (上下文, 过期时间)
+        self._by_project = defaultdict(set)    # 项目ID -> 缓存键集合
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def _key(project_id: str, flags: Tuple[bool, ...], query: str) -> Tuple:
+        return (project_id, flags, hashlib.sha256(query.encode("utf-8")).digest())
+    
+    def _remove(self, key: Tuple) -> None:
+        self._data.pop(key, None)
+        keys = self._by_project.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_project[key[0]]
+    
+    def get(self, project_id: str, flags: Tuple[bool, ...], query: str) -> Optional[str]:
+        """
+        获取缓存的上下文，未命中返回None
+        
+        参数:
+            project_id: 项目ID
+            flags: 上下文开关（短期记忆、长期记忆、知识图谱）
+            query: 查询文本
+        """
+        key = self._key(project_id, flags, query)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                context, expires_at = entry
+                if expires_at > now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return context
+                self._remove(key)
+            self.misses += 1
+            return None
+    
+    def put(self, project_id: str, flags: Tuple[bool, ...], query: str, context: str) -> None:
+        """写入上下文，超出容量时淘汰最久未使用的条目"""
+        key = self._key(project_id, flags, query)
+        with self._lock:
+            self._data[key] = (context, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            self._by_project[project_id].add(key)
+            while len(self._data) > self.maxsize:
+                self._remove(next(iter(self._data)))
+    
+    def clear_project(self, project_id: str) -> None:
+        """项目的记忆或知识图谱发生变化时清除其全部缓存"""
+        with self._lock:
+            for key in list(self._by_project.get(project_id, ())):
+                self._remove(key)
+    
+    def cache_info(self) -> Dict[str, int]:
+        """缓存统计信息，用于监控命中率"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "maxsize": self.maxsize,
+                "currsize": len(self._data)
+            }
+
+
+# 长期记忆的后台持久化线程池（向量嵌入、向量保存、版本历史）
+persist_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="memory-persist")
+atexit.register(persist_executor.shutdown)
+
+
+def get_embedding(text: str) -> np.ndarray:
     """
-    获取文本的向量嵌入表示
+    获取文本的向量嵌入表示（带LRU缓存）
     
     参数:
         text: 输入文本
     
     返回:
-        向量嵌入（向量维度由模型决定）
+        向量嵌入（float32数组，只读，向量维度由模型决定）
     """
+    cached = embedding_cache.get(text)
+    if cached is not None:
+        return cached
+    
     try:
         # 调用统一的嵌入函数
-        return get_embedding_vector(text).tolist()
+        embedding = _readonly(get_embedding_vector(text))
     except Exception as e:
-        logger.warning(f"获取嵌入向量失败: {str(e)}，使用随机向量作为替代")
-        # 备用方法：使用随机向量（仅用于测试）
-        return np.random.randn(1536).tolist()
+        logger.warning(f"获取嵌入向量失败: {str(e)}，使用哈希向量作为替代")
+        # 备用方法：使用由文本哈希生成的确定性向量（仅用于测试），不写入缓存
+        return fallback_embedding(text)
+    
+    embedding_cache.put(text, embedding)
+    return embedding
+
+
+def _readonly(embedding: np.ndarray) -> np.ndarray:
+    """转换为只读float32数组，缓存中的向量被多个调用方共享，不能被修改"""
+    embedding = np.asarray(embedding, dtype=np.float32)
+    embedding.setflags(write=False)
+    return embedding
+
+
+# 短期记忆ID：进程启动时间 + 自增序号，同一进程内保证唯一（毫秒时间戳在突发写入时会重复）
+_ID_PREFIX = f"mem_{int(time.time())}_"
+_ID_SEQ = itertools.count()
 
 
 class ShortTermMemory:
@@ -61,7 +242,7 @@ class ShortTermMemory:
             window_size: 滑动窗口大小，保留最近的N个记忆条目
         """
         self.window_size = window_size
-        self.memory_buffer = {}  # 项目ID -> 记忆列表
+        self.memory_buffer = {}  # 项目ID -> 定长记忆队列，超出窗口时自动淘汰最旧条目
     
     def add(self, project_id: str, content: str, entry_type: str = "input", 
            metadata: Optional[Dict[str, Any]] = None) -> str:
@@ -75,27 +256,28 @@ class ShortTermMemory:
             metadata: 元数据
         
         返回:
-            记忆ID
+            记忆ID，与上一条内容和类型都相同时返回上一条的ID
         """
-        # 初始化项目缓冲区（如果不存在）
-        if project_id not in self.memory_buffer:
-            self.memory_buffer[project_id] = []
-        
-        # 创建记忆条目
+        buffer = self.memory_buffer.get(project_id)
+        if buffer is None:
+            buffer = self.memory_buffer[project_id] = deque(maxlen=self.window_size)
+        elif buffer:
+            # 重试等场景会连续写入相同内容，去重以免挤出窗口内的真实历史
+            last = buffer[-1]
+            if last["entry_type"] == entry_type and last["content"] == content:
+                return last["id"]
+        
+        # 创建记忆条目（时间戳保存为epoch秒，展示时再格式化）
         memory_item = {
-            "id": f"mem_{int(time.time() * 1000)}",
+            "id": _ID_PREFIX + str(next(_ID_SEQ)),
             "content": content,
             "entry_type": entry_type,
             "metadata": metadata or {},
-            "timestamp": datetime.now().isoformat()
+            "timestamp": time.time()
         }
         
-        # 添加到缓冲区
-        self.memory_buffer[project_id].append(memory_item)
-        
-        # 如果超出窗口大小，移除最旧的条目
-        if len(self.memory_buffer[project_id]) > self.window_size:
-            self.memory_buffer[project_id].pop(0)
+        # 添加到缓冲区（deque的maxlen保证超出窗口时O(1)移除最旧的条目）
+        buffer.append(memory_item)
         
         return memory_item["id"]
     
@@ -110,13 +292,14 @@ class ShortTermMemory:
         返回:
             记忆条目列表
         """
-        if project_id not in self.memory_buffer:
+        memories = self.memory_buffer.get(project_id)
+        if memories is None:
             return []
         
-        memories = self.memory_buffer[project_id]
         if limit:
-            return memories[-limit:]
-        return memories
+            start = max(0, len(memories) - limit)
+            return list(itertools.islice(memories, start, None))
+        return list(memories)
     
     def clear(self, project_id: str) -> None:
         """
@@ -125,8 +308,9 @@ class ShortTermMemory:
         参数:
             project_id: 项目ID
         """
-        if project_id in self.memory_buffer:
-            self.memory_buffer[project_id] = []
+        memories = self.memory_buffer.get(project_id)
+        if memories is not None:
+            memories.clear()
     
     def get_formatted_context(self, project_id: str, limit: int = None) -> str:
         """
@@ -143,10 +327,9 @@ class ShortTermMemory:
         if not memories:
             return ""
         
-        formatted = "=== 最近的上下文 ===\n"
-        for memory in memories:
-            formatted += f"- {memory['entry_type']}: {memory['content']}\n"
-        return formatted
+        parts = ["=== 最近的上下文 ===\n"]
+        parts.extend(MEMORY_LINE(*_memory_fields(memory)) for memory in memories)
+        return "".join(parts)
 
 
 class LongTermMemory:
@@ -154,7 +337,9 @@ class LongTermMemory:
     
     def __init__(self):
         """初始化长期记忆系统"""
-        pass
+        self._pending = set()  # 尚未完成的后台持久化任务
+        self._pending_lock = threading.Lock()
+        self.on_persisted = None  # 后台持久化完成后的回调，参数为项目ID
     
     def add(self, project_id: str, content: str, entry_type: str, 
            metadata: Optional[Dict[str, Any]] = None) -> str:
@@ -170,29 +355,104 @@ class LongTermMemory:
         返回:
             记忆ID
         """
-        # 保存到数据库
-        success, memory_id = save_memory_entry(project_id, entry_type, content, metadata)
+        item = {"content": content, "entry_type": entry_type, "metadata": metadata}
+        return self.add_many(project_id, [item])[0]
+    
+    def add_many(self, project_id: str, items: List[Dict[str, Any]]) -> List[str]:
+        """
+        批量添加记忆条目到长期记忆
         
+        条目同步插入数据库；所有条目的向量嵌入通过一次批量编码生成，
+        与向量、版本历史的保存一起在后台线程中完成（可调用flush()等待）
+        
+        参数:
+            project_id: 项目ID
+            items: 记忆条目列表，每项包含content、entry_type和可选的metadata
+        
+        返回:
+            与items一一对应的记忆ID列表（保存失败时全部为空字符串）
+        """
+        if len(items) == 1:
+            # 单条写入走服务端预备语句，省去每次的解析和计划
+            item = items[0]
+            success, memory_id = save_memory_entry(
+                project_id, item["entry_type"], item["content"], item.get("metadata")
+            )
+            memory_ids = [memory_id] if success else memory_id
+        else:
+            # 一次往返批量保存到数据库
+            success, memory_ids = save_memory_entries(project_id, items)
         if not success:
-            logger.error(f"保存记忆条目失败: {memory_id}")
-            return ""
+            logger.error(f"保存记忆条目失败: {memory_ids}")
+            return [""] * len(items)
+        
+        saved = list(zip(memory_ids, items))
+        if not saved:
+            return memory_ids
+        
+        # 向量嵌入和后续写入交给后台线程，调用方只需等待条目插入
+        future = persist_executor.submit(self._persist, project_id, saved)
+        with self._pending_lock:
+            self._pending.add(future)
+        future.add_done_callback(self._discard_pending)
+        
+        return memory_ids
+    
+    def flush(self, timeout: Optional[float] = None) -> None:
+        """
+        等待已提交的后台持久化任务完成
+        
+        参数:
+            timeout: 最长等待时间（秒），None表示一直等待
+        """
+        with self._pending_lock:
+            pending = list(self._pending)
+        if pending:
+            wait(pending, timeout=timeout)
+    
+    def _discard_pending(self, future) -> None:
+        """后台任务完成后从待完成集合中移除"""
+        with self._pending_lock:
+            self._pending.discard(future)
+    
+    def _persist(self, project_id: str, saved: List[Tuple[str, Dict[str, Any]]]) -> None:
+        """
+        后台任务：批量生成向量嵌入并保存向量和版本历史
         
-        # 生成向量嵌入并保存
+        参数:
+            project_id: 项目ID
+            saved: (记忆ID, 记忆条目) 列表
+        """
+        # 批量生成向量嵌入并保存（只对未命中缓存的文本调用模型）
         try:
-            embedding = get_embedding(content)
-            save_vector_memory(memory_id, embedding)
+            contents = [item["content"] for _, item in saved]
+            embeddings = [embedding_cache.get(content) for content in contents]
+            missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+            if missing:
+                computed = get_embedding_vector([contents[i] for i in missing])
+                for i, embedding in zip(missing, computed):
+                    embeddings[i] = _readonly(embedding)
+                    embedding_cache.put(contents[i], embeddings[i])
+            
+            for (memory_id, _), embedding in zip(saved, embeddings):
+                save_vector_memory(memory_id, embedding)
         except Exception as e:
             logger.error(f"保存向量记忆失败: {str(e)}")
         
         # 保存版本历史
-        version_data = {
-            "content": content,
-            "entry_type": entry_type,
-            "metadata": metadata or {}
-        }
-        save_version_history(project_id, "memory", memory_id, version_data)
+        try:
+            for memory_id, item in saved:
+                version_data = {
+                    "content": item["content"],
+                    "entry_type": item["entry_type"],
+                    "metadata": item.get("metadata") or {}
+                }
+                save_version_history(project_id, "memory", memory_id, version_data)
+        except Exception as e:
+            logger.error(f"保存记忆版本历史失败: {str(e)}")
         
-        return memory_id
+        if self.on_persisted is not None:
+            self.on_persisted(project_id)
     
     def get(self, project_id: str, entry_type: Optional[str] = None, 
            limit: int = 100) -> List[Dict[str, Any]]:
@@ -258,18 +518,47 @@ class LongTermMemory:
         if not memories:
             return ""
         
-        formatted = "=== 相关记忆 ===\n"
-        for memory in memories:
-            formatted += f"- {memory['entry_type']}: {memory['content']}\n"
-        return formatted
+        parts = ["=== 相关记忆 ===\n"]
+        parts.extend(MEMORY_LINE(*_memory_fields(memory)) for memory in memories)
+        return "".join(parts)
 
 
 class KnowledgeGraph:
-    """知识图谱系统 - 构建结构化的记忆网络"""
+    """知识图谱系统 - 构建结构化的记忆网络
+    
+    节点保存在novel_elements表中，关系保存在relationships表中，
+    按节点过滤关系由数据库索引完成，不再加载整个图状态。
+    旧版本把关系保存在graph_store的图状态中，每个项目首次访问时迁移到relationships表
+    """
     
     def __init__(self):
         """初始化知识图谱系统"""
-        pass
+        self._imported = set()  # 已检查过旧版图状态的项目ID
+        self._import_lock = threading.Lock()
+    
+    def _import_legacy_relationships(self, project_id: str) -> None:
+        """
+        把graph_store图状态中的旧版关系迁移到relationships表，每个项目只迁移一次
+        
+        迁移失败时不标记为已完成，下次访问会重新迁移
+        
+        参数:
+            project_id: 项目ID
+        """
+        if project_id in self._imported:
+            return
+        
+        with self._import_lock:
+            if project_id in self._imported:
+                return
+            
+            success, count = import_legacy_relationships(project_id)
+            if not success:
+                return
+            if count:
+                logger.info(f"已把项目 {project_id} 的 {count} 条旧版知识图谱关系迁移到relationships表")
+            
+            self._imported.add(project_id)
     
     def add_node(self, project_id: str, node_type: str, node_id: str, 
                 properties: Dict[str, Any]) -> bool:
@@ -308,44 +597,49 @@ class KnowledgeGraph:
         返回:
             是否成功
         """
-        # 获取当前图状态
-        success, graph_data = graph_store.load_state(project_id)
+        return self.add_relationships(project_id, [(from_node, to_node, rel_type, properties)])
+    
+    def add_relationships(self, project_id: str, 
+                          relationships: List[Tuple[Tuple[str, str], Tuple[str, str], str, Optional[Dict[str, Any]]]]) -> bool:
+        """
+        批量添加关系，所有关系在一个事务中写入
         
-        if not success or not graph_data:
-            # 初始化图数据
-            graph_data = {
-                "nodes": {},
-                "relationships": []
-            }
+        参数:
+            project_id: 项目ID
+            relationships: (from_node, to_node, rel_type, properties) 元组列表
+        
+        返回:
+            是否成功
+        """
+        if not relationships:
+            return True
         
+        # 先迁移旧版关系，之后写入的属性不会被旧数据覆盖
+        self._import_legacy_relationships(project_id)
+        
+        # 已存在相同关系时只更新属性（ON CONFLICT）
+        success, _ = save_relationships(project_id, [
+            self._build_relationship(from_node, to_node, rel_type, properties)
+            for from_node, to_node, rel_type, properties in relationships
+        ])
+        return success
+    
+    @staticmethod
+    def _build_relationship(from_node: Tuple[str, str], to_node: Tuple[str, str], 
+                            rel_type: str, properties: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """构建关系数据"""
         # 创建关系ID
         from_type, from_id = from_node
         to_type, to_id = to_node
         rel_id = f"{from_type.lower()}_{from_id}__{rel_type}__{to_type.lower()}_{to_id}"
         
-        # 添加关系
-        relationship = {
+        return {
             "id": rel_id,
             "from_node": {"type": from_type, "id": from_id},
             "to_node": {"type": to_type, "id": to_id},
             "type": rel_type,
             "properties": properties or {}
         }
-        
-        # 检查是否已存在相同关系
-        for rel in graph_data.get("relationships", []):
-            if rel["id"] == rel_id:
-                # 更新现有关系
-                rel["properties"] = properties or {}
-                break
-        else:
-            # 添加新关系
-            if "relationships" not in graph_data:
-                graph_data["relationships"] = []
-            graph_data["relationships"].append(relationship)
-        
-        # 保存图状态
-        return graph_store.save_state(project_id, graph_data)
     
     def get_node(self, project_id: str, node_type: str, node_id: str) -> Optional[Dict[str, Any]]:
         """
@@ -393,33 +687,10 @@ class KnowledgeGraph:
         返回:
             关系列表
         """
-        # 获取当前图状态
-        success, graph_data = graph_store.load_state(project_id)
-        
-        if not success or not graph_data or "relationships" not in graph_data:
+        self._import_legacy_relationships(project_id)
+        success, relationships = get_relationships_for_node(project_id, node_type, node_id)
+        if not success:
             return []
-        
-        relationships = graph_data["relationships"]
-        
-        # 应用过滤
-        if node_type and node_id:
-            filtered = []
-            for rel in relationships:
-                from_node = rel["from_node"]
-                to_node = rel["to_node"]
-                if (from_node["type"] == node_type and from_node["id"] == node_id) or \
-                   (to_node["type"] == node_type and to_node["id"] == node_id):
-                    filtered.append(rel)
-            return filtered
-        elif node_type:
-            filtered = []
-            for rel in relationships:
-                from_node = rel["from_node"]
-                to_node = rel["to_node"]
-                if from_node["type"] == node_type or to_node["type"] == node_type:
-                    filtered.append(rel)
-            return filtered
-        
         return relationships
     
     def get_formatted_context(self, project_id: str, node_type: Optional[str] = None, 
@@ -439,13 +710,62 @@ class KnowledgeGraph:
         if not relationships:
             return ""
         
-        formatted = "=== 知识图谱关系 ===\n"
+        parts = ["=== 知识图谱关系 ===\n"]
         for rel in relationships:
             from_node = rel["from_node"]
             to_node = rel["to_node"]
-            rel_type = rel["type"]
-            formatted += f"- ({from_node['type']}:{from_node['id']}) -[{rel_type}]-> ({to_node['type']}:{to_node['id']})\n"
-        return formatted
+            parts.append(RELATIONSHIP_LINE(from_node["type"], from_node["id"], rel["type"], 
+                                           to_node["type"], to_node["id"]))
+        return "".join(parts)
+
+
+class NameMatcher:
+    """多模式名称匹配器 - 一次扫描查询文本即可找到其中出现的名称"""
+    
+    def __init__(self, names: Dict[str, str]):
+        """
+        初始化名称匹配器
+        
+        参数:
+            names: 小写名称 -> 元素ID
+        """
+        self.names = names
+        self._automaton = None
+        self._pattern = None
+        if not names:
+            return
+        if AHOCORASICK_AVAILABLE:
+            self._automaton = ahocorasick.Automaton()
+            for name, element_id in names.items():
+                self._automaton.add_word(name, (len(name), element_id))
+            self._automaton.make_automaton()
+        else:
+            # 长名称优先，避免短名称截断长名称的匹配
+            alternatives = sorted(names, key=len, reverse=True)
+            self._pattern = re.compile("|".join(re.escape(name) for name in alternatives))
+    
+    def find(self, query: str) -> Optional[str]:
+        """
+        查找查询文本中最早出现的名称（同一位置取最长的）
+        
+        参数:
+            query: 查询文本
+        
+        返回:
+            匹配名称对应的元素ID，未匹配时返回None
+        """
+        if not self.names or not query:
+            return None
+        lowered = query.lower()
+        if self._automaton is not None:
+            best = None
+            for end, (length, element_id) in self._automaton.iter(lowered):
+                key = (end - length + 1, -length)
+                if best is None or key < best[0]:
+                    best = (key, element_id)
+            return best[1] if best else None
+        match = self._pattern.search(lowered)
+        return self.names[match.group(0)] if match else None
 
 
 class MemorySystem:
@@ -456,6 +776,29 @@ class MemorySystem:
         self.short_term = ShortTermMemory()
         self.long_term = LongTermMemory()
         self.knowledge_graph = KnowledgeGraph()
+        self._character_matchers = {}  # 项目ID -> 角色名匹配器
+        self._matcher_lock = threading.Lock()
+        self.context_cache = ContextCache()
+        # 新记忆的向量在后台写入，写入完成后再清一次缓存，避免缓存到缺少新记忆的上下文
+        self.long_term.on_persisted = self.context_cache.clear_project
+    
+    def _get_character_matcher(self, project_id: str) -> NameMatcher:
+        """获取项目的角色名匹配器，首次使用时从知识图谱构建"""
+        with self._matcher_lock:
+            matcher = self._character_matchers.get(project_id)
+        if matcher is not None:
+            return matcher
+        
+        names = {}
+        for character in self.knowledge_graph.get_nodes_by_type(project_id, "Character"):
+            name = character["data"]["properties"].get("name")
+            if name:
+                # 与原先的遍历顺序一致，同名角色取第一个
+                names.setdefault(name.lower(), character["element_id"])
+        matcher = NameMatcher(names)
+        with self._matcher_lock:
+            self._character_matchers[project_id] = matcher
+        return matcher
     
     def add_memory(self, project_id: str, content: str, entry_type: str,
                   metadata: Optional[Dict[str, Any]] = None, 
@@ -480,8 +823,33 @@ class MemorySystem:
         if add_to_short_term:
             self.short_term.add(project_id, content, entry_type, metadata)
         
+        self.context_cache.clear_project(project_id)
         return memory_id
     
+    def add_memories(self, project_id: str, items: List[Dict[str, Any]],
+                    add_to_short_term: bool = True) -> List[str]:
+        """
+        批量添加记忆，适用于章节摘要、角色、事件等一次性导入
+        
+        参数:
+            project_id: 项目ID
+            items: 记忆条目列表，每项包含content、entry_type和可选的metadata
+            add_to_short_term: 是否同时添加到短期记忆
+        
+        返回:
+            记忆ID列表
+        """
+        # 添加到长期记忆
+        memory_ids = self.long_term.add_many(project_id, items)
+        
+        # 可选添加到短期记忆
+        if add_to_short_term:
+            for item in items:
+                self.short_term.add(project_id, item["content"], item["entry_type"], item.get("metadata"))
+        
+        self.context_cache.clear_project(project_id)
+        return memory_ids
+    
     def add_character(self, project_id: str, character_id: str, name: str, 
                      role: str, description: str, attributes: Dict[str, Any] = None) -> bool:
         """
@@ -507,12 +875,15 @@ class MemorySystem:
         
         # 添加到知识图谱
         success = self.knowledge_graph.add_node(project_id, "Character", character_id, properties)
+        with self._matcher_lock:
+            self._character_matchers.pop(project_id, None)
         
         # 添加到长期记忆
         if success:
             metadata = {"character_id": character_id, "name": name, "role": role}
             self.long_term.add(project_id, description, "character_state", metadata)
         
+        self.context_cache.clear_project(project_id)
         return success
     
     def add_location(self, project_id: str, location_id: str, name: str, 
@@ -544,6 +915,7 @@ class MemorySystem:
             metadata = {"location_id": location_id, "name": name}
             self.long_term.add(project_id, description, "worldbuilding", metadata)
         
+        self.context_cache.clear_project(project_id)
         return success
     
     def add_event(self, project_id: str, event_id: str, title: str, description: str,
@@ -578,22 +950,17 @@ class MemorySystem:
         # 添加关系
         if success:
             # 角色与事件的关系
-            for character_id in characters:
-                self.knowledge_graph.add_relationship(
-                    project_id,
-                    ("Character", character_id),
-                    ("Event", event_id),
-                    "PARTICIPATED_IN"
-                )
+            relationships = [
+                (("Character", character_id), ("Event", event_id), "PARTICIPATED_IN", None)
+                for character_id in characters
+            ]
             
             # 地点与事件的关系
             if location:
-                self.knowledge_graph.add_relationship(
-                    project_id,
-                    ("Event", event_id),
-                    ("Location", location),
-                    "OCCURRED_AT"
-                )
+                relationships.append((("Event", event_id), ("Location", location), "OCCURRED_AT", None))
+            
+            # 一次性写入所有关系
+            self.knowledge_graph.add_relationships(project_id, relationships)
             
             # 添加到长期记忆
             metadata = {
@@ -604,6 +971,7 @@ class MemorySystem:
             }
             self.long_term.add(project_id, description, "plot_point", metadata)
         
+        self.context_cache.clear_project(project_id)
         return success
     
     def add_rule(self, project_id: str, rule_id: str, name: str, 
@@ -635,6 +1003,7 @@ class MemorySystem:
             metadata = {"rule_id": rule_id, "name": name}
             self.long_term.add(project_id, description, "worldbuilding", metadata)
         
+        self.context_cache.clear_project(project_id)
         return success
     
     def add_chapter_summary(self, project_id: str, chapter_number: int, 
@@ -675,6 +1044,12 @@ class MemorySystem:
         返回:
             格式化的上下文字符串
         """
+        # 缓存按查询文本查找，不需要计算查询向量；只有长期记忆检索会嵌入查询
+        flags = (include_short_term, include_long_term, include_knowledge_graph)
+        context = self.context_cache.get(project_id, flags, query)
+        if context is not None:
+            return context
+        
         context_parts = []
         
         # 添加短期记忆
@@ -692,22 +1067,17 @@ class MemorySystem:
         # 添加知识图谱
         if include_knowledge_graph:
             # 从查询中提取可能的节点类型和ID（简单实现）
-            node_type = None
-            node_id = None
-            
             # 如果查询中包含角色名，尝试获取相关角色的关系
-            characters = self.knowledge_graph.get_nodes_by_type(project_id, "Character")
-            for character in characters:
-                if character["data"]["properties"]["name"].lower() in query.lower():
-                    node_type = "Character"
-                    node_id = character["element_id"]
-                    break
+            node_id = self._get_character_matcher(project_id).find(query)
+            node_type = "Character" if node_id else None
             
             graph_context = self.knowledge_graph.get_formatted_context(project_id, node_type, node_id)
             if graph_context:
                 context_parts.append(graph_context)
         
-        return "\n\n".join(context_parts)
+        context = "\n\n".join(context_parts)
+        self.context_cache.put(project_id, flags, query, context)
+        return context
 
 
 # 创建记忆系统实例
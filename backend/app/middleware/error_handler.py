@@ -4,19 +4,32 @@
 import time
 import json
 import logging
-import traceback
 from typing import Dict, Any, Callable, Awaitable, Optional, Union
 
 from fastapi import FastAPI, Request, Response
 from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
+from starlette.datastructures import Headers
 from starlette.middleware.cors import CORSMiddleware
-from pydantic import ValidationError
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from pydantic import VERSION as PYDANTIC_VERSION, ValidationError
 
-# 配置日志
-logging.basicConfig(level=logging.INFO)
+from ..utils.logging_utils import request_id_ctx
+
+# 日志配置由应用入口统一完成，这里只获取记录器
 logger = logging.getLogger(__name__)
 
+# JSON响应优先使用orjson序列化，未安装时回退到标准库json（只在导入时判断一次）
+try:
+    import orjson
+    from fastapi.responses import ORJSONResponse as FastJSONResponse
+    ORJSON_AVAILABLE = True
+except ImportError:
+    logger.warning("orjson未安装，JSON响应将使用标准库json序列化")
+    FastJSONResponse = JSONResponse
+    ORJSON_AVAILABLE = False
+
+PYDANTIC_V2 = PYDANTIC_VERSION.startswith("2.")
+
 class ErrorCode:
     """错误代码定义"""
     SUCCESS = 0
@@ -137,229 +150,230 @@ class MemoryError(APIException):
             details=details
         )
 
-class ErrorHandlerMiddleware(BaseHTTPMiddleware):
-    """错误处理中间件"""
+class _LazyHeaders:
+    """日志extra中的请求/响应头，只有在日志被格式化输出时才解码成字典"""
     
-    def __init__(self, app: FastAPI):
-        super().__init__(app)
+    __slots__ = ("raw",)
     
-    async def dispatch(
-        self, 
-        request: Request, 
-        call_next: Callable[[Request], Awaitable[Response]]
-    ) -> Response:
+    def __init__(self, raw: list):
+        self.raw = raw
+    
+    def __repr__(self) -> str:
+        return repr(dict(Headers(raw=self.raw)))
+    
+    __str__ = __repr__
+
+
+def _dumps(obj: Any) -> bytes:
+    """序列化为JSON字节串"""
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _envelope_prefix(code: int, message: str) -> bytes:
+    """预先序列化固定的错误信封，只留下details部分在请求时序列化"""
+    return (
+        b'{"success":false,"code":' + _dumps(code) +
+        b',"message":' + _dumps(message) +
+        b',"data":null,"error":{"details":'
+    )
+
+
+_VALIDATION_ERROR_PREFIX = _envelope_prefix(ErrorCode.VALIDATION_ERROR, "参数验证错误")
+_UNKNOWN_ERROR_PREFIX = _envelope_prefix(ErrorCode.UNKNOWN_ERROR, "服务器内部错误")
+_ENVELOPE_SUFFIX = b"}}"
+
+
+def _error_response(prefix: bytes, details: Any, status_code: int) -> Response:
+    """
+    拼接预序列化的错误信封和details生成错误响应
+    
+    参数:
+        prefix: _envelope_prefix生成的信封前缀
+        details: 错误详情
+        status_code: HTTP状态码
+    
+    返回:
+        Response对象
+    """
+    body = prefix + _dumps(details) + _ENVELOPE_SUFFIX
+    return Response(content=body, media_type="application/json", status_code=status_code)
+
+
+class RequestTimingMiddleware:
+    """请求计时中间件
+    
+    纯ASGI实现：不像BaseHTTPMiddleware那样为每个请求创建内存流和任务组，
+    也不构造Request对象，只在响应开始时注入处理时间和请求ID头。
+    异常不在这里处理，统一交给register_error_handlers注册的异常处理器
+    """
+    
+    def __init__(self, app: ASGIApp):
+        self.app = app
+    
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
         """
-        处理请求并捕获异常
+        处理请求并注入计时头
         
         参数:
-            request: FastAPI请求对象
-            call_next: 调用下一个中间件的函数
-        
-        返回:
-            Response对象
+            scope: ASGI连接信息
+            receive: 接收消息的可调用对象
+            send: 发送消息的可调用对象
         """
-        start_time = time.time()
-        request_id = self._get_request_id(request)
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        
+        start_time = time.perf_counter()
+        request_id = self._get_request_id(scope)
+        # 请求ID存入上下文变量，此后本请求内的所有日志都由RequestIdFilter自动带上
+        token = request_id_ctx.set(request_id)
         
         # 记录请求信息
-        self._log_request(request, request_id)
+        self._log_request(scope)
+        
+        async def send_wrapper(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                # 记录处理时间
+                process_time = time.perf_counter() - start_time
+                headers = list(message.get("headers", []))
+                headers.append((b"x-process-time", f"{process_time:.6f}".encode("latin-1")))
+                headers.append((b"x-request-id", request_id.encode("latin-1")))
+                message["headers"] = headers
+                
+                # 记录响应信息
+                self._log_response(message["status"], headers, process_time)
+            await send(message)
         
-        try:
-            # 执行请求
-            response = await call_next(request)
-            
-            # 记录处理时间
-            process_time = time.time() - start_time
-            response.headers["X-Process-Time"] = str(process_time)
-            response.headers["X-Request-ID"] = request_id
-            
-            # 记录响应信息
-            self._log_response(response, request_id, process_time)
-            
-            return response
-            
-        except ValidationError as exc:
-            # 处理验证错误
-            return self._handle_validation_error(exc, request_id)
-        except APIException as exc:
-            # 处理自定义API异常
-            return self._handle_api_exception(exc, request_id)
-        except Exception as exc:
-            # 处理未预期的异常
-            return self._handle_unexpected_error(exc, request_id)
+        await self.app(scope, receive, send_wrapper)
+        # 出现异常时不重置：外层的ServerErrorMiddleware调用异常处理器记录日志时仍需要请求ID。
+        # 每个请求运行在各自的任务上下文里，不会串到其他请求
+        request_id_ctx.reset(token)
     
-    def _get_request_id(self, request: Request) -> str:
+    def _get_request_id(self, scope: Scope) -> str:
         """获取请求ID"""
-        if "X-Request-ID" in request.headers:
-            return request.headers["X-Request-ID"]
-        return f"{time.time():.6f}"
+        # ASGI规定请求头名称已是小写字节串，直接比较即可，无需大小写折叠
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                return value.decode("latin-1")
+        # 整数纳秒时间戳，避免浮点格式化
+        return str(time.time_ns())
     
-    def _log_request(self, request: Request, request_id: str) -> None:
+    def _log_request(self, scope: Scope) -> None:
         """记录请求信息"""
+        if not logger.isEnabledFor(logging.INFO):
+            return
+        
+        client = scope.get("client")
+        client_ip = client[0] if client else None
         logger.info(
-            f"Request [{request_id}]: {request.method} {request.url.path} "
-            f"- ClientIP: {request.client.host}",
+            f"Request: {scope['method']} {scope['path']} - ClientIP: {client_ip}",
             extra={
-                "request_id": request_id,
-                "client_ip": request.client.host,
-                "method": request.method,
-                "path": request.url.path,
-                "query_params": str(request.query_params),
-                "headers": dict(request.headers)
+                "client_ip": client_ip,
+                "method": scope["method"],
+                "path": scope["path"],
+                "query_params": scope.get("query_string", b"").decode("latin-1"),
+                "headers": _LazyHeaders(scope["headers"])
             }
         )
     
-    def _log_response(self, response: Response, request_id: str, process_time: float) -> None:
+    def _log_response(self, status_code: int, headers: list, process_time: float) -> None:
         """记录响应信息"""
+        if not logger.isEnabledFor(logging.INFO):
+            return
+        
         logger.info(
-            f"Response [{request_id}]: Status {response.status_code} - Time: {process_time:.6f}s",
+            f"Response: Status {status_code} - Time: {process_time:.6f}s",
             extra={
-                "request_id": request_id,
-                "status_code": response.status_code,
+                "status_code": status_code,
                 "process_time": process_time,
-                "headers": dict(response.headers)
+                "headers": _LazyHeaders(headers)
             }
         )
+
+
+def _validation_details(exc: ValidationError) -> list:
+    """
+    提取验证错误详情，结果缓存在异常对象上
+    
+    参数:
+        exc: pydantic验证错误
     
-    def _handle_validation_error(self, exc: ValidationError, request_id: str) -> JSONResponse:
-        """处理验证错误"""
-        error_details = [
+    返回:
+        只含loc/msg/type的错误详情列表
+    """
+    details = getattr(exc, "_cached_details", None)
+    if details is None:
+        if PYDANTIC_V2:
+            # 跳过url/input/ctx字段的构建，这里用不到
+            errors = exc.errors(include_url=False, include_context=False, include_input=False)
+        else:
+            errors = exc.errors()
+        details = [
             {
                 "loc": err["loc"],
                 "msg": err["msg"],
                 "type": err["type"]
             }
-            for err in exc.errors()
+            for err in errors
         ]
-        
-        logger.warning(
-            f"Validation Error [{request_id}]: {str(exc)}",
-            extra={
-                "request_id": request_id,
-                "error_details": error_details
-            }
-        )
-        
-        return JSONResponse(
-            status_code=400,
-            content={
-                "success": False,
-                "code": ErrorCode.VALIDATION_ERROR,
-                "message": "参数验证错误",
-                "data": None,
-                "error": {
-                    "details": error_details
-                }
-            }
-        )
+        exc._cached_details = details
+    return details
+
+
+async def validation_exception_handler(request: Request, exc: ValidationError) -> Response:
+    """处理验证错误"""
+    error_details = _validation_details(exc)
     
-    def _handle_api_exception(self, exc: APIException, request_id: str) -> JSONResponse:
-        """处理自定义API异常"""
-        logger.warning(
-            f"API Exception [{request_id}]: {str(exc)}",
-            extra={
-                "request_id": request_id,
-                "error_code": exc.code,
-                "error_details": exc.details
-            }
-        )
-        
-        return JSONResponse(
-            status_code=exc.status_code,
-            content={
-                "success": False,
-                "code": exc.code,
-                "message": exc.message,
-                "data": None,
-                "error": {
-                    "details": exc.details
-                }
-            }
-        )
+    # 异常文本会再遍历一遍错误列表，交给日志系统在真正输出时再生成
+    logger.warning(
+        "Validation Error: %s", exc,
+        extra={"error_details": error_details}
+    )
     
-    def _handle_unexpected_error(self, exc: Exception, request_id: str) -> JSONResponse:
-        """处理未预期的异常"""
-        error_traceback = traceback.format_exc()
-        
-        logger.error(
-            f"Unexpected Error [{request_id}]: {str(exc)}",
-            extra={
-                "request_id": request_id,
-                "error_traceback": error_traceback
-            }
-        )
-        
-        return JSONResponse(
-            status_code=500,
-            content={
-                "success": False,
-                "code": ErrorCode.UNKNOWN_ERROR,
-                "message": "服务器内部错误",
-                "data": None,
-                "error": {
-                    "details": str(exc)
-                }
-            }
-        )
+    return _error_response(_VALIDATION_ERROR_PREFIX, error_details, 400)
 
-def register_error_handlers(app: FastAPI) -> None:
-    """注册错误处理器"""
-    app.add_middleware(ErrorHandlerMiddleware)
+
+async def api_exception_handler(request: Request, exc: APIException) -> Response:
+    """处理自定义API异常"""
+    logger.warning(
+        f"API Exception: {str(exc)}",
+        extra={
+            "error_code": exc.code,
+            "error_details": exc.details
+        }
+    )
     
-    # 可以在这里添加更多特定的错误处理器
-    @app.exception_handler(ValidationError)
-    async def validation_exception_handler(request: Request, exc: ValidationError):
-        error_details = [
-            {
-                "loc": err["loc"],
-                "msg": err["msg"],
-                "type": err["type"]
-            }
-            for err in exc.errors()
-        ]
-        
-        return JSONResponse(
-            status_code=400,
-            content={
-                "success": False,
-                "code": ErrorCode.VALIDATION_ERROR,
-                "message": "参数验证错误",
-                "data": None,
-                "error": {
-                    "details": error_details
-                }
+    return FastJSONResponse(
+        status_code=exc.status_code,
+        content={
+            "success": False,
+            "code": exc.code,
+            "message": exc.message,
+            "data": None,
+            "error": {
+                "details": exc.details
             }
-        )
+        }
+    )
+
+
+async def general_exception_handler(request: Request, exc: Exception) -> Response:
+    """处理未预期的异常"""
+    # 异常信息随记录交给处理器，堆栈只在日志真正输出时才格式化
+    logger.error(f"Unexpected Error: {str(exc)}", exc_info=exc)
     
-    @app.exception_handler(APIException)
-    async def api_exception_handler(request: Request, exc: APIException):
-        return JSONResponse(
-            status_code=exc.status_code,
-            content={
-                "success": False,
-                "code": exc.code,
-                "message": exc.message,
-                "data": None,
-                "error": {
-                    "details": exc.details
-                }
-            }
-        )
+    return _error_response(_UNKNOWN_ERROR_PREFIX, str(exc), 500)
+
+
+def register_error_handlers(app: FastAPI) -> None:
+    """注册错误处理器
     
-    @app.exception_handler(Exception)
-    async def general_exception_handler(request: Request, exc: Exception):
-        error_traceback = traceback.format_exc()
-        logger.error(f"Unexpected Error: {str(exc)}\n{error_traceback}")
-        
-        return JSONResponse(
-            status_code=500,
-            content={
-                "success": False,
-                "code": ErrorCode.UNKNOWN_ERROR,
-                "message": "服务器内部错误",
-                "data": None,
-                "error": {
-                    "details": str(exc)
-                }
-            }
-        )
+    每个异常只经过一个处理器、只序列化一次；计时和请求ID由RequestTimingMiddleware负责
+    """
+    app.add_middleware(RequestTimingMiddleware)
+    
+    app.add_exception_handler(ValidationError, validation_exception_handler)
+    app.add_exception_handler(APIException, api_exception_handler)
+    app.add_exception_handler(Exception, general_exception_handler)
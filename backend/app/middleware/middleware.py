@@ -11,10 +11,12 @@ from starlette.middleware.gzip import GZipMiddleware
 
 from .error_handler import register_error_handlers
 
-# 配置日志
-logging.basicConfig(level=logging.INFO)
+# 日志配置由应用入口统一完成，这里只获取记录器
 logger = logging.getLogger(__name__)
 
+# 本地开发的任意端口（Vite默认5173、React默认3000等），生产环境域名可以在这里添加
+CORS_ORIGIN_REGEX = r"^https?://(localhost|127\.0\.0\.1)(:\d+)?$"
+
 def setup_middlewares(app: FastAPI) -> None:
     """
     设置并注册所有中间件
@@ -40,21 +42,13 @@ def setup_cors_middleware(app: FastAPI) -> None:
     参数:
         app: FastAPI应用实例
     """
-    origins = [
-        "http://localhost",
-        "http://localhost:5173",  # Vite默认端口
-        "http://localhost:3000",
-        "http://127.0.0.1:5173",
-        "http://127.0.0.1:3000",
-        # 生产环境域名可以在这里添加
-    ]
-    
+    # 允许的源用一个正则表达式描述，CORSMiddleware在启动时编译一次
     app.add_middleware(
         CORSMiddleware,
-        allow_origins=origins,
+        allow_origin_regex=CORS_ORIGIN_REGEX,
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
     )
     
-    logger.info(f"CORS中间件已配置，允许的源: {origins}")
+    logger.info("CORS中间件已配置，允许的源: %s", CORS_ORIGIN_REGEX)
@@ -1,40 +1,264 @@
+import asyncio
+import logging
+from functools import lru_cache
+from typing import AsyncIterator, Dict, Optional
+
+import httpx
+
 from app.config import settings
+from app.pipeline import llm_cache
+from app.pipeline.llm_cache import CacheKey, make_key
+from app.pipeline.prompts import SYSTEM_PROMPT
+
+# 日志配置由应用入口统一完成，这里只获取记录器
+logger = logging.getLogger(__name__)
+
+# HTTP/2可以在一条连接上复用多个并发请求，需要h2库
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    logger.warning("h2未安装，OpenAI客户端将使用HTTP/1.1")
+    HTTP2_AVAILABLE = False
+
+# 系统提示词是常量，只构建一次
+_SYSTEM_MSG = {"role": "system", "content": SYSTEM_PROMPT}
+
+# 本地模型名称，可根据实际模型名称和配置调整
+_LOCAL_MODEL = "qwen2.5:7b"
+
+# 单次生成的默认token上限，一次生成多个部分时按部分数放大
+MAX_TOKENS = 512
+
+# 云端API的生成参数
+_COMPLETION_PARAMS = {
+    "temperature": 0.85,
+    "max_tokens": MAX_TOKENS,
+    "top_p": 0.95,
+    "frequency_penalty": 0.2,
+    "presence_penalty": 0.2
+}
+
+# 同步和异步客户端共用的连接池配置
+_HTTP_TIMEOUT = 60
+_HTTP_LIMITS = httpx.Limits(max_keepalive_connections=32, max_connections=64)
+
+# 异步调用的并发上限，在首次使用时创建（必须绑定到运行中的事件循环）
+_semaphore = None
+
+# 正在进行的异步请求，键为请求摘要：相同请求并发到达时共用同一次模型调用
+_inflight: Dict[str, asyncio.Task] = {}
+
+
+@lru_cache(maxsize=1)
+def _get_openai_client():
+    """缓存OpenAI客户端，复用其HTTP连接池（keep-alive），避免每次调用重新握手"""
+    from openai import OpenAI
+    http_client = httpx.Client(http2=HTTP2_AVAILABLE, timeout=_HTTP_TIMEOUT, limits=_HTTP_LIMITS)
+    return OpenAI(api_key=settings.openai_api_key, base_url=settings.openai_api_base, http_client=http_client)
+
+
+@lru_cache(maxsize=1)
+def _get_async_openai_client():
+    """缓存异步OpenAI客户端，所有协程共享同一个连接池"""
+    from openai import AsyncOpenAI
+    http_client = httpx.AsyncClient(http2=HTTP2_AVAILABLE, timeout=_HTTP_TIMEOUT, limits=_HTTP_LIMITS)
+    return AsyncOpenAI(api_key=settings.openai_api_key, base_url=settings.openai_api_base, http_client=http_client)
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    """获取限制并发模型调用数的信号量"""
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(settings.max_concurrent_llm)
+    return _semaphore
+
+
+@lru_cache(maxsize=1)
+def _get_local_model():
+    """缓存本地模型实例"""
+    from langchain_ollama import OllamaLLM
+    return OllamaLLM(model=_LOCAL_MODEL)
+
+
+def _build_messages(prompt: str, context: str) -> list:
+    """构建对话消息"""
+    return [
+        _SYSTEM_MSG,
+        {"role": "user", "content": f"【背景/上下文】\n{context}\n【写作要求】\n{prompt}"}
+    ]
+
 
 # 本地模型调用（使用 langchain-ollama，仅供内部调用）
 def local_model_inference(prompt: str) -> str:
     try:
-        from langchain_ollama import OllamaLLM
-        model = OllamaLLM(model="qwen2.5:7b")  # 可根据实际模型名称和配置调整
+        model = _get_local_model()
         return model.invoke(prompt)
     except Exception as e:
         return f"[本地模型调用失败: {e}]"
 
 
-def model_inference(prompt: str, context: str) -> str:
+async def local_model_inference_async(prompt: str) -> str:
+    try:
+        model = _get_local_model()
+        return await model.ainvoke(prompt)
+    except Exception as e:
+        return f"[本地模型调用失败: {e}]"
+
+
+def _completion_params(max_tokens: Optional[int] = None) -> dict:
+    """云端API的生成参数，max_tokens 为None时使用默认上限"""
+    if max_tokens is None:
+        return _COMPLETION_PARAMS
+    return {**_COMPLETION_PARAMS, "max_tokens": max_tokens}
+
+
+def _cache_key(prompt: str, context: str, params: dict = _COMPLETION_PARAMS) -> CacheKey:
+    """构建响应缓存键，语义匹配只在模型、上下文和生成参数都相同的请求之间进行"""
+    model = settings.openai_model if settings.mode == "api" else _LOCAL_MODEL
+    return make_key(model, _SYSTEM_MSG["content"], context, prompt, params)
+
+
+def model_inference(prompt: str, context: str, use_cache: bool = True,
+                    max_tokens: Optional[int] = None) -> str:
     """
     统一AI推理入口，根据 settings.mode 调用云端API或本地模型。
+    同步版本，供线程池和同步流程使用；异步接口请使用 model_inference_async。
+    语义相近的请求直接返回缓存的响应；use_cache=False 时既不查找也不写入缓存，
+    用于输入随时间增长、旧响应会过时的调用（如历史摘要）。
+    max_tokens 覆盖云端API的默认输出上限，用于一次生成多个部分的调用。
     """
+    params = _completion_params(max_tokens)
+    key = vector = None
+    if use_cache:
+        key = _cache_key(prompt, context, params)
+        cached, vector = llm_cache.lookup(key)
+        if cached is not None:
+            return cached
+    
     if settings.mode == "api":
         try:
-            from openai import OpenAI
-            client = OpenAI(api_key=settings.openai_api_key)
-            messages = [
-                {"role": "system", "content": "你是一个中文小说写作助手，请根据上下文和风格要求生成高质量中文小说内容。"},
-                {"role": "user", "content": f"【背景/上下文】\n{context}\n【写作要求】\n{prompt}"}
-            ]
+            client = _get_openai_client()
             response = client.chat.completions.create(
                 model=settings.openai_model,
-                messages=messages,
-                temperature=0.85,
-                max_tokens=512,
-                top_p=0.95,
-                frequency_penalty=0.2,
-                presence_penalty=0.2
+                messages=_build_messages(prompt, context),
+                **params
             )
-            return response.choices[0].message.content.strip()
+            result = response.choices[0].message.content.strip()
         except Exception as e:
             return f"[OpenAI API 调用失败: {e}]"
     elif settings.mode == "local":
-        return local_model_inference(context + "\n" + prompt)
+        try:
+            result = _get_local_model().invoke(context + "\n" + prompt)
+        except Exception as e:
+            return f"[本地模型调用失败: {e}]"
     else:
         return f"[不支持的AI模式: {settings.mode}]"
+    
+    # 只缓存成功的响应
+    if key is not None:
+        llm_cache.store(key, result, vector)
+    return result
+
+
+async def model_inference_async(prompt: str, context: str) -> str:
+    """
+    统一AI推理入口的异步版本，等待模型响应时不阻塞事件循环，
+    同时进行的云端请求数受 settings.max_concurrent_llm 限制。
+    精确匹配未命中后，摘要相同的并发请求合并为一次调用，
+    语义匹配和模型调用都只执行一次。
+    """
+    key = _cache_key(prompt, context)
+    # 精确匹配可能访问Redis，放到线程池中执行
+    cached = await asyncio.to_thread(llm_cache.lookup_exact, key)
+    if cached is not None:
+        return cached
+    
+    task = _inflight.get(key.digest)
+    if task is None:
+        task = asyncio.ensure_future(_infer_async(key, prompt, context))
+        _inflight[key.digest] = task
+        task.add_done_callback(lambda _: _inflight.pop(key.digest, None))
+    # 某个调用方被取消时不影响共用这次请求的其他调用方
+    return await asyncio.shield(task)
+
+
+async def _infer_async(key: CacheKey, prompt: str, context: str) -> str:
+    """语义匹配未命中时调用模型，并把成功的响应写入缓存"""
+    # 计算键向量是CPU密集操作，放到线程池中执行
+    cached, vector = await asyncio.to_thread(llm_cache.lookup_semantic, key)
+    if cached is not None:
+        return cached
+    
+    if settings.mode == "api":
+        try:
+            async with _get_semaphore():
+                response = await _get_async_openai_client().chat.completions.create(
+                    model=settings.openai_model,
+                    messages=_build_messages(prompt, context),
+                    **_COMPLETION_PARAMS
+                )
+            result = response.choices[0].message.content.strip()
+        except Exception as e:
+            return f"[OpenAI API 调用失败: {e}]"
+    elif settings.mode == "local":
+        try:
+            result = await _get_local_model().ainvoke(context + "\n" + prompt)
+        except Exception as e:
+            return f"[本地模型调用失败: {e}]"
+    else:
+        return f"[不支持的AI模式: {settings.mode}]"
+    
+    await asyncio.to_thread(llm_cache.store, key, result, vector)
+    return result
+
+
+async def model_inference_stream(prompt: str, context: str) -> AsyncIterator[bytes]:
+    """
+    流式AI推理：模型每生成一段文本就立即产出（UTF-8字节），
+    首字节延迟从完整生成时间降为首个token的时间。
+    缓存命中时一次性产出完整响应。
+    """
+    key = _cache_key(prompt, context)
+    cached, vector = await asyncio.to_thread(llm_cache.lookup, key)
+    if cached is not None:
+        yield cached.encode("utf-8")
+        return
+    
+    parts = []
+    if settings.mode == "api":
+        try:
+            # 流式连接在整个输出期间都占用一个并发名额
+            async with _get_semaphore():
+                client = _get_async_openai_client()
+                response = await client.chat.completions.create(
+                    model=settings.openai_model,
+                    messages=_build_messages(prompt, context),
+                    stream=True,
+                    **_COMPLETION_PARAMS
+                )
+                async for chunk in response:
+                    if chunk.choices:
+                        text = chunk.choices[0].delta.content
+                        if text:
+                            parts.append(text)
+                            yield text.encode("utf-8")
+        except Exception as e:
+            yield f"[OpenAI API 调用失败: {e}]".encode("utf-8")
+            return
+    elif settings.mode == "local":
+        try:
+            model = _get_local_model()
+            async for text in model.astream(context + "\n" + prompt):
+                if text:
+                    parts.append(text)
+                    yield text.encode("utf-8")
+        except Exception as e:
+            yield f"[本地模型调用失败: {e}]".encode("utf-8")
+            return
+    else:
+        yield f"[不支持的AI模式: {settings.mode}]".encode("utf-8")
+        return
+    
+    # 与非流式接口保持一致，缓存去掉首尾空白后的完整响应
+    await asyncio.to_thread(llm_cache.store, key, "".join(parts).strip(), vector)
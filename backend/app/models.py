@@ -2,19 +2,20 @@
 数据库模型定义 - 使用SQLAlchemy ORM
 提供所有数据库表的模型定义和关系
 """
-import uuid
-import datetime
+import os
 from typing import Dict, Any, List, Optional
 
 from sqlalchemy import (
-    Column, String, Integer, Float, Text, Boolean, 
+    Column, String, Integer, BigInteger, Float, Text, Boolean, 
     DateTime, ForeignKey, JSON, Table, UniqueConstraint,
-    Index, create_engine
+    Index, text
 )
 from sqlalchemy.dialects.postgresql import UUID, JSONB, ARRAY
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship, sessionmaker
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
+from pgvector.sqlalchemy import HALFVEC
 
 # 创建基类
 Base = declarative_base()
@@ -26,7 +27,7 @@ character_event = Table(
     Column('character_id', UUID(as_uuid=True), ForeignKey('characters.id'), primary_key=True),
     Column('event_id', UUID(as_uuid=True), ForeignKey('events.id'), primary_key=True),
     Column('role', String(50)),  # 角色在事件中的角色，如"主角"、"配角"等
-    Column('created_at', DateTime, default=datetime.datetime.utcnow)
+    Column('created_at', DateTime(timezone=True), server_default=func.now())
 )
 
 # 定义关联表
@@ -35,19 +36,19 @@ location_event = Table(
     Base.metadata,
     Column('location_id', UUID(as_uuid=True), ForeignKey('locations.id'), primary_key=True),
     Column('event_id', UUID(as_uuid=True), ForeignKey('events.id'), primary_key=True),
-    Column('created_at', DateTime, default=datetime.datetime.utcnow)
+    Column('created_at', DateTime(timezone=True), server_default=func.now())
 )
 
 class Project(Base):
     """项目表"""
     __tablename__ = 'projects'
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, server_default=text('gen_random_uuid()'))
     title = Column(String(255), nullable=False)
     description = Column(Text)
     author_id = Column(String(255), nullable=False)  # 可以关联到用户表
-    created_at = Column(DateTime, default=datetime.datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
     # 关系
     characters = relationship("Character", back_populates="project", cascade="all, delete-orphan")
@@ -68,14 +69,14 @@ class Character(Base):
     """角色表"""
     __tablename__ = 'characters'
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, server_default=text('gen_random_uuid()'))
     project_id = Column(UUID(as_uuid=True), ForeignKey('projects.id'), nullable=False)
     name = Column(String(255), nullable=False)
     role = Column(String(50))  # 如"protagonist", "antagonist"等
     description = Column(Text)
-    attributes = Column(JSONB, default={})
-    created_at = Column(DateTime, default=datetime.datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    attributes = Column(JSONB, server_default=text("'{}'::jsonb"), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
     # 关系
     project = relationship("Project", back_populates="characters")
@@ -92,13 +93,13 @@ class Location(Base):
     """地点表"""
     __tablename__ = 'locations'
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, server_default=text('gen_random_uuid()'))
     project_id = Column(UUID(as_uuid=True), ForeignKey('projects.id'), nullable=False)
     name = Column(String(255), nullable=False)
     description = Column(Text)
-    attributes = Column(JSONB, default={})
-    created_at = Column(DateTime, default=datetime.datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    attributes = Column(JSONB, server_default=text("'{}'::jsonb"), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
     # 关系
     project = relationship("Project", back_populates="locations")
@@ -115,13 +116,13 @@ class Item(Base):
     """物品表"""
     __tablename__ = 'items'
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, server_default=text('gen_random_uuid()'))
     project_id = Column(UUID(as_uuid=True), ForeignKey('projects.id'), nullable=False)
     name = Column(String(255), nullable=False)
     description = Column(Text)
-    attributes = Column(JSONB, default={})
-    created_at = Column(DateTime, default=datetime.datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    attributes = Column(JSONB, server_default=text("'{}'::jsonb"), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
     # 关系
     project = relationship("Project", back_populates="items")
@@ -137,14 +138,14 @@ class Event(Base):
     """事件表"""
     __tablename__ = 'events'
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, server_default=text('gen_random_uuid()'))
     project_id = Column(UUID(as_uuid=True), ForeignKey('projects.id'), nullable=False)
     title = Column(String(255), nullable=False)
     description = Column(Text)
     event_time = Column(String(255))  # 事件发生的时间（可以是具体时间或相对描述）
-    attributes = Column(JSONB, default={})
-    created_at = Column(DateTime, default=datetime.datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    attributes = Column(JSONB, server_default=text("'{}'::jsonb"), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
     # 关系
     project = relationship("Project", back_populates="events")
@@ -161,13 +162,13 @@ class Rule(Base):
     """世界规则表"""
     __tablename__ = 'rules'
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, server_default=text('gen_random_uuid()'))
     project_id = Column(UUID(as_uuid=True), ForeignKey('projects.id'), nullable=False)
     name = Column(String(255), nullable=False)
     description = Column(Text)
-    attributes = Column(JSONB, default={})
-    created_at = Column(DateTime, default=datetime.datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    attributes = Column(JSONB, server_default=text("'{}'::jsonb"), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
     # 关系
     project = relationship("Project", back_populates="rules")
@@ -182,15 +183,15 @@ class Chapter(Base):
     """章节表"""
     __tablename__ = 'chapters'
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, server_default=text('gen_random_uuid()'))
     project_id = Column(UUID(as_uuid=True), ForeignKey('projects.id'), nullable=False)
     chapter_number = Column(Integer, nullable=False)
     title = Column(String(255), nullable=False)
     summary = Column(Text)
     content = Column(Text)
     status = Column(String(50), default='draft')  # draft, published, etc.
-    created_at = Column(DateTime, default=datetime.datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
     # 关系
     project = relationship("Project", back_populates="chapters")
@@ -198,7 +199,7 @@ class Chapter(Base):
     
     # 索引和约束
     __table_args__ = (
-        Index('idx_chapters_project_id', 'project_id'),
+        # 唯一约束的索引同时服务于按项目过滤和按章节号排序，不再单独建立索引
         UniqueConstraint('project_id', 'chapter_number', name='uq_chapter_number'),
     )
 
@@ -207,21 +208,21 @@ class Scene(Base):
     """场景表"""
     __tablename__ = 'scenes'
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, server_default=text('gen_random_uuid()'))
     chapter_id = Column(UUID(as_uuid=True), ForeignKey('chapters.id'), nullable=False)
     title = Column(String(255), nullable=False)
     summary = Column(Text)
     content = Column(Text)
     scene_number = Column(Integer, nullable=False)
-    created_at = Column(DateTime, default=datetime.datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
     # 关系
     chapter = relationship("Chapter", back_populates="scenes")
     
     # 索引和约束
     __table_args__ = (
-        Index('idx_scenes_chapter_id', 'chapter_id'),
+        # 唯一约束的索引同时服务于按章节过滤和按场景号排序
         UniqueConstraint('chapter_id', 'scene_number', name='uq_scene_number'),
     )
 
@@ -230,12 +231,12 @@ class Outline(Base):
     """大纲表"""
     __tablename__ = 'outlines'
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, server_default=text('gen_random_uuid()'))
     project_id = Column(UUID(as_uuid=True), ForeignKey('projects.id'), nullable=False, unique=True)
     skeleton = Column(Text)  # 故事骨架
     structure = Column(JSONB)  # 结构化大纲信息
-    created_at = Column(DateTime, default=datetime.datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
     # 索引
     __table_args__ = (
@@ -247,13 +248,14 @@ class MemoryEntry(Base):
     """记忆条目表"""
     __tablename__ = 'memory_entries'
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, server_default=text('gen_random_uuid()'))
     project_id = Column(UUID(as_uuid=True), ForeignKey('projects.id'), nullable=False)
     entry_type = Column(String(50), nullable=False)  # summary, event, character_state等
     content = Column(Text, nullable=False)
-    metadata = Column(JSONB, default={})
-    created_at = Column(DateTime, default=datetime.datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    # metadata是declarative基类的保留属性，Python侧改名为meta，数据库列名保持不变
+    meta = Column('metadata', JSONB, server_default=text("'{}'::jsonb"), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     
     # 关系
     project = relationship("Project", back_populates="memory_entries")
@@ -261,8 +263,10 @@ class MemoryEntry(Base):
     
     # 索引
     __table_args__ = (
-        Index('idx_memory_entries_project_id', 'project_id'),
-        Index('idx_memory_entries_type', 'entry_type'),
+        # 对应 WHERE project_id=? [AND entry_type=?] ORDER BY created_at DESC 两种查询，
+        # 取最新N条时直接按索引顺序读取，无需排序
+        Index('idx_memory_proj_type', 'project_id', 'entry_type', text('created_at DESC')),
+        Index('idx_memory_proj_created', 'project_id', text('created_at DESC')),
     )
 
 
@@ -270,10 +274,12 @@ class VectorMemory(Base):
     """向量记忆表"""
     __tablename__ = 'vector_memories'
     
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
+    id = Column(UUID(as_uuid=True), primary_key=True, server_default=text('gen_random_uuid()'))
     memory_id = Column(UUID(as_uuid=True), ForeignKey('memory_entries.id'), nullable=False, unique=True)
-    embedding = Column(ARRAY(Float))  # 向量嵌入
-    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    # 冗余保存项目ID，检索时直接按项目过滤，无需连接memory_entries
+    project_id = Column(UUID(as_uuid=True), ForeignKey('projects.id', ondelete='CASCADE'))
+    embedding = Column(HALFVEC(1536))  # 半精度向量嵌入，维度与嵌入模型一致
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # 关系
     memory_entry = relationship("MemoryEntry", back_populates="vector_memory")
@@ -281,9 +287,40 @@ class VectorMemory(Base):
     # 索引
     __table_args__ = (
         Index('idx_vector_memories_memory_id', 'memory_id'),
+        Index('idx_vector_memories_project_id', 'project_id'),
+        # HNSW索引按余弦距离建立，查询使用 embedding <=> :query::halfvec 排序
+        Index(
+            'idx_vector_hnsw', 'embedding',
+            postgresql_using='hnsw',
+            postgresql_with={'m': 16, 'ef_construction': 64},
+            postgresql_ops={'embedding': 'halfvec_cosine_ops'}
+        ),
     )
 
 
+class KnowledgeRelationship(Base):
+    """知识图谱关系表（边）"""
+    __tablename__ = 'relationships'
+    
+    seq = Column(BigInteger, primary_key=True, autoincrement=True)  # 插入顺序
+    project_id = Column(UUID(as_uuid=True), ForeignKey('projects.id', ondelete='CASCADE'))
+    id = Column(String(400), nullable=False)  # 关系ID，由两端节点和关系类型生成
+    from_type = Column(String(50), nullable=False)
+    from_id = Column(String(100), nullable=False)
+    to_type = Column(String(50), nullable=False)
+    to_id = Column(String(100), nullable=False)
+    rel_type = Column(String(50), nullable=False)  # WITNESSED, HAS_RULE, LOCATED_AT等
+    properties = Column(JSONB, server_default=text("'{}'::jsonb"), nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    # 索引和约束
+    __table_args__ = (
+        UniqueConstraint('project_id', 'id', name='uq_relationships_project_id'),
+        Index('idx_relationships_from', 'project_id', 'from_type', 'from_id'),
+        Index('idx_relationships_to', 'project_id', 'to_type', 'to_id'),
+    )
+
 class VersionHistory(Base):
     """版本历史表"""
     __tablename__ = 'version_history'
@@ -295,12 +332,12 @@ class VersionHistory(Base):
     version = Column(Integer, nullable=False)
     data = Column(JSONB, nullable=False)
     comment = Column(Text)
-    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
     
     # 索引和约束
     __table_args__ = (
-        Index('idx_version_history_entity', 'entity_type', 'entity_id'),
         Index('idx_version_history_project_id', 'project_id'),
+        # 唯一约束的索引可以反向扫描，查询最新版本时只需读取最后一项
         UniqueConstraint('entity_type', 'entity_id', 'version', name='uq_version'),
     )
 
@@ -311,35 +348,56 @@ class GraphState(Base):
     
     thread_id = Column(String(255), primary_key=True)
     state = Column(JSONB, nullable=False)
-    created_at = Column(DateTime, default=datetime.datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
 
 # 数据库连接和会话
 def get_engine(url=None):
-    """获取数据库引擎"""
+    """
+    获取异步数据库引擎
+    
+    使用asyncpg驱动并显式设置连接池大小，默认的5个连接在并发请求下很快耗尽；
+    不在每次取出连接时执行pre-ping，断线由TCP keepalive和pool_recycle处理
+    
+    参数:
+        url: 数据库连接URL，默认从环境变量构造
+    
+    返回:
+        AsyncEngine对象
+    """
     if url is None:
-        url = f"postgresql://{os.environ.get('POSTGRES_USER', 'postgres')}:" \
+        url = f"postgresql+asyncpg://{os.environ.get('POSTGRES_USER', 'postgres')}:" \
               f"{os.environ.get('POSTGRES_PASSWORD', 'postgres')}@" \
               f"{os.environ.get('POSTGRES_HOST', 'localhost')}:" \
               f"{os.environ.get('POSTGRES_PORT', '5432')}/" \
               f"{os.environ.get('POSTGRES_DB', 'novel_forge')}"
     
-    return create_engine(url)
+    return create_async_engine(
+        url,
+        pool_size=int(os.environ.get('DB_POOL_SIZE', '20')),
+        max_overflow=int(os.environ.get('DB_MAX_OVERFLOW', '10')),
+        pool_recycle=1800,
+        pool_pre_ping=False,
+        # 短查询为主，关闭JIT避免编译开销
+        connect_args={'server_settings': {'jit': 'off'}}
+    )
 
 def get_session_maker(engine=None):
-    """获取会话工厂"""
+    """获取异步会话工厂"""
     if engine is None:
         engine = get_engine()
     
-    return sessionmaker(bind=engine)
+    # 提交后不使对象过期，避免访问属性时再次查询数据库
+    return async_sessionmaker(bind=engine, expire_on_commit=False)
 
-def init_db(engine=None):
+async def init_db(engine=None):
     """初始化数据库"""
     if engine is None:
         engine = get_engine()
     
     # 创建所有表
-    Base.metadata.create_all(engine)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
     
     return engine
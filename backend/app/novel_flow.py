@@ -2,31 +2,57 @@
 小说创作流程管理系统 - 基于LangGraph实现
 支持多阶段流程：大纲生成、角色设计、章节创作、内容优化等
 """
+import os
 import json
+import atexit
+import hashlib
+import asyncio
 import logging
-from typing import Dict, Any, List, TypedDict, Optional, Literal
+import operator
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextvars import ContextVar
+from functools import lru_cache
+from pathlib import Path
+from typing import Annotated, Dict, Any, AsyncIterator, Callable, List, TypedDict, Optional, Literal
 
 from langchain_core.messages import SystemMessage, HumanMessage
 from langchain_openai import ChatOpenAI
 from langgraph.graph import StateGraph, END
 
-from .memory import element_store, graph_store, memory_store
+from .memory import element_store, generation_writer, graph_store
 from .config import settings
+from .model_infer import model_inference
+from .pipeline.prompts import SYSTEM_PROMPT, OUTLINE_ROLE, NOVELIST_ROLE, EDITOR_ROLE, with_role
 
-# 配置日志
-logging.basicConfig(level=logging.INFO)
+# 日志配置由应用入口统一完成，这里只获取记录器
 logger = logging.getLogger(__name__)
 
+# 本地模式才需要Ollama，未安装时只在使用本地模型时报错
+try:
+    from langchain_ollama import OllamaLLM
+except ImportError:
+    OllamaLLM = None
+
+# 尝试导入json_repair，用于修复模型输出中轻微的JSON格式错误
+try:
+    import json_repair
+    JSON_REPAIR_AVAILABLE = True
+except ImportError:
+    logger.warning("json_repair库未安装，格式有误的大纲JSON将退回文本解析")
+    JSON_REPAIR_AVAILABLE = False
+
 # 定义状态类型
 class NovelState(TypedDict):
     """小说创作流程状态"""
     novel_id: str  # 小说ID
     current_task: str  # 当前任务
-    messages: List[Dict[str, Any]]  # 消息历史
+    messages: Annotated[List[Dict[str, Any]], operator.add]  # 消息历史，节点只返回新增的消息
     characters: List[Dict[str, Any]]  # 角色列表
     locations: List[Dict[str, Any]]  # 地点列表
     items: List[Dict[str, Any]]  # 物品列表
     outline: Optional[Dict[str, Any]]  # 大纲
+    chapter_index: Optional[Dict[str, int]]  # 章节ID（序号或id字段）到大纲章节下标的映射
     chapter_id: Optional[str]  # 当前章节ID
     chapter_content: Optional[str]  # 当前章节内容
     style: Optional[Dict[str, Any]]  # 写作风格
@@ -34,20 +60,61 @@ class NovelState(TypedDict):
 
 # 获取模型
 def get_llm():
-    """获取语言模型"""
-    if settings.mode == "api":
+    """
+    获取语言模型
+    
+    模型实例在各节点间共享：大纲、章节、润色依次调用时复用已建立的HTTP连接，
+    不必每次重新握手
+    """
+    return _create_llm(settings.mode, settings.openai_model)
+
+@lru_cache(maxsize=2)
+def _create_llm(mode: str, model: str):
+    """按推理模式和模型名称创建并缓存语言模型，配置变化时自动换用新实例"""
+    if mode == "api":
         return ChatOpenAI(
             api_key=settings.openai_api_key,
-            model=settings.openai_model,
+            model=model,
             temperature=0.7
         )
-    else:
-        # 使用本地模型
-        from langchain_ollama import OllamaLLM
-        return OllamaLLM(model="qwen2.5:7b")
+    
+    # 使用本地模型
+    if OllamaLLM is None:
+        raise RuntimeError("本地模式需要安装 langchain_ollama")
+    return OllamaLLM(model="qwen2.5:7b")
+
+# 流式输出的接收函数：设置后，正文生成节点边生成边把文本片段交给它
+_token_sink: ContextVar[Optional[Callable[[str], None]]] = ContextVar("token_sink", default=None)
+
+def _invoke_llm(llm, messages: list) -> str:
+    """
+    调用模型并返回完整文本
+    
+    当前上下文设置了流式接收函数时改为流式调用，每收到一段文本就转发出去
+    
+    参数:
+        llm: 语言模型
+        messages: 消息列表
+    
+    返回:
+        完整的生成文本
+    """
+    sink = _token_sink.get()
+    if sink is None:
+        response = llm.invoke(messages)
+        # 聊天模型返回消息对象，本地LLM直接返回字符串
+        return getattr(response, "content", response)
+    
+    parts = []
+    for chunk in llm.stream(messages):
+        text = getattr(chunk, "content", chunk)
+        if text:
+            parts.append(text)
+            sink(text)
+    return "".join(parts)
 
 # 节点函数
-def load_novel_context(state: NovelState) -> NovelState:
+def load_novel_context(state: NovelState) -> Dict[str, Any]:
     """加载小说上下文"""
     novel_id = state["novel_id"]
     logger.info(f"加载小说 {novel_id} 的上下文")
@@ -57,26 +124,117 @@ def load_novel_context(state: NovelState) -> NovelState:
         novel_data = element_store.get_novel_data(novel_id)
         
         return {
-            **state,
             "characters": novel_data["characters"] or [],
             "locations": novel_data["locations"] or [],
             "items": novel_data["items"] or [],
             "outline": novel_data["outline"],
+            "chapter_index": _build_chapter_index(novel_data["outline"]),
             "current_task": "context_loaded"
         }
     except Exception as e:
         logger.error(f"加载小说上下文失败: {e}")
         return {
-            **state,
             "error": f"加载小说上下文失败: {str(e)}",
             "current_task": "error"
         }
 
-def generate_outline(state: NovelState) -> NovelState:
+def _build_chapter_index(outline: Optional[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    构建章节ID到大纲章节下标的映射，章节既可用从1开始的序号也可用id字段定位
+    
+    参数:
+        outline: 大纲
+    
+    返回:
+        章节ID到下标的字典；同一ID对应多个章节时取最靠前的一个
+    """
+    index = {}
+    for i, chapter in enumerate((outline or {}).get("chapters") or []):
+        index.setdefault(str(i+1), i)
+        if chapter.get("id"):
+            index.setdefault(chapter["id"], i)
+    return index
+
+def _find_chapter(state: NovelState, chapter_id: str):
+    """
+    在大纲中查找章节
+    
+    参数:
+        state: 流程状态
+        chapter_id: 章节ID
+    
+    返回:
+        (章节下标, 章节)，找不到时返回 (None, None)
+    """
+    index = state.get("chapter_index")
+    if index is None:
+        index = _build_chapter_index(state["outline"])
+    i = index.get(chapter_id)
+    if i is None:
+        return None, None
+    return i, state["outline"]["chapters"][i]
+
+def _format_characters(characters: List[Dict[str, Any]]) -> str:
+    """把角色列表格式化为提示中的角色信息，每行一个角色"""
+    return "\n".join([
+        f"- {c.get('name', '未命名')}: {c.get('role', '未知角色')}" 
+        for c in characters
+    ])
+
+def _format_scenes(scenes: List[Dict[str, Any]]) -> str:
+    """把章节的场景列表格式化为提示中的场景信息"""
+    parts = []
+    for i, scene in enumerate(scenes):
+        parts.append(f"\n场景{i+1}: {scene.get('title', f'场景{i+1}')}\n")
+        parts.append(f"描述: {scene.get('summary', '')}\n")
+        if scene.get("characters"):
+            parts.append(f"角色: {', '.join(scene['characters'])}\n")
+        if scene.get("location"):
+            parts.append(f"地点: {scene['location']}\n")
+    return "".join(parts)
+
+def _parse_outline(content: str) -> Dict[str, Any]:
+    """
+    解析模型返回的大纲JSON
+    
+    依次尝试：标准JSON解析、去掉Markdown代码块标记后解析、json_repair修复轻微格式错误
+    （缺逗号、尾随逗号、引号未闭合等），都失败时才退回按文本截取故事骨架，
+    避免因一个格式错误丢掉整个大纲结构
+    
+    参数:
+        content: 模型返回的文本
+    
+    返回:
+        大纲字典
+    """
+    text = content.strip()
+    if text.startswith("```"):
+        # 模型常把JSON包在 ```json ... ``` 代码块中
+        text = text.split("\n", 1)[-1].rsplit("```", 1)[0]
+    
+    try:
+        outline = json.loads(text)
+        if isinstance(outline, dict):
+            return outline
+    except json.JSONDecodeError:
+        pass
+    
+    if JSON_REPAIR_AVAILABLE:
+        outline = json_repair.loads(text)
+        if isinstance(outline, dict) and ("skeleton" in outline or "chapters" in outline):
+            logger.info("大纲JSON格式有误，已自动修复")
+            return outline
+    
+    # 简单解析文本
+    return {
+        "skeleton": content.split("章节脉络")[0].strip(),
+        "chapters": []
+    }
+
+def generate_outline(state: NovelState) -> Dict[str, Any]:
     """生成小说大纲"""
     novel_id = state["novel_id"]
     characters = state["characters"]
-    messages = state["messages"]
     
     logger.info(f"为小说 {novel_id} 生成大纲")
     
@@ -84,10 +242,7 @@ def generate_outline(state: NovelState) -> NovelState:
         llm = get_llm()
         
         # 构建角色信息
-        character_info = "\n".join([
-            f"- {c.get('name', '未命名')}: {c.get('role', '未知角色')}" 
-            for c in characters
-        ])
+        character_info = _format_characters(characters)
         
         # 构建提示
         prompt = f"""
@@ -121,23 +276,15 @@ def generate_outline(state: NovelState) -> NovelState:
         """
         
         # 构建消息
-        system_message = SystemMessage(content="你是一位专业小说策划，擅长创作引人入胜的故事大纲。")
-        user_message = HumanMessage(content=prompt)
+        system_message = SystemMessage(content=SYSTEM_PROMPT)
+        user_message = HumanMessage(content=with_role(OUTLINE_ROLE, prompt))
         
         # 调用模型
         response = llm.invoke([system_message, user_message])
         
         # 解析响应
-        try:
-            outline = json.loads(response.content)
-        except json.JSONDecodeError:
-            # 简单解析文本
-            content = response.content
-            outline = {
-                "skeleton": content.split("章节脉络")[0].strip(),
-                "chapters": []
-            }
-            # 后续可添加更复杂的解析逻辑
+        content = getattr(response, "content", response)
+        outline = _parse_outline(content)
         
         # 保存到数据库
         element_store.save_element(
@@ -149,36 +296,32 @@ def generate_outline(state: NovelState) -> NovelState:
         
         # 更新状态
         return {
-            **state,
             "outline": outline,
+            "chapter_index": _build_chapter_index(outline),
             "current_task": "outline_generated",
-            "messages": messages + [
+            "messages": [
                 {"role": "system", "content": system_message.content},
                 {"role": "user", "content": user_message.content},
-                {"role": "assistant", "content": response.content}
+                {"role": "assistant", "content": content}
             ]
         }
     except Exception as e:
         logger.error(f"生成大纲失败: {e}")
         return {
-            **state,
             "error": f"生成大纲失败: {str(e)}",
             "current_task": "error"
         }
 
-def generate_chapter(state: NovelState) -> NovelState:
+def generate_chapter(state: NovelState) -> Dict[str, Any]:
     """生成章节内容"""
     novel_id = state["novel_id"]
     chapter_id = state["chapter_id"]
-    outline = state["outline"]
     characters = state["characters"]
     locations = state["locations"]
     style = state["style"]
-    messages = state["messages"]
     
     if not chapter_id:
         return {
-            **state,
             "error": "未指定章节ID",
             "current_task": "error"
         }
@@ -187,20 +330,11 @@ def generate_chapter(state: NovelState) -> NovelState:
     
     try:
         # 找到当前章节
-        current_chapter = None
-        chapter_index = None
-        
-        if outline and "chapters" in outline:
-            for i, chapter in enumerate(outline["chapters"]):
-                if str(i+1) == chapter_id or chapter.get("id") == chapter_id:
-                    current_chapter = chapter
-                    chapter_index = i
-                    break
+        chapter_index, current_chapter = _find_chapter(state, chapter_id)
         
         if not current_chapter:
             return {
-                **state,
-                "error": f"找不到章节ID: {chapter_id}",
+                    "error": f"找不到章节ID: {chapter_id}",
                 "current_task": "error"
             }
         
@@ -209,26 +343,10 @@ def generate_chapter(state: NovelState) -> NovelState:
         chapter_summary = current_chapter.get("summary", "")
         
         # 提取场景信息
-        scenes_info = ""
-        if "scenes" in current_chapter and current_chapter["scenes"]:
-            for i, scene in enumerate(current_chapter["scenes"]):
-                scene_title = scene.get("title", f"场景{i+1}")
-                scene_summary = scene.get("summary", "")
-                scene_characters = ", ".join(scene.get("characters", []))
-                scene_location = scene.get("location", "")
-                
-                scenes_info += f"\n场景{i+1}: {scene_title}\n"
-                scenes_info += f"描述: {scene_summary}\n"
-                if scene_characters:
-                    scenes_info += f"角色: {scene_characters}\n"
-                if scene_location:
-                    scenes_info += f"地点: {scene_location}\n"
+        scenes_info = _format_scenes(current_chapter.get("scenes") or [])
         
         # 构建角色信息
-        characters_info = "\n".join([
-            f"- {c.get('name', '未命名')}: {c.get('role', '未知角色')}" 
-            for c in characters
-        ])
+        characters_info = _format_characters(characters)
         
         # 构建地点信息
         locations_info = "\n".join([
@@ -263,21 +381,19 @@ def generate_chapter(state: NovelState) -> NovelState:
         """
         
         # 构建消息
-        system_message = SystemMessage(content="你是一位专业小说家，擅长创作引人入胜的故事。")
-        user_message = HumanMessage(content=prompt)
+        system_message = SystemMessage(content=SYSTEM_PROMPT)
+        user_message = HumanMessage(content=with_role(NOVELIST_ROLE, prompt))
         
         # 调用模型
         llm = get_llm()
-        response = llm.invoke([system_message, user_message])
+        chapter_content = _invoke_llm(llm, [system_message, user_message])
         
-        chapter_content = response.content
-        
-        # 保存到数据库
+        # 交给后台写入器保存，不阻塞返回
         memory_id = f"{novel_id}_chapter_{chapter_id}"
-        memory_store.add(memory_id, chapter_content)
+        generation_writer.put_memory(memory_id, chapter_content)
         
         # 保存章节元数据
-        element_store.save_element(
+        generation_writer.put_element(
             novel_id=novel_id,
             element_type="chapter",
             element_id=chapter_id,
@@ -292,35 +408,31 @@ def generate_chapter(state: NovelState) -> NovelState:
         
         # 更新状态
         return {
-            **state,
             "chapter_content": chapter_content,
             "current_task": "chapter_generated",
-            "messages": messages + [
+            "messages": [
                 {"role": "system", "content": system_message.content},
-                {"role": "user", "content": prompt},
-                {"role": "assistant", "content": response.content}
+                {"role": "user", "content": user_message.content},
+                {"role": "assistant", "content": chapter_content}
             ]
         }
     except Exception as e:
         logger.error(f"生成章节失败: {e}")
         return {
-            **state,
             "error": f"生成章节失败: {str(e)}",
             "current_task": "error"
         }
 
 
-def polish_content(state: NovelState) -> NovelState:
+def polish_content(state: NovelState) -> Dict[str, Any]:
     """优化内容（提升语言质量、风格转换等）"""
     novel_id = state["novel_id"]
     chapter_id = state["chapter_id"]
     chapter_content = state["chapter_content"]
     style = state["style"]
-    messages = state["messages"]
     
     if not chapter_content:
         return {
-            **state,
             "error": "没有可优化的内容",
             "current_task": "error"
         }
@@ -347,51 +459,44 @@ def polish_content(state: NovelState) -> NovelState:
         """
         
         # 构建消息
-        system_message = SystemMessage(content="你是一位专业文学编辑，擅长优化文本质量，提升语言表达的生动性和美感。")
-        user_message = HumanMessage(content=prompt)
+        system_message = SystemMessage(content=SYSTEM_PROMPT)
+        user_message = HumanMessage(content=with_role(EDITOR_ROLE, prompt))
         
         # 调用模型
         llm = get_llm()
-        response = llm.invoke([system_message, user_message])
+        polished_content = _invoke_llm(llm, [system_message, user_message])
         
-        polished_content = response.content
-        
-        # 保存到数据库
+        # 交给后台写入器保存，不阻塞返回
         memory_id = f"{novel_id}_chapter_{chapter_id}"
-        memory_store.add(memory_id, "\n\n【优化版本】\n" + polished_content)
+        generation_writer.put_memory(memory_id, "\n\n【优化版本】\n" + polished_content)
         
         # 更新状态
         return {
-            **state,
             "chapter_content": polished_content,
             "current_task": "content_polished",
-            "messages": messages + [
+            "messages": [
                 {"role": "system", "content": system_message.content},
-                {"role": "user", "content": prompt},
-                {"role": "assistant", "content": response.content}
+                {"role": "user", "content": user_message.content},
+                {"role": "assistant", "content": polished_content}
             ]
         }
     except Exception as e:
         logger.error(f"优化内容失败: {e}")
         return {
-            **state,
             "error": f"优化内容失败: {str(e)}",
             "current_task": "error"
         }
 
 
-def continue_writing(state: NovelState) -> NovelState:
+def continue_writing(state: NovelState) -> Dict[str, Any]:
     """续写当前章节内容"""
     novel_id = state["novel_id"]
     chapter_id = state["chapter_id"]
     chapter_content = state["chapter_content"]
-    outline = state["outline"]
     characters = state["characters"]
-    messages = state["messages"]
     
     if not chapter_content:
         return {
-            **state,
             "error": "没有可续写的内容",
             "current_task": "error"
         }
@@ -400,22 +505,14 @@ def continue_writing(state: NovelState) -> NovelState:
     
     try:
         # 找到当前章节
-        current_chapter = None
-        if outline and "chapters" in outline:
-            for i, chapter in enumerate(outline["chapters"]):
-                if str(i+1) == chapter_id or chapter.get("id") == chapter_id:
-                    current_chapter = chapter
-                    break
+        _, current_chapter = _find_chapter(state, chapter_id)
         
         chapter_summary = ""
         if current_chapter:
             chapter_summary = current_chapter.get("summary", "")
         
         # 构建角色信息
-        characters_info = "\n".join([
-            f"- {c.get('name', '未命名')}: {c.get('role', '未知角色')}" 
-            for c in characters
-        ])
+        characters_info = _format_characters(characters)
         
         # 构建提示
         prompt = f"""
@@ -434,37 +531,33 @@ def continue_writing(state: NovelState) -> NovelState:
         """
         
         # 构建消息
-        system_message = SystemMessage(content="你是一位专业小说家，擅长创作引人入胜的故事。")
-        user_message = HumanMessage(content=prompt)
+        system_message = SystemMessage(content=SYSTEM_PROMPT)
+        user_message = HumanMessage(content=with_role(NOVELIST_ROLE, prompt))
         
         # 调用模型
         llm = get_llm()
-        response = llm.invoke([system_message, user_message])
-        
-        continuation = response.content
+        continuation = _invoke_llm(llm, [system_message, user_message])
         
         # 合并内容
         new_content = chapter_content + "\n\n" + continuation
         
-        # 保存到数据库
+        # 交给后台写入器保存，不阻塞返回
         memory_id = f"{novel_id}_chapter_{chapter_id}"
-        memory_store.add(memory_id, "\n\n【续写内容】\n" + continuation)
+        generation_writer.put_memory(memory_id, "\n\n【续写内容】\n" + continuation)
         
         # 更新状态
         return {
-            **state,
             "chapter_content": new_content,
             "current_task": "content_continued",
-            "messages": messages + [
+            "messages": [
                 {"role": "system", "content": system_message.content},
-                {"role": "user", "content": prompt},
-                {"role": "assistant", "content": response.content}
+                {"role": "user", "content": user_message.content},
+                {"role": "assistant", "content": continuation}
             ]
         }
     except Exception as e:
         logger.error(f"续写内容失败: {e}")
         return {
-            **state,
             "error": f"续写内容失败: {str(e)}",
             "current_task": "error"
         }
@@ -521,7 +614,7 @@ def create_novel_graph():
     builder.add_node("generate_chapter", generate_chapter)
     builder.add_node("polish_content", polish_content)
     builder.add_node("continue_writing", continue_writing)
-    builder.add_node("error", lambda x: x)  # 错误节点仅返回当前状态
+    builder.add_node("error", lambda x: {"current_task": "error"})  # 错误节点不修改状态（messages会累加，不能原样返回）
     
     # 添加条件边
     builder.add_conditional_edges(
@@ -587,6 +680,64 @@ def create_novel_graph():
 novel_graph = create_novel_graph()
 
 
+# 消息历史超过该字符数时，把较早的消息压缩为一段摘要
+MESSAGES_COMPACT_CHARS = 16000
+# 压缩时原样保留的最近消息数
+MESSAGES_KEEP_RECENT = 4
+# 摘要消息的内容前缀，再次压缩时据此识别并一并摘要
+SUMMARY_PREFIX = "[前情摘要] "
+
+def compact_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    压缩消息历史
+    
+    每个节点都会追加包含完整模型输出的消息，保存后随下次运行恢复，历史会随章节数线性增长。
+    总长度超过 MESSAGES_COMPACT_CHARS 时，除最近 MESSAGES_KEEP_RECENT 条外的消息
+    由模型压缩为一条摘要消息；摘要失败时保持原样
+    
+    参数:
+        messages: 消息历史
+    
+    返回:
+        压缩后的消息历史
+    """
+    if len(messages) <= MESSAGES_KEEP_RECENT:
+        return messages
+    if sum(len(m.get("content") or "") for m in messages) <= MESSAGES_COMPACT_CHARS:
+        return messages
+    
+    older, recent = messages[:-MESSAGES_KEEP_RECENT], messages[-MESSAGES_KEEP_RECENT:]
+    # 各节点的系统提示词相同，不必摘要；之前的摘要需要保留
+    history = "\n".join(
+        f"{m['role']}: {m['content']}" for m in older
+        if m.get("role") != "system" or m.get("content", "").startswith(SUMMARY_PREFIX)
+    )
+    prompt = f"请把以下小说创作记录压缩为一段摘要，保留大纲、已完成章节的要点以及人物和情节的发展：\n\n{history}\n\n摘要："
+    # 两次压缩的历史高度相似，走响应缓存会拿回旧摘要而丢掉最新章节
+    summary = model_inference(prompt, "", use_cache=False).strip()
+    
+    # 推理入口出错时返回以“[”开头的错误信息
+    if not summary or summary.startswith("["):
+        logger.warning("压缩消息历史失败，保留原始消息")
+        return messages
+    return [{"role": "system", "content": SUMMARY_PREFIX + summary}] + recent
+
+
+# 生成节点完成后交给后台写入器保存结果的任务状态
+_SAVED_BY_WRITER = ("chapter_generated", "content_polished", "content_continued")
+
+
+def _pop_save_failures(novel_id: str, result: Dict[str, Any]) -> List[str]:
+    """等待本次流程交给后台写入器的生成结果写完，返回写入失败的错误信息"""
+    if result.get("current_task") not in _SAVED_BY_WRITER or not result.get("chapter_id"):
+        return []
+    chapter_id = result["chapter_id"]
+    return generation_writer.pop_failures(
+        f"{novel_id}_chapter_{chapter_id}",
+        generation_writer.element_key(novel_id, "chapter", chapter_id)
+    )
+
+
 # 运行小说创作流程
 def run_novel_flow(novel_id: str, task_type: str, **kwargs) -> Dict[str, Any]:
     """
@@ -600,10 +751,11 @@ def run_novel_flow(novel_id: str, task_type: str, **kwargs) -> Dict[str, Any]:
     返回:
         流程运行结果
     """
-    # 尝试恢复状态
+    # 尝试恢复状态；针对章节的任务按章节区分线程，
+    # 不同章节的流程可以并行运行而不会互相覆盖保存的状态
     thread_id = f"{novel_id}_{task_type}"
-    if task_type == "chapter" and "chapter_id" in kwargs:
-        thread_id = f"{novel_id}_chapter_{kwargs['chapter_id']}"
+    if task_type in ("chapter", "polish", "continue") and "chapter_id" in kwargs:
+        thread_id = f"{novel_id}_{task_type}_{kwargs['chapter_id']}"
     
     saved_state = graph_store.load_state(thread_id)
     
@@ -616,6 +768,7 @@ def run_novel_flow(novel_id: str, task_type: str, **kwargs) -> Dict[str, Any]:
         "locations": [],
         "items": [],
         "outline": None,
+        "chapter_index": None,
         "chapter_id": None,
         "chapter_content": None,
         "style": None,
@@ -654,10 +807,12 @@ def run_novel_flow(novel_id: str, task_type: str, **kwargs) -> Dict[str, Any]:
     try:
         result = novel_graph.invoke(initial_state)
         
-        # 保存状态
-        graph_store.save_state(thread_id, result)
+        # 保存状态（章节索引可由大纲重建，不必保存；过长的消息历史压缩为摘要）
+        saved = {key: value for key, value in result.items() if key != "chapter_index"}
+        saved["messages"] = compact_messages(result.get("messages") or [])
+        graph_store.save_state(thread_id, saved)
         
-        return {
+        response = {
             "success": True,
             "novel_id": novel_id,
             "task_type": task_type,
@@ -668,6 +823,13 @@ def run_novel_flow(novel_id: str, task_type: str, **kwargs) -> Dict[str, Any]:
                 "current_task": result.get("current_task")
             }
         }
+        
+        # 生成结果由后台写入器保存，确认写入成功后才报告成功；失败时仍返回生成的内容
+        save_errors = _pop_save_failures(novel_id, result)
+        if save_errors:
+            response["success"] = False
+            response["error"] = "保存生成结果失败: " + "; ".join(save_errors)
+        return response
     except Exception as e:
         logger.error(f"运行小说流程失败: {e}")
         return {
@@ -676,3 +838,264 @@ def run_novel_flow(novel_id: str, task_type: str, **kwargs) -> Dict[str, Any]:
             "task_type": task_type,
             "error": str(e)
         }
+
+
+# 批量运行的线程池：每个流程的耗时几乎都在等待模型网络响应，线程即可并行
+MAX_FLOW_WORKERS = 8
+flow_executor = ThreadPoolExecutor(max_workers=MAX_FLOW_WORKERS, thread_name_prefix="novel-flow")
+atexit.register(flow_executor.shutdown, wait=False)
+
+
+def _run_task(novel_id: str, task: Dict[str, Any]) -> Dict[str, Any]:
+    """运行单个批量任务，task 中除 task_type 外的字段作为 run_novel_flow 的参数"""
+    kwargs = {key: value for key, value in task.items() if key != "task_type"}
+    return run_novel_flow(novel_id, task["task_type"], **kwargs)
+
+
+def run_novel_flow_batch(novel_id: str, tasks: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    并行运行多个相互独立的小说创作流程
+    
+    章节、润色和续写的状态按 (任务类型, 章节ID) 保存，同一批中不应包含
+    任务类型和章节都相同的两个任务，否则它们会并发读写同一份状态
+    
+    参数:
+        novel_id: 小说ID
+        tasks: 任务列表，每项包含 task_type 以及 chapter_id、content、style 等参数
+    
+    返回:
+        与任务顺序一致的流程运行结果列表（单个任务失败只体现在其结果中）
+    """
+    if not tasks:
+        return []
+    
+    # 单个任务直接在当前线程运行，省去线程池调度
+    if len(tasks) == 1:
+        return [_run_task(novel_id, tasks[0])]
+    
+    return list(flow_executor.map(lambda task: _run_task(novel_id, task), tasks))
+
+
+def _succeeded(result: Dict[str, Any]) -> bool:
+    """流程是否成功运行且没有节点报错"""
+    return result["success"] and not result["result"].get("error")
+
+
+def _ensure_outline(novel_id: str) -> Optional[Dict[str, Any]]:
+    """
+    确保小说已有大纲，没有时运行一次大纲流程
+    
+    参数:
+        novel_id: 小说ID
+    
+    返回:
+        大纲已存在或生成成功时为None，否则为大纲流程的结果
+    """
+    if element_store.get_element(novel_id, "outline", "main"):
+        return None
+    
+    logger.info(f"小说 {novel_id} 没有大纲，生成章节前先生成大纲")
+    result = run_novel_flow(novel_id, "outline")
+    return None if _succeeded(result) else result
+
+
+def run_chapter_pipeline(
+    novel_id: str,
+    chapter_ids: List[str],
+    style: Optional[Dict[str, Any]] = None,
+    polish: bool = True,
+    on_result: Optional[Callable[[str, Dict[str, Any]], None]] = None
+) -> List[Dict[str, Any]]:
+    """
+    分阶段流水线生成并润色多个章节
+    
+    某章正文生成完成后立即提交润色，不等其他章节生成结束，不同章节的生成和润色同时进行，
+    总耗时接近最慢阶段的总耗时而不是两个阶段之和；保存由后台写入器完成。
+    小说还没有大纲时，先生成一次大纲再提交各章节
+    
+    参数:
+        novel_id: 小说ID
+        chapter_ids: 章节ID列表
+        style: 可选的风格信息
+        polish: 是否在生成后润色
+        on_result: 每个章节得到最终结果时在调用线程中回调，参数为 (章节ID, 结果)
+    
+    返回:
+        与chapter_ids顺序一致的结果列表：润色成功时为润色结果，否则为生成结果；
+        大纲生成失败时每项都是大纲流程的结果
+    """
+    if not chapter_ids:
+        return []
+    
+    # 没有大纲时各章节的流程都会先生成大纲，同时生成的多份大纲互相覆盖；先生成一次
+    outline_error = _ensure_outline(novel_id)
+    if outline_error is not None:
+        results = [outline_error] * len(chapter_ids)
+        if on_result is not None:
+            for chapter_id in chapter_ids:
+                on_result(chapter_id, outline_error)
+        return results
+    
+    kwargs = {"style": style} if style else {}
+    results: List[Optional[Dict[str, Any]]] = [None] * len(chapter_ids)
+    
+    def finish(i: int, result: Dict[str, Any]) -> None:
+        results[i] = result
+        if on_result is not None:
+            on_result(chapter_ids[i], result)
+    
+    generating = {
+        flow_executor.submit(run_novel_flow, novel_id, "chapter", chapter_id=chapter_id, **kwargs): i
+        for i, chapter_id in enumerate(chapter_ids)
+    }
+    polishing = {}
+    for future in as_completed(generating):
+        i = generating[future]
+        result = future.result()
+        content = result["result"].get("chapter_content") if result["success"] else None
+        if not polish or not content or not _succeeded(result):
+            finish(i, result)
+            continue
+        polishing[flow_executor.submit(
+            run_novel_flow, novel_id, "polish", chapter_id=chapter_ids[i], content=content, **kwargs
+        )] = i
+    
+    for future in as_completed(polishing):
+        finish(polishing[future], future.result())
+    return results
+
+
+# 批量章节生成的检查点目录
+CHECKPOINT_DIR = Path("./data/checkpoints")
+
+
+class ChapterCheckpoint:
+    """
+    批量章节生成的JSONL检查点
+    
+    每个成功完成的章节追加一行并立即落盘，中断后重新运行同一批章节时跳过已完成的章节；
+    整批成功后删除检查点，之后再次生成会重新调用模型。
+    检查点按批次参数（章节列表、风格、是否润色）区分，参数不同的批次不会复用彼此的结果
+    """
+    
+    def __init__(self, novel_id: str, chapter_ids: List[str],
+                 style: Optional[Dict[str, Any]] = None, polish: bool = False):
+        """
+        参数:
+            novel_id: 小说ID
+            chapter_ids: 章节ID列表
+            style: 可选的风格信息
+            polish: 是否在每章生成后立即润色
+        """
+        params = json.dumps([chapter_ids, style, polish], ensure_ascii=False, sort_keys=True, default=str)
+        self.batch = hashlib.sha256(params.encode("utf-8")).hexdigest()[:16]
+        self.path = CHECKPOINT_DIR / f"{novel_id}_chapters_{self.batch}.jsonl"
+    
+    def load(self) -> Dict[str, Dict[str, Any]]:
+        """读取已完成章节的结果，返回 章节ID -> 结果"""
+        completed = {}
+        if not self.path.exists():
+            return completed
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    # 写入中途被中断的最后一行，对应章节重新生成
+                    continue
+                if record.get("batch") != self.batch:
+                    continue
+                completed[record["chapter_id"]] = record["result"]
+        return completed
+    
+    def record(self, chapter_id: str, result: Dict[str, Any]) -> None:
+        """追加一个成功完成的章节结果"""
+        if not _succeeded(result):
+            return
+        CHECKPOINT_DIR.mkdir(parents=True, exist_ok=True)
+        line = json.dumps({"batch": self.batch, "chapter_id": chapter_id, "result": result}, ensure_ascii=False)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+    
+    def clear(self) -> None:
+        """删除检查点"""
+        self.path.unlink(missing_ok=True)
+
+
+def run_chapter_batch(
+    novel_id: str,
+    chapter_ids: List[str],
+    style: Optional[Dict[str, Any]] = None,
+    polish: bool = False
+) -> List[Dict[str, Any]]:
+    """
+    批量生成章节，可从中断处恢复
+    
+    参数:
+        novel_id: 小说ID
+        chapter_ids: 章节ID列表
+        style: 可选的风格信息
+        polish: 是否在每章生成后立即润色
+    
+    返回:
+        与chapter_ids顺序一致的结果列表
+    """
+    checkpoint = ChapterCheckpoint(novel_id, chapter_ids, style, polish)
+    completed = checkpoint.load()
+    pending = [chapter_id for chapter_id in chapter_ids if chapter_id not in completed]
+    if len(pending) < len(chapter_ids):
+        logger.info(f"小说 {novel_id} 从检查点恢复，跳过已完成的 {len(chapter_ids) - len(pending)} 个章节")
+    
+    results = run_chapter_pipeline(novel_id, pending, style, polish=polish, on_result=checkpoint.record)
+    completed.update(zip(pending, results))
+    
+    if all(_succeeded(result) for result in results):
+        checkpoint.clear()
+    return [completed[chapter_id] for chapter_id in chapter_ids]
+
+
+async def run_novel_flow_stream(novel_id: str, task_type: str, **kwargs) -> AsyncIterator[bytes]:
+    """
+    流式运行小说创作流程：章节生成、优化、续写节点产生的文本即时产出（UTF-8字节），
+    流程结束后的保存逻辑与 run_novel_flow 相同
+    
+    参数:
+        novel_id: 小说ID
+        task_type: 任务类型，如 'chapter', 'polish', 'continue'
+        **kwargs: 其他参数，如 chapter_id, content, style 等
+    
+    返回:
+        文本片段的异步迭代器
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    
+    def sink(text: str) -> None:
+        loop.call_soon_threadsafe(queue.put_nowait, text.encode("utf-8"))
+    
+    def run() -> Dict[str, Any]:
+        _token_sink.set(sink)
+        try:
+            return run_novel_flow(novel_id, task_type, **kwargs)
+        finally:
+            loop.call_soon_threadsafe(queue.put_nowait, None)
+    
+    # 在独立的上下文副本中运行，接收函数不会残留在复用的线程里
+    future = loop.run_in_executor(flow_executor, contextvars.copy_context().run, run)
+    
+    streamed = False
+    while True:
+        chunk = await queue.get()
+        if chunk is None:
+            break
+        streamed = True
+        yield chunk
+    
+    result = await future
+    error = result.get("error") or result.get("result", {}).get("error")
+    # 内容已经产出但保存失败时，同样需要告知调用方
+    if error and (not streamed or not result["success"]):
+        yield f"[错误] {error}".encode("utf-8")
+
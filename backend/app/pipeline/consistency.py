@@ -2,46 +2,111 @@
 角色与情节一致性校验
 """
 import logging
+from functools import lru_cache
 from typing import Dict, List, Any, Optional, Tuple
-from .knowledge_graph import get_knowledge_graph
 
+import numpy as np
 
-def check_character_consistency(text: str, novel_id: str = "default") -> bool:
+from app import embeddings
+from .knowledge_graph import Mention, get_knowledge_graph
+
+
+# 常见性格设定及与之矛盾的表现
+TRAIT_CONFLICTS = {
+    "温柔": ["暴躁", "凶狠", "粗暴"],
+    "冷静": ["慌张", "失控", "暴躁"],
+    "开朗": ["阴郁", "孤僻", "沉默寡言"],
+    "善良": ["残忍", "恶毒", "冷酷"],
+    "勇敢": ["胆小", "怯懦", "畏缩"],
+    "稳重": ["轻浮", "冒失", "鲁莽"],
+}
+
+# 上下文与矛盾表现的余弦相似度超过该值、且高于与设定本身的相似度时视为矛盾
+CONFLICT_SIMILARITY = 0.7
+
+
+@lru_cache(maxsize=1)
+def _semantic_check_available() -> bool:
+    """只有本地嵌入模型可用时才做语义比较（哈希后备向量没有语义，API调用太慢）"""
+    return embeddings.EMBEDDING_MODEL is not None or embeddings.init_embedding_model()
+
+
+@lru_cache(maxsize=256)
+def _trait_vector(word: str) -> np.ndarray:
+    """缓存性格描述词的向量"""
+    return embeddings.get_embeddings(word)
+
+
+def _semantic_conflicts(candidates: List[Tuple[str, str, List[str]]]) -> List[bool]:
+    """
+    批量判断上下文是否在语义上与性格设定矛盾
+    
+    Args:
+        candidates: (上下文, 性格设定, 矛盾表现列表) 列表
+        
+    Returns:
+        List[bool]: 每个候选是否矛盾
+    """
+    contexts = list(dict.fromkeys(context for context, _, _ in candidates))
+    # 所有上下文一次批量编码，向量已归一化，点积即余弦相似度
+    context_vectors = dict(zip(contexts, embeddings.get_embeddings(contexts)))
+    
+    results = []
+    for context, trait, opposites in candidates:
+        vector = context_vectors[context]
+        trait_similarity = float(vector @ _trait_vector(trait))
+        conflict_similarity = max(float(vector @ _trait_vector(word)) for word in opposites)
+        results.append(conflict_similarity > CONFLICT_SIMILARITY and conflict_similarity > trait_similarity)
+    return results
+
+
+def check_character_consistency(text: str, novel_id: str = "default", mentions: Optional[List[Mention]] = None) -> bool:
     """
     检查角色属性和行为在文本中是否一致。
-    使用知识图谱进行校验。
+    使用知识图谱进行校验：上下文直接出现与性格设定矛盾的词时判为矛盾，
+    否则在本地嵌入模型可用时批量比较上下文与矛盾表现的语义相似度。
     
     Args:
         text: 要检查的文本
         novel_id: 小说ID，用于获取对应的知识图谱
+        mentions: 已扫描的实体提及，为None时扫描text
         
     Returns:
         bool: 是否通过校验
     """
     try:
-        # 获取知识图谱
-        kg = get_knowledge_graph(novel_id)
-        
-        # 从文本中提取实体
-        extracted_entities = kg.extract_entities_from_text(text)
+        # 从文本中找出实体提及（只读，提及由 update_knowledge_graph 统一记录）
+        if mentions is None:
+            mentions = get_knowledge_graph(novel_id).scan(text)
         
         # 检查角色一致性
         character_issues = []
-        for entity, position, context in extracted_entities:
-            if entity.type == "character":
-                # 检查角色行为是否符合其属性
-                # 这里是简化的逻辑，实际应用中应该更复杂
-                for attr_key, attr_value in entity.attributes.items():
-                    if attr_key in ["性格", "personality"] and attr_value:
-                        # 简单示例：如果角色性格是"温柔"，但文本中描述为"暴躁"
-                        if "温柔" in attr_value and "暴躁" in context:
-                            character_issues.append({
-                                "entity": entity.name,
-                                "attribute": attr_key,
-                                "expected": attr_value,
-                                "found": context,
-                                "position": position
-                            })
+        pending = []
+        for entity, position, context in mentions:
+            if entity.type != "character":
+                continue
+            # 检查角色行为是否符合其性格设定
+            for attr_key, attr_value in entity.attributes.items():
+                if attr_key not in ["性格", "personality"] or not attr_value:
+                    continue
+                for trait, opposites in TRAIT_CONFLICTS.items():
+                    if trait not in attr_value:
+                        continue
+                    issue = {
+                        "entity": entity.name,
+                        "attribute": attr_key,
+                        "expected": attr_value,
+                        "found": context,
+                        "position": position
+                    }
+                    if any(word in context for word in opposites):
+                        character_issues.append(issue)
+                    else:
+                        pending.append((issue, (context, trait, opposites)))
+        
+        if pending and _semantic_check_available():
+            conflicts = _semantic_conflicts([candidate for _, candidate in pending])
+            character_issues.extend(issue for (issue, _), conflict in zip(pending, conflicts) if conflict)
         
         # 如果有问题，记录并返回失败
         if character_issues:
@@ -56,7 +121,7 @@ def check_character_consistency(text: str, novel_id: str = "default") -> bool:
         return True
 
 
-def check_plot_consistency(text: str, novel_id: str = "default") -> bool:
+def check_plot_consistency(text: str, novel_id: str = "default", mentions: Optional[List[Mention]] = None) -> bool:
     """
     检查生成内容是否与大纲及逻辑保持一致。
     使用知识图谱中的事件和规则进行校验。
@@ -64,6 +129,7 @@ def check_plot_consistency(text: str, novel_id: str = "default") -> bool:
     Args:
         text: 要检查的文本
         novel_id: 小说ID，用于获取对应的知识图谱
+        mentions: 已扫描的实体提及，为None时扫描text
         
     Returns:
         bool: 是否通过校验
@@ -73,7 +139,7 @@ def check_plot_consistency(text: str, novel_id: str = "default") -> bool:
         kg = get_knowledge_graph(novel_id)
         
         # 检查情节一致性
-        plot_issues = kg.check_consistency(text)
+        plot_issues = kg.check_consistency(text, mentions)
         
         # 检查时间线一致性
         # 获取所有事件
@@ -96,27 +162,30 @@ def check_plot_consistency(text: str, novel_id: str = "default") -> bool:
         return True
 
 
-def update_knowledge_graph(text: str, novel_id: str = "default") -> None:
+def update_knowledge_graph(text: str, novel_id: str = "default", mentions: Optional[List[Mention]] = None) -> None:
     """
     从生成的文本中更新知识图谱
     
     Args:
         text: 生成的文本
         novel_id: 小说ID
+        mentions: 已扫描的实体提及，为None时扫描text
     """
     try:
         # 获取知识图谱
         kg = get_knowledge_graph(novel_id)
         
-        # 提取实体并更新知识图谱
-        kg.extract_entities_from_text(text)
+        # 记录实体提及
+        if mentions is None:
+            mentions = kg.scan(text)
+        kg.commit_mentions(mentions)
         
         # TODO: 使用更复杂的 NLP 技术提取新实体和关系
         # 例如：使用命名实体识别提取新角色、地点等
         # 例如：使用关系提取模型识别实体间的关系
         
         # 保存知识图谱
-        kg.save_graph()
+        kg.flush()
     
     except Exception as e:
         logging.error(f"更新知识图谱出错: {e}")
@@ -1,32 +1,16 @@
-from typing import Dict, Any
-import logging
-from app.config import settings
-from app.model_infer import model_inference
-from openai import OpenAI
-
-
-def call_openai_api(prompt: str, context: str) -> str:
-    try:
-        # 兼容 openai>=1.0.0 新版 API，显式传递 api_key
-        client = OpenAI(base_url='https://ms-fc-b1d7c8af-1a6d.api-inference.modelscope.cn/v1', 
-                        api_key=settings.openai_api_key)
-        messages = [
-            {"role": "system", "content": "你是一个中文小说写作助手，请根据上下文和风格要求生成高质量中文小说内容。"},
-            {"role": "user", "content": f"【背景/上下文】\n{context}\n【写作要求】\n{prompt}"}
-        ]
-        response = client.chat.completions.create(
-            model=settings.openai_model,
-            messages=messages,
-            temperature=0.85,
-            max_tokens=512,
-            top_p=0.95,
-            frequency_penalty=0.2,
-            presence_penalty=0.2
-        )
-        return response.choices[0].message.content.strip()
-    except Exception as e:
-        logging.error(f"OpenAI API 调用失败: {e}")
-        return f"[错误] OpenAI API 调用失败: {e}"
+import re
+from typing import Dict, Any, Sequence
+from app.model_infer import MAX_TOKENS, model_inference
+
+# 各类生成内容：标签 -> (默认写作要求, 输出说明)
+GENERATION_KINDS = {
+    "paragraph": ("请生成一段符合设定的小说正文。", "小说正文段落"),
+    "dialogue": ("请生成一段符合设定的人物对话。", "人物对话"),
+    "scene": ("请生成一段环境或动作描写。", "环境或动作描写"),
+}
+
+_SECTION_RE = re.compile(r"<(paragraph|dialogue|scene)>(.*?)</\1>", re.DOTALL)
+_OPEN_TAG_RE = re.compile(r"<(paragraph|dialogue|scene)>")
 
 
 def paragraph_generator(data: Dict[str, Any], context: str) -> str:
@@ -34,7 +18,7 @@ def paragraph_generator(data: Dict[str, Any], context: str) -> str:
     核心段落生成器：根据历史上下文、用户输入、风格向量等生成段落。
     根据 settings.mode 自动切换推理方式。
     """
-    prompt = data.get("prompt") or data.get("raw") or "请生成一段符合设定的小说正文。"
+    prompt = data.get("prompt") or data.get("raw") or GENERATION_KINDS["paragraph"][0]
     return model_inference(prompt, context)
 
 
@@ -43,7 +27,7 @@ def dialogue_generator(data: Dict[str, Any], context: str) -> str:
     对话生成器：专注于人物对话。
     根据 settings.mode 自动切换推理方式。
     """
-    prompt = data.get("prompt") or data.get("raw") or "请生成一段符合设定的人物对话。"
+    prompt = data.get("prompt") or data.get("raw") or GENERATION_KINDS["dialogue"][0]
     return model_inference(prompt, context)
 
 
@@ -52,5 +36,61 @@ def scene_generator(data: Dict[str, Any], context: str) -> str:
     场景描述生成器：环境描写、动作细节等。
     根据 settings.mode 自动切换推理方式。
     """
-    prompt = data.get("prompt") or data.get("raw") or "请生成一段环境或动作描写。"
+    prompt = data.get("prompt") or data.get("raw") or GENERATION_KINDS["scene"][0]
     return model_inference(prompt, context)
+
+
+def _build_multi_prompt(data: Dict[str, Any], kinds: Sequence[str]) -> str:
+    """构建一次生成多个部分的提示，要求模型用标签分隔各部分"""
+    requirement = data.get("prompt") or data.get("raw") or "".join(GENERATION_KINDS[kind][0] for kind in kinds)
+    sections = "\n".join(f"<{kind}>{GENERATION_KINDS[kind][1]}</{kind}>" for kind in kinds)
+    return f"{requirement}\n请一次完成以下各部分，每部分用对应的标签包裹，标签之外不要输出其他内容：\n{sections}"
+
+
+def parse_sections(response: str, kinds: Sequence[str]) -> Dict[str, str]:
+    """
+    解析带标签的多段输出
+    
+    参数:
+        response: 模型输出
+        kinds: 期望的部分
+    
+    返回:
+        部分 -> 文本；缺失的部分为空字符串，完全没有标签时整段输出归入第一个部分，
+        输出被截断而缺少结束标签的最后一个部分保留已生成的内容
+    """
+    found = {}
+    end = 0
+    for match in _SECTION_RE.finditer(response):
+        found[match.group(1)] = match.group(2).strip()
+        end = match.end()
+    
+    tail = _OPEN_TAG_RE.search(response, end)
+    if tail is not None and tail.group(1) not in found:
+        found[tail.group(1)] = response[tail.end():].strip()
+    
+    if not found and response.strip():
+        found = {kinds[0]: response.strip()}
+    return {kind: found.get(kind, "") for kind in kinds}
+
+
+def multi_generator(
+    data: Dict[str, Any],
+    context: str,
+    kinds: Sequence[str] = ("paragraph", "dialogue", "scene")
+) -> Dict[str, str]:
+    """
+    一次模型调用生成段落、对话、场景等多个部分，上下文只发送一次；
+    输出上限按部分数放大，每个部分与单独生成时的长度相当
+    
+    参数:
+        data: 解析后的用户输入
+        context: 上下文
+        kinds: 要生成的部分，取值见 GENERATION_KINDS
+    
+    返回:
+        部分 -> 生成的文本
+    """
+    response = model_inference(_build_multi_prompt(data, kinds), context, max_tokens=MAX_TOKENS * len(kinds))
+    return parse_sections(response, kinds)
+
@@ -1,28 +1,130 @@
 """
 知识图谱模块：管理角色、地点、事件和世界观规则，确保生成内容的一致性
 """
-from typing import Dict, List, Any, Optional, Set, Tuple
-import json
+from typing import Dict, List, Any, Iterator, Optional, Set, Tuple
 import os
+import time
+import atexit
 import logging
+import threading
+import weakref
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
 from pathlib import Path
 import datetime
+from array import array
+
+from app.config import settings
+from app.utils.json_utils import decode_json, encode_json_line, read_json, write_json
+
+# 尝试导入Aho-Corasick多模式匹配
+try:
+    import ahocorasick
+    AHOCORASICK_AVAILABLE = True
+except ImportError:
+    logging.warning("pyahocorasick未安装，实体提取将逐个名称查找")
+    AHOCORASICK_AVAILABLE = False
 
 # 知识图谱存储路径
 KNOWLEDGE_GRAPH_DIR = Path("./data/knowledge_graph")
 KNOWLEDGE_GRAPH_DIR.mkdir(parents=True, exist_ok=True)
 
+# 两次自动保存之间的最短间隔（秒），期间的修改在间隔结束时合并写入
+SAVE_DEBOUNCE_SECONDS = 0.5
+
+# 实体提及前后保留的上下文字符数
+CONTEXT_WINDOW = 20
+
+# 修改日志超过快照大小的该倍数（且不小于 WAL_COMPACT_MIN_BYTES）时合并进快照
+WAL_COMPACT_RATIO = 10
+WAL_COMPACT_MIN_BYTES = 1024 * 1024
+
+
+def _synchronized(method):
+    """在图谱的锁内执行方法：流程线程池会并发修改同一个图谱"""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self._lock:
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+class MentionStore:
+    """
+    实体提及的列式存储
+    
+    每个字段一列：位置和时间戳存放在紧凑的 array 中，不再为每次提及创建字典；
+    持久化时才还原为字典列表
+    """
+    
+    __slots__ = ("text_ids", "positions", "contexts", "timestamps")
+    
+    def __init__(self):
+        self.text_ids: List[str] = []
+        self.positions = array("q")
+        self.contexts: List[str] = []
+        self.timestamps = array("d")  # Unix时间戳（秒）
+    
+    def __len__(self) -> int:
+        return len(self.positions)
+    
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        return iter(self.to_list())
+    
+    def extend(self, text_id: str, positions: List[int], contexts: List[str], timestamp: float) -> None:
+        """
+        追加同一文本中的一批提及
+        
+        参数:
+            text_id: 文本ID
+            positions: 位置列表
+            contexts: 与位置一一对应的上下文列表
+            timestamp: 记录时间（Unix时间戳）
+        """
+        count = len(positions)
+        self.text_ids.extend([text_id] * count)
+        self.positions.extend(positions)
+        self.contexts.extend(contexts)
+        self.timestamps.extend([timestamp] * count)
+    
+    def to_list(self) -> List[Dict[str, Any]]:
+        """还原为字典列表（持久化格式）"""
+        return [
+            {
+                "text_id": text_id,
+                "position": position,
+                "context": context,
+                "created_at": datetime.datetime.fromtimestamp(timestamp)
+            }
+            for text_id, position, context, timestamp in zip(self.text_ids, self.positions, self.contexts, self.timestamps)
+        ]
+    
+    @classmethod
+    def from_list(cls, records: List[Dict[str, Any]]) -> 'MentionStore':
+        """从字典列表（持久化格式）创建"""
+        store = cls()
+        for record in records:
+            created_at = record["created_at"]
+            if isinstance(created_at, str):
+                created_at = datetime.datetime.fromisoformat(created_at)
+            store.extend(record["text_id"], [record["position"]], [record["context"]], created_at.timestamp())
+        return store
+
 
 class Entity:
     """实体基类（角色、地点、物品等）"""
     
+    # 大型图谱中实体数量多，用槽位代替实例字典
+    __slots__ = ("id", "name", "type", "attributes", "relations", "mentions", "created_at", "updated_at")
+    
     def __init__(self, entity_id: str, name: str, entity_type: str, attributes: Dict[str, Any] = None):
         self.id = entity_id
         self.name = name
         self.type = entity_type
         self.attributes = attributes or {}
         self.relations = []  # 与其他实体的关系
-        self.mentions = []  # 在文本中的提及
+        self.mentions = MentionStore()  # 在文本中的提及
         self.created_at = datetime.datetime.now()
         self.updated_at = self.created_at
     
@@ -33,52 +135,60 @@ class Entity:
     
     def add_relation(self, relation_type: str, target_id: str, attributes: Dict[str, Any] = None) -> None:
         """添加关系"""
+        now = datetime.datetime.now()
         self.relations.append({
             "type": relation_type,
             "target_id": target_id,
             "attributes": attributes or {},
-            "created_at": datetime.datetime.now()
+            "created_at": now
         })
-        self.updated_at = datetime.datetime.now()
+        self.updated_at = now
     
     def add_mention(self, text_id: str, position: int, context: str) -> None:
         """添加文本提及"""
-        self.mentions.append({
-            "text_id": text_id,
-            "position": position,
-            "context": context,
-            "created_at": datetime.datetime.now()
-        })
-        self.updated_at = datetime.datetime.now()
+        self.add_mentions_batch(text_id, [position], [context])
+    
+    def add_mentions_batch(
+        self,
+        text_id: str,
+        positions: List[int],
+        contexts: List[str],
+        now: Optional[datetime.datetime] = None
+    ) -> None:
+        """
+        批量添加同一文本中的提及，共用一个时间戳
+        
+        参数:
+            text_id: 文本ID
+            positions: 位置列表
+            contexts: 与位置一一对应的上下文列表
+            now: 时间戳，默认取当前时间
+        """
+        now = now or datetime.datetime.now()
+        self.mentions.extend(text_id, positions, contexts, now.timestamp())
+        self.updated_at = now
     
     def to_dict(self) -> Dict[str, Any]:
-        """转换为字典，递归将所有 datetime 字段转为字符串"""
-        def convert(obj):
-            if isinstance(obj, datetime.datetime):
-                return obj.isoformat()
-            if isinstance(obj, list):
-                return [convert(item) for item in obj]
-            if isinstance(obj, dict):
-                return {k: convert(v) for k, v in obj.items()}
-            return obj
-
+        """转换为字典，datetime字段保持原样，由持久化时直接编码"""
         return {
             "id": self.id,
             "name": self.name,
             "type": self.type,
-            "attributes": convert(self.attributes),
-            "relations": convert(self.relations),
-            "mentions": convert(self.mentions),
-            "created_at": self.created_at.isoformat(),
-            "updated_at": self.updated_at.isoformat()
+            "attributes": self.attributes,
+            "relations": self.relations,
+            "mentions": self.mentions.to_list(),
+            "created_at": self.created_at,
+            "updated_at": self.updated_at
         }
     
     @classmethod
     def from_dict(cls, data: Dict[str, Any]) -> 'Entity':
         """从字典创建实体"""
-        entity = cls(data["id"], data["name"], data["type"], data["attributes"])
+        # 子类构造函数不接收类型参数，直接按基类初始化
+        entity = cls.__new__(cls)
+        Entity.__init__(entity, data["id"], data["name"], data["type"], data["attributes"])
         entity.relations = data["relations"]
-        entity.mentions = data["mentions"]
+        entity.mentions = MentionStore.from_list(data["mentions"])
         entity.created_at = datetime.datetime.fromisoformat(data["created_at"])
         entity.updated_at = datetime.datetime.fromisoformat(data["updated_at"])
         return entity
@@ -87,6 +197,8 @@ class Entity:
 class Character(Entity):
     """角色实体"""
     
+    __slots__ = ()
+    
     def __init__(self, entity_id: str, name: str, attributes: Dict[str, Any] = None):
         super().__init__(entity_id, name, "character", attributes)
 
@@ -94,6 +206,8 @@ class Character(Entity):
 class Location(Entity):
     """地点实体"""
     
+    __slots__ = ()
+    
     def __init__(self, entity_id: str, name: str, attributes: Dict[str, Any] = None):
         super().__init__(entity_id, name, "location", attributes)
 
@@ -101,6 +215,8 @@ class Location(Entity):
 class Item(Entity):
     """物品实体"""
     
+    __slots__ = ()
+    
     def __init__(self, entity_id: str, name: str, attributes: Dict[str, Any] = None):
         super().__init__(entity_id, name, "item", attributes)
 
@@ -108,6 +224,8 @@ class Item(Entity):
 class Event(Entity):
     """事件实体"""
     
+    __slots__ = ()
+    
     def __init__(self, entity_id: str, name: str, attributes: Dict[str, Any] = None):
         super().__init__(entity_id, name, "event", attributes)
         if "time" not in self.attributes:
@@ -119,12 +237,27 @@ class Event(Entity):
 class Rule(Entity):
     """世界规则实体"""
     
+    __slots__ = ()
+    
     def __init__(self, entity_id: str, name: str, attributes: Dict[str, Any] = None):
         super().__init__(entity_id, name, "rule", attributes)
         if "description" not in self.attributes:
             self.attributes["description"] = ""
 
 
+# 实体类型 -> 实体类
+_ENTITY_CLASSES = {
+    "character": Character,
+    "location": Location,
+    "item": Item,
+    "event": Event,
+    "rule": Rule,
+}
+
+# 文本中的一次实体提及：(实体, 位置, 上下文)
+Mention = Tuple[Entity, int, str]
+
+
 class KnowledgeGraph:
     """知识图谱管理器"""
 
@@ -159,6 +292,7 @@ class KnowledgeGraph:
     
     def __init__(self, novel_id: str):
         self.novel_id = novel_id
+        self._dir = KNOWLEDGE_GRAPH_DIR  # 创建时确定存储目录，延迟写入也写到同一位置
         self.entities: Dict[str, Entity] = {}
         self.entity_index: Dict[str, Set[str]] = {
             "character": set(),
@@ -168,70 +302,240 @@ class KnowledgeGraph:
             "rule": set()
         }
         self.name_to_id: Dict[str, str] = {}
+        self._id_counters: Dict[str, int] = {entity_type: 0 for entity_type in self.entity_index}  # 各类型已分配的最大编号
+        self._name_automaton = None  # 实体名称的Aho-Corasick自动机，名称变化后重建
+        self._wal_buffer: List[bytes] = []  # 尚未写入修改日志的记录
+        self._bulk_depth = 0  # bulk()嵌套层数，大于0时不自动保存
+        self._last_save = 0.0
+        self._lock = threading.RLock()  # 保护图谱和修改日志缓存，延迟写入在定时器线程中进行
+        self._flush_timer: Optional[threading.Timer] = None  # 防抖间隔结束时写入的定时器
         self._load_graph()
     
     def _get_graph_path(self) -> Path:
-        """获取知识图谱文件路径"""
-        return KNOWLEDGE_GRAPH_DIR / f"{self.novel_id}.json"
+        """获取知识图谱快照文件路径"""
+        return self._dir / f"{self.novel_id}.json"
+    
+    def _get_wal_path(self) -> Path:
+        """获取知识图谱修改日志（JSONL）路径"""
+        return self._dir / f"{self.novel_id}.wal.jsonl"
+    
+    @staticmethod
+    def _entity_from_dict(entity_data: Dict[str, Any]) -> Entity:
+        """按实体类型从字典创建实体，未知类型按基类处理"""
+        return _ENTITY_CLASSES.get(entity_data["type"], Entity).from_dict(entity_data)
+    
+    def _register(self, entity: Entity) -> None:
+        """把实体加入各索引，替换同ID的旧实体"""
+        self._unregister(entity.id)
+        self._track_id(entity)
+        self.entities[entity.id] = entity
+        self.entity_index[entity.type].add(entity.id)
+        self.name_to_id[entity.name] = entity.id
+        self._name_automaton = None
+    
+    def _unregister(self, entity_id: str) -> Optional[Entity]:
+        """把实体从各索引中移除，返回被移除的实体"""
+        entity = self.entities.pop(entity_id, None)
+        if entity is None:
+            return None
+        self.entity_index[entity.type].discard(entity_id)
+        if self.name_to_id.get(entity.name) == entity_id:
+            del self.name_to_id[entity.name]
+        self._name_automaton = None
+        return entity
     
     def _load_graph(self) -> None:
-        """加载知识图谱"""
+        """加载知识图谱：先读快照，再重放快照之后的修改日志"""
         graph_path = self._get_graph_path()
-        if not graph_path.exists():
+        if graph_path.exists():
+            try:
+                data = read_json(graph_path)
+                
+                # 加载实体
+                for entity_data in data.get("entities", []):
+                    self._register(self._entity_from_dict(entity_data))
+            
+            except Exception as e:
+                logging.error(f"加载知识图谱失败: {e}")
+        
+        self._replay_wal()
+    
+    def _replay_wal(self) -> None:
+        """按顺序重放修改日志"""
+        wal_path = self._get_wal_path()
+        if not wal_path.exists():
             return
         
-        try:
-            with open(graph_path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-            
-            # 加载实体
-            for entity_data in data.get("entities", []):
-                entity_type = entity_data["type"]
-                entity_id = entity_data["id"]
-                
-                if entity_type == "character":
-                    entity = Character.from_dict(entity_data)
-                elif entity_type == "location":
-                    entity = Location.from_dict(entity_data)
-                elif entity_type == "item":
-                    entity = Item.from_dict(entity_data)
-                elif entity_type == "event":
-                    entity = Event.from_dict(entity_data)
-                elif entity_type == "rule":
-                    entity = Rule.from_dict(entity_data)
-                else:
-                    entity = Entity.from_dict(entity_data)
-                
-                self.entities[entity_id] = entity
-                self.entity_index[entity_type].add(entity_id)
-                self.name_to_id[entity.name] = entity_id
+        valid_end = 0  # 最后一个完整行的结束位置
+        with open(wal_path, "r+b") as f:
+            for line_no, line in enumerate(f, 1):
+                if not line.endswith(b"\n"):
+                    # 进程中途退出留下写了一半的末行：截掉，否则之后追加的记录会接在同一行上
+                    logging.warning(f"截掉写了一半的知识图谱日志末行 {wal_path.name}:{line_no}")
+                    f.truncate(valid_end)
+                    break
+                valid_end += len(line)
+                try:
+                    record = decode_json(line)
+                    self._apply_record(record["op"], record["payload"], record["ts"])
+                except Exception as e:
+                    logging.warning(f"跳过无法重放的知识图谱日志 {wal_path.name}:{line_no}: {e}")
+    
+    def _apply_record(self, op: str, payload: Dict[str, Any], ts: str) -> None:
+        """把一条修改日志应用到内存中的图谱"""
+        if op == "add_entity":
+            self._register(self._entity_from_dict(payload))
+            return
+        if op == "remove_entity":
+            self._unregister(payload["entity_id"])
+            return
         
-        except Exception as e:
-            logging.error(f"加载知识图谱失败: {e}")
+        entity = self.entities[payload["entity_id"]]
+        if op == "add_relation":
+            entity.relations.append(payload["relation"])
+        elif op == "add_mentions":
+            entity.mentions.extend(payload["text_id"], payload["positions"], payload["contexts"], payload["timestamp"])
+        else:
+            raise ValueError(f"未知操作: {op}")
+        entity.updated_at = datetime.datetime.fromisoformat(ts)
     
+    @_synchronized
     def save_graph(self) -> None:
-        """保存知识图谱"""
+        """保存完整快照并清空修改日志"""
         graph_path = self._get_graph_path()
         
         try:
             data = {
                 "novel_id": self.novel_id,
                 "entities": [entity.to_dict() for entity in self.entities.values()],
-                "updated_at": datetime.datetime.now().isoformat()
+                "updated_at": datetime.datetime.now()
             }
             
-            with open(graph_path, "w", encoding="utf-8") as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
+            write_json(graph_path, data)
+            # 快照已包含日志中的全部修改
+            self._get_wal_path().unlink(missing_ok=True)
+            
+            self._wal_buffer.clear()
+            self._last_save = time.monotonic()
         
         except Exception as e:
             logging.error(f"保存知识图谱失败: {e}")
     
+    def _log(self, op: str, payload: Dict[str, Any], ts: Optional[datetime.datetime] = None) -> None:
+        """
+        记录一条修改
+        
+        修改以JSONL追加到日志，不重写整个图谱；批量操作期间只缓存记录，
+        否则距上次写入超过 SAVE_DEBOUNCE_SECONDS 时立即写入，
+        未超过时启动定时器在间隔结束时写入
+        
+        参数:
+            op: 操作类型（add_entity、remove_entity、add_relation、add_mentions）
+            payload: 操作内容，在此刻编码，之后的修改不会混入
+            ts: 修改时间，默认取当前时间
+        """
+        record = {"op": op, "payload": payload, "ts": ts or datetime.datetime.now()}
+        with self._lock:
+            self._wal_buffer.append(encode_json_line(record))
+            if self._bulk_depth > 0:
+                return
+            delay = SAVE_DEBOUNCE_SECONDS - (time.monotonic() - self._last_save)
+            if delay <= 0:
+                self.flush()
+            elif self._flush_timer is None:
+                self._flush_timer = threading.Timer(delay, self.flush)
+                self._flush_timer.daemon = True
+                self._flush_timer.start()
+    
+    def _wal_too_large(self, wal_path: Path) -> bool:
+        """修改日志相对快照过大时需要合并"""
+        graph_path = self._get_graph_path()
+        snapshot_size = graph_path.stat().st_size if graph_path.exists() else 0
+        return wal_path.stat().st_size > max(snapshot_size * WAL_COMPACT_RATIO, WAL_COMPACT_MIN_BYTES)
+    
+    def flush(self, compact: bool = False) -> None:
+        """
+        把缓存的修改追加到日志
+        
+        参数:
+            compact: 是否同时把日志合并进快照；日志过大时也会自动合并
+        """
+        with self._lock:
+            if self._flush_timer is not None:
+                self._flush_timer.cancel()
+                self._flush_timer = None
+            
+            wal_path = self._get_wal_path()
+            if self._wal_buffer:
+                try:
+                    with open(wal_path, "ab") as f:
+                        f.write(b"".join(self._wal_buffer))
+                    self._wal_buffer.clear()
+                    self._last_save = time.monotonic()
+                except Exception as e:
+                    logging.error(f"写入知识图谱日志失败: {e}")
+                    return
+            
+            if wal_path.exists() and (compact or self._wal_too_large(wal_path)):
+                self.save_graph()
+    
+    @contextmanager
+    def bulk(self) -> Iterator['KnowledgeGraph']:
+        """
+        批量修改上下文：期间的修改只在退出最外层时保存一次
+        
+        用法:
+            with kg.bulk():
+                kg.extract_entities_from_text(text)
+                kg.add_relation(...)
+        """
+        with self._lock:
+            self._bulk_depth += 1
+            try:
+                yield self
+            finally:
+                self._bulk_depth -= 1
+                if self._bulk_depth == 0:
+                    self.flush()
+    
+    def _track_id(self, entity: Entity) -> None:
+        """按实体ID的数字后缀推进对应类型的编号计数"""
+        prefix, _, suffix = entity.id.rpartition("_")
+        if prefix == entity.type and suffix.isdigit():
+            self._id_counters[entity.type] = max(self._id_counters.get(entity.type, 0), int(suffix))
+    
+    def _next_id(self, entity_type: str) -> str:
+        """
+        分配新的实体ID
+        
+        编号只增不减，删除实体后也不会与已有ID冲突
+        
+        参数:
+            entity_type: 实体类型
+        
+        返回:
+            新的实体ID
+        """
+        self._id_counters[entity_type] = self._id_counters.get(entity_type, 0) + 1
+        return f"{entity_type}_{self._id_counters[entity_type]}"
+    
+    @_synchronized
     def add_entity(self, entity: Entity) -> None:
         """添加实体"""
-        self.entities[entity.id] = entity
-        self.entity_index[entity.type].add(entity.id)
-        self.name_to_id[entity.name] = entity.id
-        self.save_graph()
+        existing_id = self.name_to_id.get(entity.name)
+        if existing_id is not None and existing_id != entity.id:
+            logging.warning(f"实体名称重复: {entity.name}，名称索引由 {existing_id} 改为指向 {entity.id}")
+        
+        self._register(entity)
+        self._log("add_entity", entity.to_dict())
+    
+    @_synchronized
+    def remove_entity(self, entity_id: str) -> bool:
+        """删除实体，其他实体指向它的关系保持不变"""
+        if self._unregister(entity_id) is None:
+            return False
+        self._log("remove_entity", {"entity_id": entity_id})
+        return True
     
     def get_entity(self, entity_id: str) -> Optional[Entity]:
         """获取实体"""
@@ -244,42 +548,49 @@ class KnowledgeGraph:
             return self.get_entity(entity_id)
         return None
     
+    @_synchronized
     def get_entities_by_type(self, entity_type: str) -> List[Entity]:
         """获取指定类型的所有实体"""
         entity_ids = self.entity_index.get(entity_type, set())
-        return [self.entities[entity_id] for entity_id in entity_ids if entity_id in self.entities]
+        # 索引与实体表在 _register/_unregister 中同步维护，不再逐个检查是否存在
+        return [self.entities[entity_id] for entity_id in entity_ids]
     
+    @_synchronized
     def add_character(self, name: str, attributes: Dict[str, Any] = None) -> Character:
         """添加角色"""
-        entity_id = f"character_{len(self.entity_index['character']) + 1}"
+        entity_id = self._next_id("character")
         character = Character(entity_id, name, attributes)
         self.add_entity(character)
         return character
     
+    @_synchronized
     def add_location(self, name: str, attributes: Dict[str, Any] = None) -> Location:
         """添加地点"""
-        entity_id = f"location_{len(self.entity_index['location']) + 1}"
+        entity_id = self._next_id("location")
         location = Location(entity_id, name, attributes)
         self.add_entity(location)
         return location
     
+    @_synchronized
     def add_item(self, name: str, attributes: Dict[str, Any] = None) -> Item:
         """添加物品"""
-        entity_id = f"item_{len(self.entity_index['item']) + 1}"
+        entity_id = self._next_id("item")
         item = Item(entity_id, name, attributes)
         self.add_entity(item)
         return item
     
+    @_synchronized
     def add_event(self, name: str, attributes: Dict[str, Any] = None) -> Event:
         """添加事件"""
-        entity_id = f"event_{len(self.entity_index['event']) + 1}"
+        entity_id = self._next_id("event")
         event = Event(entity_id, name, attributes)
         self.add_entity(event)
         return event
     
+    @_synchronized
     def add_rule(self, name: str, description: str, attributes: Dict[str, Any] = None) -> Rule:
         """添加世界规则"""
-        entity_id = f"rule_{len(self.entity_index['rule']) + 1}"
+        entity_id = self._next_id("rule")
         if attributes is None:
             attributes = {}
         attributes["description"] = description
@@ -287,6 +598,7 @@ class KnowledgeGraph:
         self.add_entity(rule)
         return rule
     
+    @_synchronized
     def add_relation(self, source_id: str, relation_type: str, target_id: str, attributes: Dict[str, Any] = None) -> bool:
         """添加关系"""
         source = self.get_entity(source_id)
@@ -296,35 +608,110 @@ class KnowledgeGraph:
             return False
         
         source.add_relation(relation_type, target_id, attributes)
-        self.save_graph()
+        self._log("add_relation", {"entity_id": source_id, "relation": source.relations[-1]}, source.updated_at)
         return True
     
-    def extract_entities_from_text(self, text: str, text_id: str = None) -> List[Tuple[Entity, int, str]]:
-        """从文本中提取实体（简单实现）"""
-        if text_id is None:
-            text_id = f"text_{datetime.datetime.now().timestamp()}"
+    def _find_names(self, text: str) -> Dict[str, List[int]]:
+        """
+        查找文本中出现的实体名称
+        
+        自动机可用时一次扫描文本匹配所有名称，不随实体数量重复扫描
+        
+        参数:
+            text: 文本
+        
+        返回:
+            名称 -> 按先后排列的全部出现位置
+        """
+        positions: Dict[str, List[int]] = {}
+        if not AHOCORASICK_AVAILABLE or not self.name_to_id:
+            for name in self.name_to_id:
+                start = text.find(name)
+                while start != -1:
+                    positions.setdefault(name, []).append(start)
+                    start = text.find(name, start + 1)
+            return positions
         
-        results = []
+        if self._name_automaton is None:
+            automaton = ahocorasick.Automaton()
+            for name in self.name_to_id:
+                automaton.add_word(name, name)
+            automaton.make_automaton()
+            self._name_automaton = automaton
+        
+        # 匹配按结束位置递增产生，同一名称的位置天然有序
+        for end, name in self._name_automaton.iter(text):
+            positions.setdefault(name, []).append(end - len(name) + 1)
+        return positions
+    
+    @_synchronized
+    def scan(self, text: str) -> List[Mention]:
+        """
+        一次扫描找出文本中的全部实体提及，不修改知识图谱
+        
+        参数:
+            text: 文本
+        
+        返回:
+            (实体, 位置, 上下文) 列表
+        """
+        mentions = []
         
         # 简单的名称匹配（实际应用中应使用 NER 模型）
-        for name, entity_id in self.name_to_id.items():
-            if name in text:
-                entity = self.get_entity(entity_id)
-                position = text.find(name)
-                context = text[max(0, position - 20):min(len(text), position + len(name) + 20)]
-                
-                # 添加提及
-                entity.add_mention(text_id, position, context)
-                
-                results.append((entity, position, context))
+        for name, name_positions in self._find_names(text).items():
+            entity = self.get_entity(self.name_to_id[name])
+            # 切片会自动截断超出文本末尾的结束位置，只需处理起点
+            tail = len(name) + CONTEXT_WINDOW
+            mentions.extend(
+                (entity, position, text[position - CONTEXT_WINDOW if position > CONTEXT_WINDOW else 0:position + tail])
+                for position in name_positions
+            )
+        return mentions
+    
+    @_synchronized
+    def commit_mentions(self, mentions: List[Mention], text_id: str = None) -> None:
+        """
+        把scan()得到的提及记录到对应实体
+        
+        参数:
+            mentions: (实体, 位置, 上下文) 列表
+            text_id: 文本ID，默认按当前时间生成
+        """
+        if not mentions:
+            return
+        now = datetime.datetime.now()
+        if text_id is None:
+            text_id = f"text_{now.timestamp()}"
         
-        self.save_graph()
-        return results
+        grouped: Dict[str, Tuple[Entity, List[int], List[str]]] = {}
+        for entity, position, context in mentions:
+            _, positions, contexts = grouped.setdefault(entity.id, (entity, [], []))
+            positions.append(position)
+            contexts.append(context)
+        
+        # 每个实体的新增提及一次写入并记为一条日志，整批共用一个时间戳
+        for entity, positions, contexts in grouped.values():
+            entity.add_mentions_batch(text_id, positions, contexts, now)
+            self._log("add_mentions", {
+                "entity_id": entity.id,
+                "text_id": text_id,
+                "positions": positions,
+                "contexts": contexts,
+                "timestamp": now.timestamp()
+            }, now)
+    
+    @_synchronized
+    def extract_entities_from_text(self, text: str, text_id: str = None) -> List[Mention]:
+        """从文本中提取实体（简单实现），每一处出现都记为一次提及"""
+        mentions = self.scan(text)
+        self.commit_mentions(mentions, text_id)
+        return mentions
     
-    def check_consistency(self, text: str) -> List[Dict[str, Any]]:
-        """检查文本与知识图谱的一致性"""
+    def check_consistency(self, text: str, mentions: Optional[List[Mention]] = None) -> List[Dict[str, Any]]:
+        """检查文本与知识图谱的一致性，mentions 为已扫描的实体提及时不再重复扫描"""
         # 提取实体
-        entities = self.extract_entities_from_text(text)
+        if mentions is None:
+            mentions = self.scan(text)
         
         # 检查一致性问题
         issues = []
@@ -335,11 +722,43 @@ class KnowledgeGraph:
         return issues
 
 
-# 全局知识图谱管理器
-_knowledge_graphs: Dict[str, KnowledgeGraph] = {}
+# 全局知识图谱管理器：按最近使用顺序缓存，超出上限时保存并淘汰最久未用的图谱
+_knowledge_graphs: "OrderedDict[str, KnowledgeGraph]" = OrderedDict()
+_knowledge_graphs_lock = threading.Lock()
+# 所有仍被引用的图谱（含已淘汰但调用方还持有的），保证同一小说始终只有一个实例
+_live_graphs: "weakref.WeakValueDictionary[str, KnowledgeGraph]" = weakref.WeakValueDictionary()
 
 def get_knowledge_graph(novel_id: str) -> KnowledgeGraph:
-    """获取知识图谱"""
-    if novel_id not in _knowledge_graphs:
-        _knowledge_graphs[novel_id] = KnowledgeGraph(novel_id)
-    return _knowledge_graphs[novel_id]
+    """
+    获取知识图谱，并发调用时同一小说只加载一次
+    
+    已被淘汰但仍被调用方持有的图谱重新放回缓存，不会再加载第二个实例，
+    避免两个实例追加和合并同一份修改日志
+    """
+    evicted = []
+    with _knowledge_graphs_lock:
+        kg = _knowledge_graphs.get(novel_id)
+        if kg is not None:
+            _knowledge_graphs.move_to_end(novel_id)
+            return kg
+        
+        kg = _live_graphs.get(novel_id)
+        if kg is None:
+            kg = KnowledgeGraph(novel_id)
+            _live_graphs[novel_id] = kg
+        _knowledge_graphs[novel_id] = kg
+        while len(_knowledge_graphs) > settings.knowledge_graph_cache_size:
+            evicted.append(_knowledge_graphs.popitem(last=False)[1])
+    
+    for old in evicted:
+        old.flush()
+    return kg
+
+
+@atexit.register
+def _flush_knowledge_graphs() -> None:
+    """退出时写入所有知识图谱中尚未保存的修改，并把修改日志合并进快照"""
+    with _knowledge_graphs_lock:
+        graphs = list(_knowledge_graphs.values())
+    for kg in graphs:
+        kg.flush(compact=True)
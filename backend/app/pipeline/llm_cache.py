@@ -0,0 +1,395 @@
+"""
+LLM响应缓存 - 语义相近的生成请求直接复用已有的模型输出
+"""
+import json
+import time
+import hashlib
+import threading
+import logging
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Callable, Dict, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from app.config import settings
+
+# 日志配置由应用入口统一完成，这里只获取记录器
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """
+    规范化用于缓存键的文本：统一Unicode组合形式并去掉首尾空白，
+    避免同一内容因编码形式或空白差异而未命中
+    
+    参数:
+        text: 原始文本
+    
+    返回:
+        规范化后的文本
+    """
+    return unicodedata.normalize("NFC", text).strip()
+
+
+def _digest(payload: Dict[str, Any]) -> str:
+    """计算键内容的SHA-256摘要"""
+    data = json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class CacheKey(NamedTuple):
+    """响应缓存键"""
+    text: str    # 语义匹配用的键文本（只含写作要求）
+    digest: str  # 精确匹配用的SHA-256摘要
+    scope: str   # 除写作要求外其余部分的摘要，语义匹配要求完全相同
+
+
+def make_key(
+    model: str,
+    system_prompt: str,
+    context: str,
+    prompt: str,
+    params: Dict[str, Any]
+) -> CacheKey:
+    """
+    构建响应缓存键
+    
+    精确匹配的摘要覆盖全部内容（不含api_key、请求ID等无关参数）。
+    上下文很长而写作要求很短，把两者一起向量化会让同一上下文下的不同要求
+    互相命中，因此语义匹配只向量化写作要求，其余部分必须摘要完全相同
+    
+    参数:
+        model: 模型名称
+        system_prompt: 系统提示词
+        context: 上下文
+        prompt: 写作要求
+        params: 生成参数
+    
+    返回:
+        CacheKey对象
+    """
+    text = normalize_text(prompt)
+    scope = {
+        "model": model,
+        "system": normalize_text(system_prompt),
+        "context": normalize_text(context),
+        "params": params
+    }
+    return CacheKey(text, _digest({**scope, "prompt": text}), _digest(scope))
+
+
+class ExactCache:
+    """
+    精确匹配缓存
+    
+    进程内LRU在微秒级返回完全相同的请求；缓存类型配置为Redis时再镜像到Redis，
+    供多个工作进程共享
+    """
+    
+    def __init__(self, maxsize: int = 4096, ttl: int = 86400, use_redis: bool = False):
+        """
+        初始化精确匹配缓存
+        
+        参数:
+            maxsize: 进程内最大缓存条目数
+            ttl: 条目有效期（秒）
+            use_redis: 是否镜像到Redis
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._use_redis = use_redis
+        self._remote = None
+    
+    def _get_remote(self):
+        """延迟连接Redis，不可用时返回None"""
+        if self._use_redis and self._remote is None:
+            from app.cache.redis_cache import redis_cache
+            if redis_cache.client is None:
+                logger.warning("Redis不可用，LLM精确匹配缓存只保存在进程内")
+                self._use_redis = False
+                return None
+            self._remote = redis_cache
+        return self._remote
+    
+    def get(self, digest: str) -> Optional[str]:
+        """
+        查找完全相同请求的缓存响应
+        
+        参数:
+            digest: 请求摘要
+        
+        返回:
+            缓存的响应，未命中返回None
+        """
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                response, expires_at = entry
+                if expires_at >= time.time():
+                    self._entries.move_to_end(digest)
+                    return response
+                del self._entries[digest]
+        
+        remote = self._get_remote()
+        if remote is None:
+            return None
+        response = remote.get(f"llm:{digest}")
+        if response is not None:
+            # 其他进程写入的响应，回填进程内缓存
+            self._put_local(digest, response)
+        return response
+    
+    def put(self, digest: str, response: str) -> None:
+        """
+        写入缓存响应
+        
+        参数:
+            digest: 请求摘要
+            response: 模型响应
+        """
+        self._put_local(digest, response)
+        remote = self._get_remote()
+        if remote is not None:
+            remote.set(f"llm:{digest}", response, self.ttl)
+    
+    def _put_local(self, digest: str, response: str) -> None:
+        """写入进程内LRU，超出容量时淘汰最久未使用的条目"""
+        with self._lock:
+            self._entries[digest] = (response, time.time() + self.ttl)
+            self._entries.move_to_end(digest)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+    
+    def clear(self) -> None:
+        """清空进程内缓存"""
+        with self._lock:
+            self._entries.clear()
+
+
+class SemanticCache:
+    """
+    语义缓存
+    
+    键文本的向量存放在预分配的矩阵中（环形覆盖最旧的条目），查询时一次矩阵乘法
+    算出与所有缓存条目的余弦相似度，范围相同且超过阈值即视为命中
+    """
+    
+    def __init__(
+        self,
+        maxsize: int = 1024,
+        ttl: int = 86400,
+        threshold: float = 0.92,
+        embed: Optional[Callable[[str], np.ndarray]] = None
+    ):
+        """
+        初始化语义缓存
+        
+        参数:
+            maxsize: 最大缓存条目数
+            ttl: 条目有效期（秒）
+            threshold: 命中所需的最小余弦相似度
+            embed: 文本向量化函数，默认使用 app.embeddings.get_embedding
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.threshold = threshold
+        self._embed = embed
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.ndarray] = None
+        self._expires = np.zeros(maxsize, dtype=np.float64)
+        self._responses: list = [None] * maxsize
+        self._scopes: list = [None] * maxsize
+        self._size = 0
+        self._next = 0
+        self.hits = 0
+        self.misses = 0
+    
+    def embed(self, key_text: str) -> np.ndarray:
+        """
+        计算键文本的单位向量
+        
+        参数:
+            key_text: 键文本
+        
+        返回:
+            归一化的float32向量
+        """
+        if self._embed is None:
+            # 延迟导入，避免导入本模块时就加载嵌入模型
+            from app.embeddings import get_embedding
+            self._embed = get_embedding
+        
+        vector = np.asarray(self._embed(key_text), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+    
+    def lookup(
+        self,
+        key_text: str,
+        vector: Optional[np.ndarray] = None,
+        scope: str = ""
+    ) -> Optional[str]:
+        """
+        查找语义相近的缓存响应
+        
+        参数:
+            key_text: 键文本
+            vector: 已计算好的键向量，为None时现场计算
+            scope: 匹配范围，只在写入时范围相同的条目中查找
+        
+        返回:
+            命中时返回缓存的响应，否则返回None
+        """
+        if self._size == 0:
+            self.misses += 1
+            return None
+        
+        if vector is None:
+            vector = self.embed(key_text)
+        
+        with self._lock:
+            size = self._size
+            similarities = self._vectors[:size] @ vector
+            # 过期条目和范围不同的条目不参与匹配
+            similarities[self._expires[:size] < time.time()] = -1.0
+            other_scope = np.fromiter(
+                (entry != scope for entry in self._scopes[:size]), dtype=bool, count=size
+            )
+            similarities[other_scope] = -1.0
+            best = int(np.argmax(similarities))
+            if similarities[best] >= self.threshold:
+                self.hits += 1
+                return self._responses[best]
+        
+        self.misses += 1
+        return None
+    
+    def put(
+        self,
+        key_text: str,
+        response: str,
+        vector: Optional[np.ndarray] = None,
+        scope: str = ""
+    ) -> None:
+        """
+        写入缓存响应
+        
+        参数:
+            key_text: 键文本
+            response: 模型响应
+            vector: 已计算好的键向量，为None时现场计算
+            scope: 匹配范围
+        """
+        if vector is None:
+            vector = self.embed(key_text)
+        
+        with self._lock:
+            if self._vectors is None:
+                self._vectors = np.zeros((self.maxsize, vector.shape[0]), dtype=np.float32)
+            
+            slot = self._next
+            self._vectors[slot] = vector
+            self._expires[slot] = time.time() + self.ttl
+            self._responses[slot] = response
+            self._scopes[slot] = scope
+            self._next = (slot + 1) % self.maxsize
+            self._size = min(self._size + 1, self.maxsize)
+    
+    def clear(self) -> None:
+        """清空缓存"""
+        with self._lock:
+            self._responses = [None] * self.maxsize
+            self._scopes = [None] * self.maxsize
+            self._size = 0
+            self._next = 0
+    
+    def cache_info(self) -> dict:
+        """返回缓存统计信息"""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": self._size,
+            "maxsize": self.maxsize
+        }
+
+
+# 全局LLM响应缓存实例
+response_cache = SemanticCache(
+    maxsize=settings.llm_cache_size,
+    ttl=settings.llm_cache_ttl,
+    threshold=settings.llm_cache_threshold
+)
+
+# 全局精确匹配缓存实例
+exact_cache = ExactCache(
+    ttl=settings.llm_cache_ttl,
+    use_redis=settings.cache_type.value == "redis"
+)
+
+
+def lookup_exact(key: CacheKey) -> Optional[str]:
+    """
+    只做精确匹配查找
+    
+    参数:
+        key: 缓存键
+    
+    返回:
+        命中的响应，未命中或缓存关闭时返回None
+    """
+    if not settings.llm_cache_enabled:
+        return None
+    return exact_cache.get(key.digest)
+
+
+def lookup_semantic(key: CacheKey) -> Tuple[Optional[str], Optional[np.ndarray]]:
+    """
+    计算键向量并做语义匹配查找
+    
+    参数:
+        key: 缓存键
+    
+    返回:
+        (命中的响应或None, 键向量；语义缓存关闭时为None)
+    """
+    if not (settings.llm_cache_enabled and settings.llm_semantic_cache_enabled):
+        return None, None
+    
+    vector = response_cache.embed(key.text)
+    return response_cache.lookup(key.text, vector, key.scope), vector
+
+
+def lookup(key: CacheKey) -> Tuple[Optional[str], Optional[np.ndarray]]:
+    """
+    两级查找缓存响应：先精确匹配，未命中再计算向量做语义匹配
+    
+    参数:
+        key: 缓存键
+    
+    返回:
+        (命中的响应或None, 键向量；精确命中或语义缓存关闭时为None)
+    """
+    cached = lookup_exact(key)
+    if cached is not None:
+        return cached, None
+    return lookup_semantic(key)
+
+
+def store(key: CacheKey, response: str, vector: Optional[np.ndarray] = None) -> None:
+    """
+    把模型响应写入两级缓存
+    
+    参数:
+        key: 缓存键
+        response: 模型响应
+        vector: lookup返回的键向量，为None时现场计算
+    """
+    if not settings.llm_cache_enabled:
+        return
+    
+    exact_cache.put(key.digest, response)
+    if settings.llm_semantic_cache_enabled:
+        response_cache.put(key.text, response, vector, key.scope)
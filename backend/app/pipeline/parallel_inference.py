@@ -1,76 +1,123 @@
 """
 并行推理模块：使用 Ray 或类似框架并行处理多个章节或场景
 """
+import re
 import logging
+import multiprocessing
 from typing import List, Dict, Any, Callable, Optional
 import concurrent.futures
 from functools import partial
 
-# 注意：实际应用中应该安装并导入 Ray
-# import ray
+from app.config import settings
 
-# 模拟 Ray 初始化
-# ray.init(ignore_reinit_error=True)
+# 尝试导入 Ray，未安装时 ray 后端退回进程池
+try:
+    import ray
+    RAY_AVAILABLE = True
+except ImportError:
+    logging.warning("Ray未安装，ray并行后端将使用进程池")
+    RAY_AVAILABLE = False
 
-def parallel_generate(
+PARALLEL_BACKENDS = ("thread", "process", "ray")
+
+# 段落分隔符
+_PARAGRAPH_SEPARATOR = "\n\n"
+_PARAGRAPH_BREAK = re.compile(_PARAGRAPH_SEPARATOR)
+
+_remote_generate = None
+
+
+def _call_generator(generator_func: Callable, data: Dict[str, Any], context: str) -> str:
+    """在工作线程/进程中调用生成器函数，出错时返回空字符串"""
+    try:
+        return generator_func(data, context)
+    except Exception as e:
+        logging.error(f"并行生成出错: {e}")
+        return ""
+
+
+def _executor_generate(
+    executor: concurrent.futures.Executor,
+    generator_func: Callable,
+    data_list: List[Dict[str, Any]],
+    context_list: List[str]
+) -> List[str]:
+    """用线程池或进程池执行生成任务，结果顺序与输入一致"""
+    with executor:
+        return list(executor.map(partial(_call_generator, generator_func), data_list, context_list))
+
+
+def ray_parallel_generate(
     generator_func: Callable,
     data_list: List[Dict[str, Any]],
     context_list: List[str],
     max_workers: int = 4
 ) -> List[str]:
     """
-    并行调用生成器函数
+    使用 Ray 并行调用生成器函数
     
     Args:
-        generator_func: 生成器函数
+        generator_func: 生成器函数（需为模块级函数以便序列化）
         data_list: 数据列表
         context_list: 上下文列表
-        max_workers: 最大工作线程数
+        max_workers: Ray 可使用的 CPU 数
         
     Returns:
         List[str]: 生成结果列表
     """
-    results = []
-    
-    # 使用 ThreadPoolExecutor 模拟并行处理
-    # 实际应用中应该使用 Ray 或其他分布式计算框架
-    with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
-        # 创建任务列表
-        futures = []
-        for data, context in zip(data_list, context_list):
-            futures.append(executor.submit(generator_func, data, context))
-        
-        # 收集结果
-        for future in concurrent.futures.as_completed(futures):
-            try:
-                result = future.result()
-                results.append(result)
-            except Exception as e:
-                logging.error(f"并行生成出错: {e}")
-                results.append("")
+    global _remote_generate
+    ray.init(ignore_reinit_error=True, num_cpus=max_workers)
+    if _remote_generate is None:
+        _remote_generate = ray.remote(num_cpus=1)(_call_generator)
     
-    return results
+    remote_tasks = [
+        _remote_generate.remote(generator_func, data, context)
+        for data, context in zip(data_list, context_list)
+    ]
+    return ray.get(remote_tasks)
 
-# Ray 版本的实现（注释掉，因为需要安装 Ray）
-"""
-@ray.remote
-def _remote_generate(generator_func, data, context):
-    return generator_func(data, context)
 
-def ray_parallel_generate(
+def parallel_generate(
     generator_func: Callable,
     data_list: List[Dict[str, Any]],
-    context_list: List[str]
+    context_list: List[str],
+    max_workers: int = 4,
+    backend: Optional[str] = None
 ) -> List[str]:
-    # 将生成器函数包装为 Ray 远程函数
-    remote_tasks = []
-    for data, context in zip(data_list, context_list):
-        remote_tasks.append(_remote_generate.remote(generator_func, data, context))
+    """
+    并行调用生成器函数
     
-    # 并行执行并等待结果
-    results = ray.get(remote_tasks)
-    return results
-"""
+    调用远程模型API的生成器是IO密集型，线程即可并行；本地模型等CPU密集型
+    生成器受GIL限制，应通过 NOVELFORGE_PARALLEL_BACKEND 切换为 process 或 ray
+    
+    Args:
+        generator_func: 生成器函数
+        data_list: 数据列表
+        context_list: 上下文列表
+        max_workers: 最大工作线程/进程数
+        backend: 并行后端（thread、process、ray），默认读取配置
+        
+    Returns:
+        List[str]: 生成结果列表，顺序与输入一致
+    """
+    backend = backend or settings.parallel_backend
+    if backend not in PARALLEL_BACKENDS:
+        logging.warning(f"未知的并行后端: {backend}，使用线程池")
+        backend = "thread"
+    
+    if backend == "ray" and RAY_AVAILABLE:
+        return ray_parallel_generate(generator_func, data_list, context_list, max_workers)
+    
+    if backend in ("process", "ray"):
+        # spawn 启动的子进程不继承父进程的线程和锁状态
+        executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=max_workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    else:
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=max_workers)
+    
+    return _executor_generate(executor, generator_func, data_list, context_list)
 
 def split_into_chunks(
     user_prompt: str,
@@ -91,8 +138,9 @@ def split_into_chunks(
     # 这里是简化的实现
     # 实际应用中应该根据语义边界（如段落、场景）拆分
     
-    # 将上下文按段落拆分
-    paragraphs = full_context.split('\n\n')
+    # 记录每个段落在原文中的起始位置，块内容直接从原文切片，不再拆分后重新拼接
+    starts = [0] + [match.end() for match in _PARAGRAPH_BREAK.finditer(full_context)]
+    paragraph_count = len(starts)
     
     data_list = []
     context_list = []
@@ -105,22 +153,19 @@ def split_into_chunks(
     }
     
     # 如果段落数量少于 chunk_size，直接返回一个块
-    if len(paragraphs) <= chunk_size:
+    if paragraph_count <= chunk_size:
         data_list.append(base_data)
         context_list.append(full_context)
         return data_list, context_list
     
     # 否则，将段落拆分为多个块
-    for i in range(0, len(paragraphs), chunk_size):
-        chunk_paragraphs = paragraphs[i:i+chunk_size]
-        chunk_context = '\n\n'.join(chunk_paragraphs)
-        
-        # 复制基础数据并添加块索引
-        chunk_data = base_data.copy()
-        chunk_data["chunk_index"] = i // chunk_size
-        chunk_data["total_chunks"] = (len(paragraphs) + chunk_size - 1) // chunk_size
+    total_chunks = (paragraph_count + chunk_size - 1) // chunk_size
+    for i in range(0, paragraph_count, chunk_size):
+        next_start = i + chunk_size
+        # 块结束于下一块首段之前的分隔符处
+        end = starts[next_start] - len(_PARAGRAPH_SEPARATOR) if next_start < paragraph_count else len(full_context)
         
-        data_list.append(chunk_data)
-        context_list.append(chunk_context)
+        data_list.append({**base_data, "chunk_index": i // chunk_size, "total_chunks": total_chunks})
+        context_list.append(full_context[starts[i]:end])
     
     return data_list, context_list
@@ -1,4 +1,36 @@
-from typing import Dict, Any
+from functools import lru_cache
+from typing import Dict, Any, Tuple
+
+# 预设风格：名称 -> (描述, 向量)
+STYLE_PRESETS = {
+    "金庸": ("模仿金庸武侠小说风格", (0.1, 0.9, 0.2)),
+    "硬科幻": ("技术细节丰富，逻辑严谨", (0.8, 0.2, 0.7)),
+    "默认": ("通用写作风格", (0.5, 0.5, 0.5)),
+}
+
+
+@lru_cache(maxsize=1024)
+def _classify_intent(user_prompt: str) -> Tuple[str, str]:
+    """按规则识别意图，结果只与输入有关，重复的提示直接命中缓存"""
+    # 英文前缀只需比较开头几个字符，不必把整个提示转为小写
+    prefix = user_prompt[:7].lower()
+    if "开始新章节" in user_prompt or prefix.startswith("chapter"):
+        return "start_chapter", "chapter"
+    if "场景：" in user_prompt or prefix.startswith("scene"):
+        return "generate_scene", "scene"
+    if '"' in user_prompt:
+        return "generate_dialogue", "dialogue"
+    return "generate_paragraph", "paragraph"
+
+
+@lru_cache(maxsize=1024)
+def _match_style(user_prompt: str) -> str:
+    """按关键词匹配预设风格名称"""
+    if "金庸" in user_prompt:
+        return "金庸"
+    if "科幻" in user_prompt:
+        return "硬科幻"
+    return "默认"
 
 
 def intent_recognition(user_prompt: str) -> Dict[str, Any]:
@@ -8,18 +40,7 @@ def intent_recognition(user_prompt: str) -> Dict[str, Any]:
     """
     # TODO: 实现意图识别逻辑
     # 示例：简单规则匹配
-    if "开始新章节" in user_prompt or user_prompt.lower().startswith("chapter"):
-        intent = "start_chapter"
-        chunk_type = "chapter"
-    elif "场景：" in user_prompt or user_prompt.lower().startswith("scene"):
-        intent = "generate_scene"
-        chunk_type = "scene"
-    elif '"' in user_prompt:
-        intent = "generate_dialogue"
-        chunk_type = "dialogue"
-    else:
-        intent = "generate_paragraph"
-        chunk_type = "paragraph"
+    intent, chunk_type = _classify_intent(user_prompt)
     return {"intent": intent, "chunk_type": chunk_type}
 
 
@@ -38,13 +59,10 @@ def style_embedding(user_prompt: str) -> Dict[str, Any]:
     可以使用预训练模型提取或匹配预设风格。
     """
     # TODO: 实现真正的风格提取或匹配逻辑
-    # 示例：基于关键词的简单模拟
-    if "金庸" in user_prompt:
-        return {"name": "金庸", "description": "模仿金庸武侠小说风格", "vector": [0.1, 0.9, 0.2]} 
-    elif "科幻" in user_prompt:
-        return {"name": "硬科幻", "description": "技术细节丰富，逻辑严谨", "vector": [0.8, 0.2, 0.7]}
-    else:
-        return {"name": "默认", "description": "通用写作风格", "vector": [0.5, 0.5, 0.5]}
+    # 示例：基于关键词的简单模拟；每次返回新的字典，调用方修改不会影响缓存
+    name = _match_style(user_prompt)
+    description, vector = STYLE_PRESETS[name]
+    return {"name": name, "description": description, "vector": list(vector)}
 
 
 def parse_input(user_prompt: str) -> Dict[str, Any]:
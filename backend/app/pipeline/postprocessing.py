@@ -1,4 +1,27 @@
-from typing import Any, Dict
+import re
+from typing import Any, Callable, Dict
+
+# 各风格的词语替换规则
+STYLE_REPLACEMENTS: Dict[str, Dict[str, str]] = {
+    "金庸": {"说": "道", "很": "甚是"},
+}
+
+
+def _compile_replacements(mapping: Dict[str, str]) -> Callable[[str], str]:
+    """
+    把替换规则编译为一次扫描完成全部替换的函数
+    
+    键都是单个字符时用 str.translate，否则用编译好的正则交替式（长词优先）
+    """
+    if all(len(key) == 1 for key in mapping):
+        table = str.maketrans(mapping)
+        return lambda text: text.translate(table)
+    pattern = re.compile("|".join(map(re.escape, sorted(mapping, key=len, reverse=True))))
+    return lambda text: pattern.sub(lambda match: mapping[match.group(0)], text)
+
+
+# 模块加载时预编译，运行时开销与规则数量无关
+_STYLE_REWRITERS = {name: _compile_replacements(mapping) for name, mapping in STYLE_REPLACEMENTS.items()}
 
 
 def polish_text(text: str) -> str:
@@ -22,14 +45,10 @@ def style_transfer_text(text: str, style_info: Dict[str, Any]) -> str:
         # 模拟应用风格
         # 实际应用中，这里会调用模型或根据 vector 调整文本
         prefix = f"[{style_name}风格] "
-        # 简单替换一些词语或添加风格标记
-        if style_name == "金庸":
-            # 只是非常粗糙的模拟
-            modified_text = text.replace("说", "道").replace("很", "甚是")
-            return prefix + modified_text
-        elif style_name == "硬科幻":
-            modified_text = text # 保持原样，仅加前缀
-            return prefix + modified_text
+        # 简单替换一些词语或添加风格标记（只是非常粗糙的模拟）
+        rewrite = _STYLE_REWRITERS.get(style_name)
+        if rewrite is not None:
+            return prefix + rewrite(text)
         else:
             return prefix + text # 其他风格只加前缀
     else:
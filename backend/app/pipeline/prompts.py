@@ -0,0 +1,26 @@
+"""
+提示词 - 所有模型调用共用的系统提示词和各创作环节的角色说明
+"""
+
+# 规范系统提示词：所有调用都把它原样放在消息首位，模型服务端可以复用这段前缀的KV缓存。
+# 各调用处必须逐字节一致，不要在调用处拼接或改写
+SYSTEM_PROMPT = "你是一位专业中文小说创作助手，擅长策划故事大纲、创作章节正文和润色文本，请根据上下文和风格要求生成高质量中文小说内容。"
+
+# 各创作环节的角色说明放在用户消息开头，不影响系统提示词前缀
+OUTLINE_ROLE = "【当前角色】小说策划，擅长创作引人入胜的故事大纲。"
+NOVELIST_ROLE = "【当前角色】小说家，擅长创作引人入胜的故事。"
+EDITOR_ROLE = "【当前角色】文学编辑，擅长优化文本质量，提升语言表达的生动性和美感。"
+
+
+def with_role(role: str, prompt: str) -> str:
+    """
+    把角色说明加到用户提示开头
+    
+    参数:
+        role: 角色说明
+        prompt: 用户提示
+    
+    返回:
+        带角色说明的用户提示
+    """
+    return f"{role}\n{prompt}"
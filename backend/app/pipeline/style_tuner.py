@@ -1,10 +1,12 @@
 from typing import Dict, Any, List, Optional
 import datetime
 import os
-import json
+import atexit
 import logging
 from pathlib import Path
 
+from app.utils.json_utils import decode_json, encode_json_line, read_json, write_json
+
 # 风格样本存储路径
 STYLE_SAMPLES_DIR = Path("./data/style_samples")
 STYLE_MODELS_DIR = Path("./data/style_models")
@@ -13,31 +15,75 @@ STYLE_MODELS_DIR = Path("./data/style_models")
 STYLE_SAMPLES_DIR.mkdir(parents=True, exist_ok=True)
 STYLE_MODELS_DIR.mkdir(parents=True, exist_ok=True)
 
+# 元数据快照及其后的修改日志（JSONL，每次修改追加一行）
+METADATA_PATH = STYLE_SAMPLES_DIR / "metadata.json"
+METADATA_LOG_PATH = STYLE_SAMPLES_DIR / "metadata.jsonl"
+
+# 修改日志累计该条数后合并进快照
+METADATA_COMPACT_EVERY = 100
+
 
 class StyleTuner:
     """风格微调器：处理用户上传的样本文本，并基于样本微调风格模型"""
     
     def __init__(self):
         self.styles_metadata = {}
+        self._log_count = 0  # 快照之后追加的修改条数
         self._load_styles_metadata()
     
     def _load_styles_metadata(self):
-        """加载已有的风格元数据"""
-        metadata_path = STYLE_SAMPLES_DIR / "metadata.json"
-        if metadata_path.exists():
+        """加载已有的风格元数据：先读快照，再重放修改日志"""
+        if METADATA_PATH.exists():
             try:
-                with open(metadata_path, "r", encoding="utf-8") as f:
-                    self.styles_metadata = json.load(f)
+                self.styles_metadata = read_json(METADATA_PATH)
             except Exception as e:
                 logging.error(f"加载风格元数据失败: {e}")
                 self.styles_metadata = {}
+        
+        if METADATA_LOG_PATH.exists():
+            valid_end = 0  # 最后一个完整行的结束位置
+            with open(METADATA_LOG_PATH, "r+b") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        # 进程中途退出留下写了一半的末行：截掉，否则之后追加的修改会接在同一行上
+                        logging.warning("截掉写了一半的风格元数据日志末行")
+                        f.truncate(valid_end)
+                        break
+                    valid_end += len(line)
+                    try:
+                        record = decode_json(line)
+                        self.styles_metadata.setdefault(record["style_name"], {}).update(record["delta"])
+                        self._log_count += 1
+                    except Exception as e:
+                        logging.warning(f"跳过无法重放的风格元数据日志: {e}")
+    
+    def _update_styles_metadata(self, style_name: str, delta: Dict[str, Any]):
+        """
+        更新一个风格的元数据，只把变化的字段追加到修改日志
+        
+        Args:
+            style_name: 风格名称
+            delta: 变化的字段
+        """
+        self.styles_metadata.setdefault(style_name, {}).update(delta)
+        record = {"op": "update", "style_name": style_name, "delta": delta, "ts": datetime.datetime.now()}
+        try:
+            with open(METADATA_LOG_PATH, "ab") as f:
+                f.write(encode_json_line(record))
+        except Exception as e:
+            logging.error(f"写入风格元数据日志失败: {e}")
+            return
+        
+        self._log_count += 1
+        if self._log_count >= METADATA_COMPACT_EVERY:
+            self._compact_metadata()
     
-    def _save_styles_metadata(self):
-        """保存风格元数据"""
-        metadata_path = STYLE_SAMPLES_DIR / "metadata.json"
+    def _compact_metadata(self):
+        """把完整元数据写入快照并清空修改日志"""
         try:
-            with open(metadata_path, "w", encoding="utf-8") as f:
-                json.dump(self.styles_metadata, f, ensure_ascii=False, indent=2)
+            write_json(METADATA_PATH, self.styles_metadata)
+            METADATA_LOG_PATH.unlink(missing_ok=True)
+            self._log_count = 0
         except Exception as e:
             logging.error(f"保存风格元数据失败: {e}")
     
@@ -60,35 +106,37 @@ class StyleTuner:
         style_dir = STYLE_SAMPLES_DIR / style_name
         style_dir.mkdir(exist_ok=True)
         
-        # 生成样本文件名
-        sample_count = len(list(style_dir.glob("sample_*.txt")))
+        # 生成样本文件名：样本数记录在元数据中，只有没有元数据的旧目录才扫描一次
+        if style_name in self.styles_metadata:
+            sample_count = self.styles_metadata[style_name].get("sample_count", 0)
+        else:
+            sample_count = len(list(style_dir.glob("sample_*.txt")))
         sample_path = style_dir / f"sample_{sample_count + 1}.txt"
         
         # 保存样本文本
         try:
-            with open(sample_path, "w", encoding="utf-8") as f:
-                f.write(sample_text)
+            sample_path.write_bytes(sample_text.encode("utf-8"))
         except Exception as e:
             logging.error(f"保存样本文本失败: {e}")
             return False
         
         # 更新元数据
+        now = datetime.datetime.now()
         if style_name not in self.styles_metadata:
-            self.styles_metadata[style_name] = {
+            delta = {
                 "name": style_name,
                 "description": description or f"{style_name}风格",
-                "sample_count": 1,
+                "sample_count": sample_count + 1,
                 "tuned_model": None,
-                "created_at": str(datetime.datetime.now()),
-                "updated_at": str(datetime.datetime.now())
+                "created_at": now,
+                "updated_at": now
             }
         else:
-            self.styles_metadata[style_name]["sample_count"] += 1
-            self.styles_metadata[style_name]["updated_at"] = str(datetime.datetime.now())
+            delta = {"sample_count": sample_count + 1, "updated_at": now}
             if description:
-                self.styles_metadata[style_name]["description"] = description
+                delta["description"] = description
         
-        self._save_styles_metadata()
+        self._update_styles_metadata(style_name, delta)
         return True
     
     def tune_style_model(self, style_name: str) -> bool:
@@ -126,9 +174,10 @@ class StyleTuner:
         
         # 更新元数据
         model_path = STYLE_MODELS_DIR / f"{style_name}_model.bin"
-        self.styles_metadata[style_name]["tuned_model"] = str(model_path)
-        self.styles_metadata[style_name]["updated_at"] = str(datetime.datetime.now())
-        self._save_styles_metadata()
+        self._update_styles_metadata(style_name, {
+            "tuned_model": str(model_path),
+            "updated_at": datetime.datetime.now()
+        })
         
         # 创建一个假的模型文件
         with open(model_path, "w") as f:
@@ -163,11 +212,10 @@ class StyleTuner:
         style_name = style_name.strip().lower()
         
         # 检查风格是否存在
-        if style_name not in self.styles_metadata:
+        info = self.styles_metadata.get(style_name)
+        if info is None:
             return None
         
-        info = self.styles_metadata[style_name]
-        
         # 检查是否有微调模型
         if not info["tuned_model"]:
             return None
@@ -184,3 +232,10 @@ class StyleTuner:
 
 # 全局实例
 style_tuner = StyleTuner()
+
+
+@atexit.register
+def _compact_style_metadata() -> None:
+    """退出时把修改日志合并进元数据快照"""
+    if style_tuner._log_count:
+        style_tuner._compact_metadata()
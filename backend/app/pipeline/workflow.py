@@ -1,10 +1,11 @@
 import logging
 from typing import List, Dict, Any
 from .parser import parse_input
-from .generator import paragraph_generator, dialogue_generator, scene_generator
+from .generator import paragraph_generator, multi_generator
 from .consistency import check_character_consistency, check_plot_consistency, update_knowledge_graph
 from .postprocessing import polish_text, style_transfer_text, diversity_augmentation, analyze_emotion_curve
 from .parallel_inference import parallel_generate, split_into_chunks
+from .knowledge_graph import get_knowledge_graph
 
 
 def run_pipeline(user_prompt: str, full_context: str) -> str:
@@ -34,19 +35,10 @@ def run_sequential_pipeline(data: Dict[str, Any], user_prompt: str, full_context
     """
     顺序执行生成流程
     """
-    # 生成各部分文本
-    text_blocks = []
-    para = paragraph_generator(data, full_context)
-    if para:
-        text_blocks.append(para)
-    dialog = dialogue_generator(data, full_context)
-    if dialog:
-        text_blocks.append(dialog)
-    scene = scene_generator(data, full_context)
-    if scene:
-        text_blocks.append(scene)
+    # 一次调用生成段落、对话和场景，上下文只发送一次
+    blocks = multi_generator(data, full_context)
     # 合并输出
-    raw_text = "\n\n".join(text_blocks)
+    raw_text = "\n\n".join(filter(None, (blocks["paragraph"], blocks["dialogue"], blocks["scene"])))
     return apply_postprocessing(raw_text, data)
 
 
@@ -75,26 +67,33 @@ def apply_postprocessing(raw_text: str, data: Dict[str, Any]) -> str:
     # 获取小说ID（如果有）
     novel_id = data.get("novel_id", "default")
     
-    # 一致性校验
-    if not check_character_consistency(raw_text, novel_id):
-        # TODO: 角色一致性校验失败处理
-        logging.warning("角色一致性校验失败，可能需要人工干预")
-        pass
-    if not check_plot_consistency(raw_text, novel_id):
-        # TODO: 情节一致性校验失败处理
-        logging.warning("情节一致性校验失败，可能需要人工干预")
-        pass
+    kg = get_knowledge_graph(novel_id)
     
-    # 后处理：润色、风格迁移、多样性增强
-    processed = polish_text(raw_text)
-    processed = style_transfer_text(processed, data.get("style_vector"))
-    processed = diversity_augmentation(processed)
-    
-    # 情感曲线分析，可用于前端可视化或进一步处理
-    emotion_curve = analyze_emotion_curve(processed)
-    # TODO: 将 emotion_curve 返回或保存，当前仅执行分析
-    
-    # 更新知识图谱
-    update_knowledge_graph(processed, novel_id)
+    # 校验和更新过程中对知识图谱的修改合并为一次保存
+    with kg.bulk():
+        # 实体提及只扫描一次，供各项校验和知识图谱更新共用
+        mentions = kg.scan(raw_text)
+        
+        # 一致性校验
+        if not check_character_consistency(raw_text, novel_id, mentions):
+            # TODO: 角色一致性校验失败处理
+            logging.warning("角色一致性校验失败，可能需要人工干预")
+            pass
+        if not check_plot_consistency(raw_text, novel_id, mentions):
+            # TODO: 情节一致性校验失败处理
+            logging.warning("情节一致性校验失败，可能需要人工干预")
+            pass
+        
+        # 后处理：润色、风格迁移、多样性增强
+        processed = polish_text(raw_text)
+        processed = style_transfer_text(processed, data.get("style_vector"))
+        processed = diversity_augmentation(processed)
+        
+        # 情感曲线分析，可用于前端可视化或进一步处理
+        emotion_curve = analyze_emotion_curve(processed)
+        # TODO: 将 emotion_curve 返回或保存，当前仅执行分析
+        
+        # 更新知识图谱；后处理改动了文本时提及位置随之变化，需要重新扫描
+        update_knowledge_graph(processed, novel_id, mentions if processed == raw_text else None)
     
     return processed
@@ -27,11 +27,15 @@ class AppState:
     _lock = threading.Lock()
     
     def __new__(cls):
-        with cls._lock:
-            if cls._instance is None:
-                cls._instance = super(AppState, cls).__new__(cls)
-                cls._instance._initialize()
-            return cls._instance
+        # 双重检查：实例创建后直接返回，不再获取锁
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    instance = super(AppState, cls).__new__(cls)
+                    instance._initialize()
+                    # 初始化完成后再发布，无锁读取不会拿到未初始化的实例
+                    cls._instance = instance
+        return cls._instance
     
     def _initialize(self):
         """初始化应用状态"""
@@ -0,0 +1,106 @@
+"""
+JSON文件读写工具 - 优先使用orjson，未安装时回退到标准库json
+"""
+import json
+import mmap
+import datetime
+from pathlib import Path
+from typing import Any
+
+from .logging_utils import get_logger
+
+# 获取日志记录器
+logger = get_logger(__name__)
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    logger.warning("orjson未安装，JSON持久化将使用标准库json")
+    ORJSON_AVAILABLE = False
+
+if ORJSON_AVAILABLE:
+    # 缩进输出便于人工查看；允许非字符串键和numpy数组
+    _ORJSON_OPTIONS = orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+# 超过该大小（字节）的文件通过内存映射解析，避免先整体读入一份副本
+MMAP_THRESHOLD = 1024 * 1024
+
+
+def _default(obj: Any) -> Any:
+    """标准库json的兜底编码：日期时间与orjson一致输出ISO-8601字符串"""
+    if isinstance(obj, (datetime.datetime, datetime.date)):
+        return obj.isoformat()
+    raise TypeError(f"无法序列化类型: {type(obj).__name__}")
+
+
+def write_json(path: Path, data: Any) -> None:
+    """
+    把数据写入JSON文件，datetime直接编码为ISO-8601字符串
+    
+    参数:
+        path: 文件路径
+        data: 要写入的数据
+    """
+    if ORJSON_AVAILABLE:
+        path.write_bytes(orjson.dumps(data, option=_ORJSON_OPTIONS))
+    else:
+        path.write_text(
+            json.dumps(data, ensure_ascii=False, indent=2, default=_default),
+            encoding="utf-8"
+        )
+
+
+def read_json(path: Path) -> Any:
+    """
+    读取JSON文件
+    
+    使用orjson时，较大的文件直接从内存映射的页缓存解析
+    
+    参数:
+        path: 文件路径
+    
+    返回:
+        解析后的数据
+    """
+    if ORJSON_AVAILABLE:
+        if path.stat().st_size < MMAP_THRESHOLD:
+            return orjson.loads(path.read_bytes())
+        with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if hasattr(mm, "madvise"):
+                # 一次顺序读完，提示内核提前预读
+                mm.madvise(mmap.MADV_SEQUENTIAL)
+            with memoryview(mm) as view:
+                return orjson.loads(view)
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+def encode_json_line(data: Any) -> bytes:
+    """
+    把数据编码为一行紧凑的JSON（以换行结尾），用于追加写入JSONL文件
+    
+    参数:
+        data: 要编码的数据
+    
+    返回:
+        UTF-8编码的一行JSON
+    """
+    if ORJSON_AVAILABLE:
+        return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_APPEND_NEWLINE)
+    return (json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=_default) + "\n").encode("utf-8")
+
+
+def decode_json(raw: bytes) -> Any:
+    """
+    解析一段JSON字节串
+    
+    参数:
+        raw: JSON字节串
+    
+    返回:
+        解析后的数据
+    """
+    if ORJSON_AVAILABLE:
+        return orjson.loads(raw)
+    return json.loads(raw)
@@ -2,8 +2,11 @@
 日志工具模块 - 提供统一的日志配置和管理
 """
 import os
+import queue
+import atexit
 import logging
 import logging.handlers
+from contextvars import ContextVar
 from typing import Optional
 
 # 日志级别映射
@@ -18,6 +21,30 @@ LOG_LEVELS = {
 # 全局日志配置状态标志
 _is_configured = False
 
+# 当前请求ID：请求入口处设置一次，由RequestIdFilter注入到每条日志记录，无需逐条传入extra
+request_id_ctx: ContextVar[str] = ContextVar("request_id", default="-")
+
+# 后台日志监听器：记录通过队列交给它，由工作线程写入控制台和文件
+_listener: Optional[logging.handlers.QueueListener] = None
+
+class RequestIdFilter(logging.Filter):
+    """把当前上下文的请求ID写入日志记录的request_id属性"""
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_ctx.get()
+        return True
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    进程内队列处理器
+    
+    标准QueueHandler在入队前就格式化消息和异常堆栈（为了能跨进程传递）；
+    这里的队列只在本进程内使用，直接传递原始记录，格式化全部留给后台监听线程
+    """
+    
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
 def configure_logging(
     level: str = "info", 
     log_file: Optional[str] = None,
@@ -35,7 +62,7 @@ def configure_logging(
         max_bytes: 单个日志文件的最大字节数
         backup_count: 保留的备份文件数量
     """
-    global _is_configured
+    global _is_configured, _listener
     
     if _is_configured:
         return
@@ -45,7 +72,7 @@ def configure_logging(
     
     # 设置默认日志格式
     if log_format is None:
-        log_format = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+        log_format = "%(asctime)s - %(name)s - %(levelname)s - [%(request_id)s] - %(message)s"
     
     # 创建格式化器
     formatter = logging.Formatter(log_format)
@@ -61,7 +88,7 @@ def configure_logging(
     # 添加控制台处理器
     console_handler = logging.StreamHandler()
     console_handler.setFormatter(formatter)
-    root_logger.addHandler(console_handler)
+    handlers = [console_handler]
     
     # 如果提供了日志文件，添加文件处理器
     if log_file:
@@ -78,13 +105,31 @@ def configure_logging(
             encoding='utf-8'
         )
         file_handler.setFormatter(formatter)
-        root_logger.addHandler(file_handler)
+        handlers.append(file_handler)
+    
+    # 根记录器只把记录放入队列，真正的I/O由后台监听线程完成，不阻塞事件循环
+    log_queue = queue.Queue(-1)
+    # 请求ID必须在产生日志的协程里读取，因此过滤器挂在入队的处理器上而不是后台处理器上
+    queue_handler = _DeferredQueueHandler(log_queue)
+    queue_handler.addFilter(RequestIdFilter())
+    root_logger.addHandler(queue_handler)
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
     
     # 标记为已配置
     _is_configured = True
     
     logging.info("日志系统已配置完成")
 
+def stop_logging() -> None:
+    """停止后台日志监听器，写出队列中剩余的日志记录"""
+    global _listener
+    
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
 def get_logger(name: str) -> logging.Logger:
     """
     获取指定名称的日志记录器
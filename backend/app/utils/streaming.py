@@ -0,0 +1,39 @@
+"""
+流式输出工具 - 把生成的文本片段流封装为可容忍丢帧的SSE事件流
+"""
+import json
+from collections import deque
+from typing import AsyncIterator
+
+# SSE响应的媒体类型
+SSE_MEDIA_TYPE = "text/event-stream"
+
+# 每个事件附带的最近片段数
+DEFAULT_WINDOW = 8
+
+
+async def eloquent_wrap(chunks: AsyncIterator[bytes], window: int = DEFAULT_WINDOW) -> AsyncIterator[bytes]:
+    """
+    把文本片段流封装为SSE事件，每个事件都携带最近window个片段
+    
+    事件数据为 {"seq": n, "tokens": [...]}，tokens的最后一项是第n个片段，
+    第i项的序号为 n - len(tokens) + 1 + i。客户端记录已渲染的最大序号，
+    只追加序号更大的片段：连续丢失不超过window-1个事件时，之后收到的任意一个事件
+    都能独立补齐内容，不必等待重连重传
+    
+    参数:
+        chunks: UTF-8编码的文本片段流
+        window: 每个事件附带的最近片段数
+    
+    返回:
+        SSE事件字节流，最后以 done 事件结束
+    """
+    recent = deque(maxlen=window)
+    seq = 0
+    async for chunk in chunks:
+        seq += 1
+        recent.append(chunk.decode("utf-8"))
+        payload = json.dumps({"seq": seq, "tokens": list(recent)}, ensure_ascii=False)
+        # id字段让浏览器重连时通过Last-Event-ID告知已收到的位置
+        yield f"id: {seq}\ndata: {payload}\n\n".encode("utf-8")
+    yield f"event: done\ndata: {json.dumps({'seq': seq})}\n\n".encode("utf-8")
@@ -14,8 +14,7 @@ from psycopg2.extras import Json, RealDictCursor
 from .database.db_utils import execute_query, get_db_connection, release_db_connection
 from .embeddings import get_embeddings
 
-# 配置日志
-logging.basicConfig(level=logging.INFO)
+# 日志配置由应用入口统一完成，这里只获取记录器
 logger = logging.getLogger(__name__)
 
 
@@ -31,7 +31,8 @@ CREATE TABLE IF NOT EXISTS memory_entries (
 CREATE TABLE IF NOT EXISTS vector_memories (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
     memory_id UUID REFERENCES memory_entries(id) ON DELETE CASCADE,
-    embedding VECTOR(1536), -- 假设使用OpenAI的embedding维度
+    project_id UUID REFERENCES projects(id) ON DELETE CASCADE, -- 冗余字段，用于检索前按项目过滤
+    embedding HALFVEC(1536), -- 假设使用OpenAI的embedding维度；半精度存储，体积减半（需要pgvector 0.7+）
     created_at TIMESTAMPTZ DEFAULT NOW()
 );
 
@@ -126,16 +127,39 @@ CREATE TABLE IF NOT EXISTS outline_chapters (
     UNIQUE(outline_id, chapter_number)
 );
 
+-- 12. 知识图谱关系表（边）
+CREATE TABLE IF NOT EXISTS relationships (
+    seq BIGSERIAL PRIMARY KEY, -- 插入顺序
+    project_id UUID REFERENCES projects(id) ON DELETE CASCADE,
+    id VARCHAR(400) NOT NULL, -- 关系ID，由两端节点和关系类型生成
+    from_type VARCHAR(50) NOT NULL,
+    from_id VARCHAR(100) NOT NULL,
+    to_type VARCHAR(50) NOT NULL,
+    to_id VARCHAR(100) NOT NULL,
+    rel_type VARCHAR(50) NOT NULL, -- WITNESSED, HAS_RULE, LOCATED_AT等
+    properties JSONB NOT NULL DEFAULT '{}',
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    updated_at TIMESTAMPTZ DEFAULT NOW(),
+    UNIQUE(project_id, id)
+);
+
 -- 创建索引以提高查询性能
-CREATE INDEX idx_memory_entries_project_id ON memory_entries(project_id);
-CREATE INDEX idx_memory_entries_entry_type ON memory_entries(entry_type);
+-- 记忆条目总是按项目过滤并取最新的N条，复合索引可以直接按顺序读取而无需排序
+CREATE INDEX idx_memory_proj_type ON memory_entries(project_id, entry_type, created_at DESC);
+CREATE INDEX idx_memory_proj_created ON memory_entries(project_id, created_at DESC);
 CREATE INDEX idx_novel_elements_project_id ON novel_elements(project_id);
 CREATE INDEX idx_novel_elements_type_id ON novel_elements(project_id, element_type, element_id);
-CREATE INDEX idx_chapters_project_id ON chapters(project_id);
-CREATE INDEX idx_scenes_chapter_id ON scenes(chapter_id);
+-- chapters和scenes的UNIQUE约束已经分别建立了 (project_id, chapter_number) 和 (chapter_id, scene_number) 复合索引，
+-- 既覆盖按父级过滤也覆盖按编号排序，不再单独建立单列索引
+CREATE INDEX idx_relationships_from ON relationships(project_id, from_type, from_id);
+CREATE INDEX idx_relationships_to ON relationships(project_id, to_type, to_id);
 
 -- 创建向量索引（如果使用pg_vector）
-CREATE INDEX idx_vector_memories_embedding ON vector_memories USING ivfflat (embedding vector_cosine_ops);
+-- HNSW索引按余弦距离建立，查询时必须直接 ORDER BY embedding <=> 查询向量 才能使用索引
+CREATE INDEX IF NOT EXISTS idx_vector_memories_embedding_hnsw ON vector_memories
+USING hnsw (embedding halfvec_cosine_ops) WITH (m = 16, ef_construction = 64);
+CREATE INDEX idx_vector_memories_memory_id ON vector_memories(memory_id);
+CREATE INDEX idx_vector_memories_project_id ON vector_memories(project_id);
 
 -- 创建触发器函数：自动更新updated_at字段
 CREATE OR REPLACE FUNCTION update_updated_at_column()
@@ -163,6 +187,10 @@ CREATE TRIGGER update_graph_states_updated_at
 BEFORE UPDATE ON graph_states
 FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
 
+CREATE TRIGGER update_relationships_updated_at
+BEFORE UPDATE ON relationships
+FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
+
 CREATE TRIGGER update_chapters_updated_at
 BEFORE UPDATE ON chapters
 FOR EACH ROW EXECUTE FUNCTION update_updated_at_column();
@@ -231,7 +259,7 @@ RETURNS TABLE (
     similarity FLOAT
 ) AS $$
 DECLARE
-    query_embedding VECTOR(1536);
+    query_embedding HALFVEC(1536);
 BEGIN
     -- 这里假设有一个函数可以获取embedding，实际实现可能需要调用外部API
     -- query_embedding := get_embedding(p_query);
@@ -250,7 +278,7 @@ BEGIN
     WHERE 
         me.project_id = p_project_id
     ORDER BY 
-        similarity DESC
+        vm.embedding <=> query_embedding
     LIMIT p_limit;
 END;
 $$ LANGUAGE plpgsql;
@@ -258,4 +286,6 @@ $$ LANGUAGE plpgsql;
 -- 注释：
 -- 1. 此脚本假设使用PostgreSQL 13+和pg_vector扩展
 -- 2. 向量搜索功能需要实际的embedding函数实现
--- 3. 可能需要根据实际部署环境调整索引和向量维度
\ No newline at end of file
+-- 3. 可能需要根据实际部署环境调整索引和向量维度
+-- 4. 已有数据库的向量列可通过以下语句转换为半精度（需重建HNSW索引）：
+--    ALTER TABLE vector_memories ALTER COLUMN embedding TYPE HALFVEC(1536);
\ No newline at end of file
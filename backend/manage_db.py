@@ -3,6 +3,7 @@
 """
 import os
 import sys
+import asyncio
 import argparse
 import logging
 from alembic import command
@@ -66,8 +67,13 @@ def history():
 def init_db():
     """初始化数据库"""
     from app.models import init_db as init_models_db
+    
+    async def _init_models():
+        engine = await init_models_db()
+        await engine.dispose()
+    
     logger.info("正在初始化数据库模型...")
-    init_models_db()
+    asyncio.run(_init_models())
     logger.info("数据库模型初始化完成")
     
     # 执行迁移
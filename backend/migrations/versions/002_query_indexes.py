@@ -0,0 +1,48 @@
+"""热点查询的复合索引
+
+Revision ID: 002
+Revises: 001
+Create Date: 2026-10-16 10:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '002'
+down_revision = '001'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 章节和场景：唯一约束的 (父级, 编号) 索引已覆盖按父级过滤和按编号排序，单列索引多余
+    op.drop_index('idx_chapters_project_id', table_name='chapters')
+    op.drop_index('idx_scenes_chapter_id', table_name='scenes')
+    
+    # 记忆条目：按项目（和类型）过滤后取最新的N条
+    op.create_index(
+        'idx_memory_proj_type', 'memory_entries',
+        ['project_id', 'entry_type', sa.text('created_at DESC')]
+    )
+    op.create_index(
+        'idx_memory_proj_created', 'memory_entries',
+        ['project_id', sa.text('created_at DESC')]
+    )
+    op.drop_index('idx_memory_entries_project_id', table_name='memory_entries')
+    op.drop_index('idx_memory_entries_type', table_name='memory_entries')
+    
+    # 版本历史：uq_version 的 (entity_type, entity_id, version) 索引可以反向扫描取最新版本
+    op.drop_index('idx_version_history_entity', table_name='version_history')
+
+
+def downgrade():
+    op.create_index('idx_version_history_entity', 'version_history', ['entity_type', 'entity_id'])
+    
+    op.create_index('idx_memory_entries_type', 'memory_entries', ['entry_type'])
+    op.create_index('idx_memory_entries_project_id', 'memory_entries', ['project_id'])
+    op.drop_index('idx_memory_proj_created', table_name='memory_entries')
+    op.drop_index('idx_memory_proj_type', table_name='memory_entries')
+    
+    op.create_index('idx_scenes_chapter_id', 'scenes', ['chapter_id'])
+    op.create_index('idx_chapters_project_id', 'chapters', ['project_id'])
@@ -0,0 +1,64 @@
+"""向量记忆改用pgvector类型和HNSW索引
+
+Revision ID: 003
+Revises: 002
+Create Date: 2026-10-16 11:00:00
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '003'
+down_revision = '002'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        """
+        CREATE EXTENSION IF NOT EXISTS vector;
+        
+        -- embedding直接使用vector类型，不再需要触发器维护的冗余列
+        DROP INDEX IF EXISTS idx_vector_memories_embedding_vector;
+        DROP TRIGGER IF EXISTS update_vector_memories_embedding_vector ON vector_memories;
+        DROP FUNCTION IF EXISTS update_embedding_vector();
+        ALTER TABLE vector_memories DROP COLUMN IF EXISTS embedding_vector;
+        
+        ALTER TABLE vector_memories
+            ALTER COLUMN embedding TYPE vector(1536) USING embedding::vector(1536);
+        
+        -- HNSW索引按余弦距离建立，查询使用 embedding <=> 查询向量 排序
+        CREATE INDEX IF NOT EXISTS idx_vector_hnsw ON vector_memories
+            USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64);
+        """
+    )
+
+
+def downgrade():
+    op.execute(
+        """
+        DROP INDEX IF EXISTS idx_vector_hnsw;
+        
+        ALTER TABLE vector_memories
+            ALTER COLUMN embedding TYPE double precision[] USING embedding::real[]::double precision[];
+        
+        ALTER TABLE vector_memories ADD COLUMN IF NOT EXISTS embedding_vector vector(1536);
+        UPDATE vector_memories SET embedding_vector = embedding::vector;
+        
+        CREATE OR REPLACE FUNCTION update_embedding_vector()
+        RETURNS TRIGGER AS $$
+        BEGIN
+            NEW.embedding_vector = NEW.embedding::vector;
+            RETURN NEW;
+        END;
+        $$ LANGUAGE plpgsql;
+        
+        CREATE TRIGGER update_vector_memories_embedding_vector
+        BEFORE INSERT OR UPDATE ON vector_memories
+        FOR EACH ROW
+        EXECUTE FUNCTION update_embedding_vector();
+        
+        CREATE INDEX IF NOT EXISTS idx_vector_memories_embedding_vector ON vector_memories USING ivfflat (embedding_vector vector_cosine_ops);
+        """
+    )
@@ -0,0 +1,45 @@
+"""JSONB列改用数据库端默认值
+
+Revision ID: 004
+Revises: 003
+Create Date: 2026-10-16 12:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '004'
+down_revision = '003'
+branch_labels = None
+depends_on = None
+
+# (表名, 列名)
+JSONB_COLUMNS = [
+    ('characters', 'attributes'),
+    ('locations', 'attributes'),
+    ('items', 'attributes'),
+    ('events', 'attributes'),
+    ('rules', 'attributes'),
+    ('memory_entries', 'metadata'),
+]
+
+
+def upgrade():
+    for table, column in JSONB_COLUMNS:
+        # 先回填空值，才能加上NOT NULL约束
+        op.execute(f"UPDATE {table} SET {column} = '{{}}'::jsonb WHERE {column} IS NULL")
+        op.alter_column(
+            table, column,
+            server_default=sa.text("'{}'::jsonb"),
+            nullable=False
+        )
+
+
+def downgrade():
+    for table, column in JSONB_COLUMNS:
+        op.alter_column(
+            table, column,
+            server_default='{}',
+            nullable=True
+        )
@@ -0,0 +1,55 @@
+"""时间戳列改用TIMESTAMPTZ
+
+Revision ID: 005
+Revises: 004
+Create Date: 2026-10-16 13:00:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '005'
+down_revision = '004'
+branch_labels = None
+depends_on = None
+
+# 同时有created_at和updated_at的表
+TIMESTAMPED_TABLES = [
+    'projects', 'characters', 'locations', 'items', 'events', 'rules',
+    'chapters', 'scenes', 'outlines', 'memory_entries', 'graph_states',
+]
+
+# 只有created_at的表
+CREATED_ONLY_TABLES = [
+    'character_event', 'location_event', 'vector_memories', 'version_history',
+]
+
+
+def _columns():
+    for table in TIMESTAMPED_TABLES:
+        yield table, 'created_at'
+        yield table, 'updated_at'
+    for table in CREATED_ONLY_TABLES:
+        yield table, 'created_at'
+
+
+def upgrade():
+    # 原有数据由Python端utcnow写入，按UTC解释
+    for table, column in _columns():
+        op.alter_column(
+            table, column,
+            type_=sa.DateTime(timezone=True),
+            postgresql_using=f"{column} AT TIME ZONE 'UTC'",
+            server_default=sa.text('now()')
+        )
+
+
+def downgrade():
+    for table, column in _columns():
+        op.alter_column(
+            table, column,
+            type_=sa.DateTime(),
+            postgresql_using=f"{column} AT TIME ZONE 'UTC'",
+            server_default=sa.text('now()')
+        )
@@ -0,0 +1,62 @@
+"""向量记忆改用半精度存储，并增加项目ID和范数列
+
+Revision ID: 006
+Revises: 005
+Create Date: 2026-10-16 14:00:00
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '006'
+down_revision = '005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute(
+        """
+        -- 冗余保存project_id，检索时按项目过滤；embedding_norm保存全精度向量的范数
+        ALTER TABLE vector_memories
+            ADD COLUMN IF NOT EXISTS project_id UUID REFERENCES projects(id) ON DELETE CASCADE;
+        ALTER TABLE vector_memories ADD COLUMN IF NOT EXISTS embedding_norm REAL;
+
+        -- 回填已有数据，否则project_id为空的向量永远不会出现在检索结果中
+        UPDATE vector_memories vm
+        SET project_id = me.project_id
+        FROM memory_entries me
+        WHERE me.id = vm.memory_id AND vm.project_id IS NULL;
+
+        -- 范数在转换为半精度之前计算
+        UPDATE vector_memories
+        SET embedding_norm = vector_norm(embedding)
+        WHERE embedding_norm IS NULL AND embedding IS NOT NULL;
+
+        -- 索引的操作符类随列类型变化，需要重建（需要pgvector 0.7+）
+        DROP INDEX IF EXISTS idx_vector_hnsw;
+        ALTER TABLE vector_memories
+            ALTER COLUMN embedding TYPE halfvec(1536) USING embedding::halfvec(1536);
+        CREATE INDEX IF NOT EXISTS idx_vector_hnsw ON vector_memories
+            USING hnsw (embedding halfvec_cosine_ops) WITH (m = 16, ef_construction = 64);
+
+        CREATE INDEX IF NOT EXISTS idx_vector_memories_project_id ON vector_memories(project_id);
+        """
+    )
+
+
+def downgrade():
+    op.execute(
+        """
+        DROP INDEX IF EXISTS idx_vector_memories_project_id;
+
+        DROP INDEX IF EXISTS idx_vector_hnsw;
+        ALTER TABLE vector_memories
+            ALTER COLUMN embedding TYPE vector(1536) USING embedding::vector(1536);
+        CREATE INDEX IF NOT EXISTS idx_vector_hnsw ON vector_memories
+            USING hnsw (embedding vector_cosine_ops) WITH (m = 16, ef_construction = 64);
+
+        ALTER TABLE vector_memories DROP COLUMN IF EXISTS embedding_norm;
+        ALTER TABLE vector_memories DROP COLUMN IF EXISTS project_id;
+        """
+    )
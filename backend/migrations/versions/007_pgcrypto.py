@@ -0,0 +1,24 @@
+"""启用pgcrypto扩展
+
+Revision ID: 007
+Revises: 006
+Create Date: 2026-10-16 15:00:00
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '007'
+down_revision = '006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 主键默认值使用gen_random_uuid()，PostgreSQL 13以前由pgcrypto扩展提供
+    op.execute("CREATE EXTENSION IF NOT EXISTS pgcrypto")
+
+
+def downgrade():
+    # 扩展可能被其他对象使用，降级时保留
+    pass
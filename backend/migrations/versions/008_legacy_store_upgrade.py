@@ -0,0 +1,71 @@
+"""升级记忆存储的旧表结构
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-16 16:00:00
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '008'
+down_revision = '007'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 以下各表由 app.memory.init_db() 创建，这里只升级已存在的旧表，
+    # 新建的表已是最新结构，各语句均不做任何操作
+
+    # 旧的普通graph_states表转换为UNLOGGED（已是UNLOGGED时不做任何操作）
+    op.execute("ALTER TABLE IF EXISTS graph_states SET UNLOGGED")
+
+    # 旧版本历史表：补充压缩相关列，text列改为可空
+    # ORM的version_history（entity_type/entity_id）结构不同，只处理按memory_id记录的表
+    op.execute("""
+    DO $$
+    BEGIN
+        IF EXISTS (
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name = 'version_history' AND column_name = 'memory_id'
+        ) THEN
+            ALTER TABLE version_history
+                ADD COLUMN IF NOT EXISTS kind VARCHAR(10) NOT NULL DEFAULT 'full',
+                ADD COLUMN IF NOT EXISTS codec VARCHAR(10) NOT NULL DEFAULT 'none',
+                ADD COLUMN IF NOT EXISTS data BYTEA,
+                ALTER COLUMN text DROP NOT NULL;
+        END IF;
+    END $$;
+    """)
+
+    # 旧内存表：补充版本号列，并按已有版本历史回填
+    op.execute("""
+    DO $$
+    BEGIN
+        IF EXISTS (
+            SELECT 1 FROM information_schema.tables WHERE table_name = 'memories'
+        ) AND NOT EXISTS (
+            SELECT 1 FROM information_schema.columns
+            WHERE table_name = 'memories' AND column_name = 'version'
+        ) THEN
+            ALTER TABLE memories ADD COLUMN version INT NOT NULL DEFAULT 1;
+            IF EXISTS (
+                SELECT 1 FROM information_schema.columns
+                WHERE table_name = 'version_history' AND column_name = 'memory_id'
+            ) THEN
+                UPDATE memories m SET version = v.version
+                FROM (
+                    SELECT memory_id, MAX(version) AS version
+                    FROM version_history GROUP BY memory_id
+                ) v
+                WHERE m.memory_id = v.memory_id;
+            END IF;
+        END IF;
+    END $$;
+    """)
+
+
+def downgrade():
+    # 新增的列被当前代码使用，降级时保留
+    pass
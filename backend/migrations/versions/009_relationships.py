@@ -0,0 +1,44 @@
+"""知识图谱关系表
+
+Revision ID: 009
+Revises: 008
+Create Date: 2026-10-16 16:30:00
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision = '009'
+down_revision = '008'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 知识图谱的边，原先保存在graph_states的图状态中
+    op.create_table(
+        'relationships',
+        sa.Column('seq', sa.BigInteger(), primary_key=True, autoincrement=True),  # 插入顺序
+        sa.Column('project_id', postgresql.UUID(as_uuid=True), sa.ForeignKey('projects.id', ondelete='CASCADE')),
+        sa.Column('id', sa.String(400), nullable=False),  # 关系ID，由两端节点和关系类型生成
+        sa.Column('from_type', sa.String(50), nullable=False),
+        sa.Column('from_id', sa.String(100), nullable=False),
+        sa.Column('to_type', sa.String(50), nullable=False),
+        sa.Column('to_id', sa.String(100), nullable=False),
+        sa.Column('rel_type', sa.String(50), nullable=False),
+        sa.Column('properties', postgresql.JSONB(), server_default=sa.text("'{}'::jsonb"), nullable=False),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()')),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()')),
+        sa.UniqueConstraint('project_id', 'id', name='uq_relationships_project_id')
+    )
+    # 按节点查询关系时，出边和入边各走一个索引
+    op.create_index('idx_relationships_from', 'relationships', ['project_id', 'from_type', 'from_id'])
+    op.create_index('idx_relationships_to', 'relationships', ['project_id', 'to_type', 'to_id'])
+
+
+def downgrade():
+    op.drop_index('idx_relationships_to', table_name='relationships')
+    op.drop_index('idx_relationships_from', table_name='relationships')
+    op.drop_table('relationships')
@@ -0,0 +1,30 @@
+"""删除向量记忆的范数列
+
+Revision ID: 010
+Revises: 009
+Create Date: 2026-10-16 17:00:00
+
+"""
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '010'
+down_revision = '009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # 范数只用于按全精度重排序，而数据库只保存半精度向量，重排序已移除
+    op.execute("ALTER TABLE vector_memories DROP COLUMN IF EXISTS embedding_norm")
+
+
+def downgrade():
+    op.execute(
+        """
+        ALTER TABLE vector_memories ADD COLUMN IF NOT EXISTS embedding_norm REAL;
+        UPDATE vector_memories
+        SET embedding_norm = vector_norm(embedding::vector)
+        WHERE embedding IS NOT NULL;
+        """
+    )
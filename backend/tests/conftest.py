@@ -0,0 +1,14 @@
+"""
+测试公共配置
+"""
+import pytest
+
+from app.pipeline import knowledge_graph
+
+
+@pytest.fixture(autouse=True)
+def isolated_knowledge_graphs(tmp_path, monkeypatch):
+    """知识图谱写入临时目录，并使用独立的空缓存，避免退出时把测试数据保存到源码目录"""
+    monkeypatch.setattr(knowledge_graph, "KNOWLEDGE_GRAPH_DIR", tmp_path)
+    monkeypatch.setattr(knowledge_graph, "_knowledge_graphs", knowledge_graph.OrderedDict())
+    monkeypatch.setattr(knowledge_graph, "_live_graphs", knowledge_graph.weakref.WeakValueDictionary())
@@ -5,14 +5,15 @@ import pytest
 from unittest.mock import MagicMock, patch
 from fastapi import FastAPI, Request
 from fastapi.responses import JSONResponse
-from starlette.middleware.base import BaseHTTPMiddleware
 from pydantic import ValidationError
 
 from app.middleware.error_handler import (
-    ErrorHandlerMiddleware, APIException, 
+    RequestTimingMiddleware, APIException, 
     DatabaseError, AuthError, NotFoundError,
-    ErrorCode
+    ErrorCode, api_exception_handler, general_exception_handler,
+    validation_exception_handler
 )
+from app.utils.logging_utils import request_id_ctx
 
 class TestErrorHandlerMiddleware:
     """错误处理中间件测试类"""
@@ -43,64 +44,78 @@ class TestErrorHandlerMiddleware:
         assert not_found_exc.code == ErrorCode.NOT_FOUND
         assert not_found_exc.status_code == 404
     
+    @staticmethod
+    async def _call_middleware(inner_app, headers=None):
+        """以ASGI方式调用中间件，返回 (状态码, 响应头, 响应体)"""
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "path": "/test",
+            "query_string": b"",
+            "headers": headers or [],
+            "client": ("127.0.0.1", 12345),
+        }
+        messages = []
+        
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+        
+        async def send(message):
+            messages.append(message)
+        
+        middleware = RequestTimingMiddleware(inner_app)
+        await middleware(scope, receive, send)
+        
+        start = messages[0]
+        body = b"".join(m.get("body", b"") for m in messages[1:])
+        return start["status"], dict(start["headers"]), body
+    
     @pytest.mark.asyncio
     async def test_middleware_normal_flow(self):
         """测试中间件正常流程"""
         # 创建模拟应用
-        app = FastAPI()
-        
-        # 创建模拟请求
-        mock_request = MagicMock()
-        mock_request.headers = {}
-        mock_request.client.host = "127.0.0.1"
-        mock_request.method = "GET"
-        mock_request.url.path = "/test"
-        
-        # 创建模拟响应
-        mock_response = MagicMock()
-        mock_response.headers = {}
-        mock_response.status_code = 200
+        seen_request_ids = []
         
-        # 创建模拟回调
-        async def mock_call_next(request):
-            return mock_response
-        
-        # 创建中间件
-        middleware = ErrorHandlerMiddleware(app)
+        async def mock_app(scope, receive, send):
+            seen_request_ids.append(request_id_ctx.get())
+            await JSONResponse({"ok": True})(scope, receive, send)
         
         # 调用中间件
-        response = await middleware.dispatch(mock_request, mock_call_next)
+        status, headers, body = await self._call_middleware(
+            mock_app, headers=[(b"x-request-id", b"req-1")]
+        )
         
         # 验证结果
-        assert response == mock_response
-        assert "X-Process-Time" in response.headers
-        assert "X-Request-ID" in response.headers
+        assert status == 200
+        assert b"x-process-time" in headers
+        assert headers[b"x-request-id"] == b"req-1"
+        assert body == b'{"ok":true}'
+        
+        # 请求处理期间上下文中带有请求ID，结束后恢复
+        assert seen_request_ids == ["req-1"]
+        assert request_id_ctx.get() == "-"
+    
+    @staticmethod
+    def _make_request():
+        """构造测试用请求"""
+        scope = {
+            "type": "http",
+            "method": "GET",
+            "path": "/test",
+            "query_string": b"",
+            "headers": [],
+        }
+        return Request(scope)
     
     @pytest.mark.asyncio
     async def test_middleware_api_exception(self):
-        """测试中间件处理API异常"""
-        # 创建模拟应用
-        app = FastAPI()
+        """测试处理API异常"""
+        exc = NotFoundError("资源不存在", details={"resource_id": "123"})
         
-        # 创建模拟请求
-        mock_request = MagicMock()
-        mock_request.headers = {}
-        mock_request.client.host = "127.0.0.1"
-        mock_request.method = "GET"
-        mock_request.url.path = "/test"
-        
-        # 创建抛出异常的回调
-        async def mock_call_next(request):
-            raise NotFoundError("资源不存在", details={"resource_id": "123"})
-        
-        # 创建中间件
-        middleware = ErrorHandlerMiddleware(app)
-        
-        # 调用中间件
-        response = await middleware.dispatch(mock_request, mock_call_next)
+        # 调用异常处理器
+        response = await api_exception_handler(self._make_request(), exc)
         
         # 验证结果
-        assert isinstance(response, JSONResponse)
         assert response.status_code == 404
         
         # 验证响应内容
@@ -111,32 +126,40 @@ class TestErrorHandlerMiddleware:
     
     @pytest.mark.asyncio
     async def test_middleware_unexpected_exception(self):
-        """测试中间件处理意外异常"""
-        # 创建模拟应用
-        app = FastAPI()
-        
-        # 创建模拟请求
-        mock_request = MagicMock()
-        mock_request.headers = {}
-        mock_request.client.host = "127.0.0.1"
-        mock_request.method = "GET"
-        mock_request.url.path = "/test"
+        """测试处理意外异常"""
+        exc = RuntimeError("意外错误")
         
-        # 创建抛出异常的回调
-        async def mock_call_next(request):
-            raise RuntimeError("意外错误")
-        
-        # 创建中间件
-        middleware = ErrorHandlerMiddleware(app)
-        
-        # 调用中间件
-        response = await middleware.dispatch(mock_request, mock_call_next)
+        # 调用异常处理器
+        response = await general_exception_handler(self._make_request(), exc)
         
         # 验证结果
-        assert isinstance(response, JSONResponse)
         assert response.status_code == 500
         
         # 验证响应内容
         content = response.body.decode()
         assert "服务器内部错误" in content
         assert str(ErrorCode.UNKNOWN_ERROR) in content
+    
+    @pytest.mark.asyncio
+    async def test_validation_exception_details_cached(self):
+        """测试验证错误详情只提取一次"""
+        from pydantic import BaseModel
+        
+        class Item(BaseModel):
+            count: int
+        
+        with pytest.raises(ValidationError) as exc_info:
+            Item(count="abc")
+        exc = exc_info.value
+        
+        response = await validation_exception_handler(self._make_request(), exc)
+        
+        assert response.status_code == 400
+        content = response.body.decode()
+        assert str(ErrorCode.VALIDATION_ERROR) in content
+        assert "count" in content
+        
+        # 详情缓存在异常对象上
+        details = exc._cached_details
+        await validation_exception_handler(self._make_request(), exc)
+        assert exc._cached_details is details
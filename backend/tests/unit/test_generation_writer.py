@@ -0,0 +1,42 @@
+"""
+生成结果写入器单元测试
+"""
+from unittest.mock import MagicMock, patch
+
+# 模块导入时会创建存储实例并初始化表结构，这里不连接数据库
+with patch("app.database.db_utils.get_db_connection", return_value=MagicMock()):
+    from app import memory
+
+
+class TestGenerationWriter:
+    """生成结果写入器测试类"""
+    
+    def test_successful_write_has_no_failures(self):
+        """测试写入成功时没有失败信息"""
+        writer = memory.GenerationWriter(flush_interval=0.01)
+        with patch.object(memory.memory_store, "add") as add, \
+             patch.object(memory.element_store, "save_elements", return_value=True):
+            writer.put_memory("novel_chapter_1", "正文")
+            writer.put_element("novel", "chapter", "1", {"id": "1"})
+            
+            assert writer.pop_failures("novel_chapter_1", writer.element_key("novel", "chapter", "1")) == []
+        add.assert_called_once_with("novel_chapter_1", "正文")
+    
+    def test_failed_memory_write_reported_once(self):
+        """测试正文写入失败时登记到对应的键，取出后清除"""
+        writer = memory.GenerationWriter(flush_interval=0.01)
+        with patch.object(memory.memory_store, "add", side_effect=RuntimeError("连接断开")):
+            writer.put_memory("novel_chapter_1", "正文")
+            
+            failures = writer.pop_failures("novel_chapter_1", "novel_chapter_2")
+        
+        assert len(failures) == 1 and "连接断开" in failures[0]
+        assert writer.pop_failures("novel_chapter_1") == []
+    
+    def test_failed_element_write_reported(self):
+        """测试元素批量保存失败时登记每个元素的键"""
+        writer = memory.GenerationWriter(flush_interval=0.01)
+        with patch.object(memory.element_store, "save_elements", return_value=False):
+            writer.put_element("novel", "chapter", "1", {"id": "1"})
+            
+            assert writer.pop_failures(writer.element_key("novel", "chapter", "1"))
@@ -0,0 +1,32 @@
+"""
+生成器单元测试
+"""
+from unittest.mock import patch
+
+from app.pipeline import generator
+
+
+class TestMultiGenerator:
+    """多部分生成器测试类"""
+    
+    def test_single_call_split_into_sections(self):
+        """测试一次模型调用的输出按标签拆分为各部分"""
+        response = "<paragraph>夜色渐深。</paragraph>\n<dialogue>“走吧。”</dialogue>"
+        with patch.object(generator, "model_inference", return_value=response) as infer:
+            blocks = generator.multi_generator({"prompt": "写一段离别"}, "上下文")
+        
+        infer.assert_called_once()
+        assert infer.call_args.kwargs["max_tokens"] == generator.MAX_TOKENS * 3
+        assert blocks == {"paragraph": "夜色渐深。", "dialogue": "“走吧。”", "scene": ""}
+    
+    def test_untagged_response_kept_as_first_section(self):
+        """测试模型没有输出标签时整段内容不丢失"""
+        assert generator.parse_sections("夜色渐深。", ("paragraph", "scene")) == {"paragraph": "夜色渐深。", "scene": ""}
+    
+    def test_truncated_last_section_kept(self):
+        """测试输出被截断、缺少结束标签时保留最后一个部分已生成的内容"""
+        response = "<paragraph>夜色渐深。</paragraph>\n<scene>风吹过长街，"
+        
+        assert generator.parse_sections(response, ("paragraph", "scene")) == {
+            "paragraph": "夜色渐深。", "scene": "风吹过长街，"
+        }
@@ -0,0 +1,192 @@
+"""
+知识图谱单元测试
+"""
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from app.pipeline import knowledge_graph
+from app.pipeline.knowledge_graph import KnowledgeGraph, get_knowledge_graph
+
+
+@pytest.fixture
+def graph(tmp_path, monkeypatch):
+    """使用临时目录的知识图谱"""
+    monkeypatch.setattr(knowledge_graph, "KNOWLEDGE_GRAPH_DIR", tmp_path)
+    return KnowledgeGraph("test_novel")
+
+
+class TestExtractEntities:
+    """实体提取测试类"""
+    
+    def test_reports_every_mention(self, graph):
+        """测试同一名称多次出现时逐一记为提及"""
+        character = graph.add_character("张三")
+        graph.add_location("长安")
+        
+        results = graph.extract_entities_from_text("张三到了长安，张三笑了")
+        
+        assert sorted((entity.name, position) for entity, position, _ in results) == [
+            ("张三", 0), ("张三", 7), ("长安", 4)
+        ]
+        assert len(character.mentions) == 2
+    
+    def test_new_entity_is_matched(self, graph):
+        """测试新增实体后能立即被匹配到"""
+        graph.add_character("张三")
+        graph.extract_entities_from_text("张三")
+        graph.add_character("李四")
+        
+        results = graph.extract_entities_from_text("李四来了")
+        
+        assert [entity.name for entity, _, _ in results] == ["李四"]
+    
+    def test_scan_does_not_record_mentions(self, graph):
+        """测试scan只读，提及在commit_mentions时才记录"""
+        character = graph.add_character("张三")
+        
+        mentions = graph.scan("张三来了")
+        assert len(character.mentions) == 0
+        
+        graph.commit_mentions(mentions)
+        assert [mention["position"] for mention in character.mentions] == [0]
+
+
+class TestEntityIds:
+    """实体ID分配测试类"""
+    
+    def test_ids_continue_after_reload(self, graph):
+        """测试重新加载后编号接着已有的最大编号分配"""
+        graph.add_entity(knowledge_graph.Character("character_5", "张三"))
+        graph.flush()
+        
+        reloaded = KnowledgeGraph("test_novel")
+        
+        assert reloaded.get_entity_by_name("张三").id == "character_5"
+        assert reloaded.add_character("李四").id == "character_6"
+    
+    def test_removed_id_not_reused(self, graph):
+        """测试删除实体后新实体不会复用其ID，删除在重新加载后仍然生效"""
+        first = graph.add_character("张三")
+        second = graph.add_character("李四")
+        graph.remove_entity(second.id)
+        
+        assert graph.add_character("王五").id == "character_3"
+        assert second.id not in graph.entities
+        
+        graph.flush()
+        reloaded = KnowledgeGraph("test_novel")
+        assert sorted(entity.name for entity in reloaded.get_entities_by_type("character")) == ["张三", "王五"]
+        assert reloaded.get_entity_by_name("李四") is None
+        assert reloaded.get_entity(first.id) is not None
+
+
+class TestWriteAheadLog:
+    """修改日志测试类"""
+    
+    def test_changes_replayed_from_log(self, graph):
+        """测试修改只追加到日志，重新加载时重放"""
+        with graph.bulk():
+            zhang = graph.add_character("张三")
+            chang_an = graph.add_location("长安")
+            graph.add_relation(zhang.id, "位于", chang_an.id)
+            graph.extract_entities_from_text("张三到了长安")
+        
+        assert not graph._get_graph_path().exists()
+        
+        reloaded = KnowledgeGraph("test_novel")
+        assert reloaded.get_entity_by_name("张三").relations[0]["target_id"] == chang_an.id
+        assert len(reloaded.get_entity_by_name("长安").mentions) == 1
+    
+    def test_compact_folds_log_into_snapshot(self, graph):
+        """测试合并后日志清空，快照包含全部修改"""
+        graph.add_character("张三")
+        graph.flush(compact=True)
+        
+        assert not graph._get_wal_path().exists()
+        assert KnowledgeGraph("test_novel").get_entity_by_name("张三") is not None
+    
+    def test_truncated_tail_skipped(self, graph):
+        """测试写了一半的末行被跳过，之前的修改仍然生效"""
+        graph.add_character("张三")
+        graph.flush()
+        with open(graph._get_wal_path(), "ab") as f:
+            f.write(b'{"op": "add_entity", "payl')
+        
+        assert KnowledgeGraph("test_novel").get_entity_by_name("张三") is not None
+    
+    def test_debounced_change_written_after_interval(self, graph, monkeypatch):
+        """测试防抖间隔内的修改在间隔结束后自动写入，不依赖下一次修改"""
+        monkeypatch.setattr(knowledge_graph, "SAVE_DEBOUNCE_SECONDS", 0.05)
+        graph.add_character("张三")
+        graph.add_character("李四")  # 距上次写入不足间隔，先缓存
+        assert KnowledgeGraph("test_novel").get_entity_by_name("李四") is None
+        
+        time.sleep(0.2)
+        assert KnowledgeGraph("test_novel").get_entity_by_name("李四") is not None
+    
+    def test_append_after_truncated_tail(self, graph):
+        """测试写了一半的末行被截掉，之后追加的修改不会接在它后面而丢失"""
+        graph.add_character("张三")
+        graph.flush()
+        with open(graph._get_wal_path(), "ab") as f:
+            f.write(b'{"op": "add_entity", "payl')
+        
+        second = KnowledgeGraph("test_novel")
+        second.add_character("李四")
+        second.flush()
+        
+        reloaded = KnowledgeGraph("test_novel")
+        assert reloaded.get_entity_by_name("张三") is not None
+        assert reloaded.get_entity_by_name("李四") is not None
+
+
+class TestKnowledgeGraphCache:
+    """知识图谱缓存测试类"""
+    
+    @pytest.fixture(autouse=True)
+    def empty_cache(self, tmp_path, monkeypatch):
+        """每个测试使用独立的空缓存"""
+        monkeypatch.setattr(knowledge_graph, "KNOWLEDGE_GRAPH_DIR", tmp_path)
+        monkeypatch.setattr(knowledge_graph, "_knowledge_graphs", knowledge_graph.OrderedDict())
+        monkeypatch.setattr(knowledge_graph, "_live_graphs", knowledge_graph.weakref.WeakValueDictionary())
+    
+    def test_concurrent_get_returns_single_instance(self):
+        """测试并发获取同一小说的图谱只创建一个实例"""
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            graphs = list(executor.map(get_knowledge_graph, ["novel"] * 32))
+        
+        assert len({id(graph) for graph in graphs}) == 1
+    
+    def test_least_recently_used_graph_evicted(self, monkeypatch):
+        """测试超出上限时保存并淘汰最久未使用的图谱"""
+        monkeypatch.setattr(knowledge_graph.settings, "knowledge_graph_cache_size", 2)
+        get_knowledge_graph("novel_1")
+        second = get_knowledge_graph("novel_2")
+        second.add_character("张三")
+        second.add_character("李四")  # 防抖间隔内的修改尚未保存
+        get_knowledge_graph("novel_1")
+        get_knowledge_graph("novel_3")
+        
+        assert list(knowledge_graph._knowledge_graphs) == ["novel_1", "novel_3"]
+        assert KnowledgeGraph("novel_2").get_entity_by_name("李四") is not None
+    
+    def test_evicted_graph_still_in_use_reused(self, monkeypatch):
+        """测试已淘汰但仍被持有的图谱再次获取时返回同一实例"""
+        monkeypatch.setattr(knowledge_graph.settings, "knowledge_graph_cache_size", 1)
+        first = get_knowledge_graph("novel_1")
+        get_knowledge_graph("novel_2")
+        
+        assert "novel_1" not in knowledge_graph._knowledge_graphs
+        assert get_knowledge_graph("novel_1") is first
+    
+    def test_concurrent_mutations(self):
+        """测试多个线程并发修改同一图谱时编号不重复、修改不丢失"""
+        graph = get_knowledge_graph("novel")
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            characters = list(executor.map(graph.add_character, [f"角色{i}" for i in range(200)]))
+        graph.flush()
+        
+        assert len({character.id for character in characters}) == 200
+        assert len(KnowledgeGraph("novel").get_entities_by_type("character")) == 200
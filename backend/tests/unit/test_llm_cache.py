@@ -0,0 +1,95 @@
+"""
+LLM响应缓存单元测试
+"""
+import numpy as np
+
+from app.pipeline.llm_cache import ExactCache, SemanticCache, make_key, normalize_text
+
+
+def _fake_embed(text: str) -> np.ndarray:
+    """以关键字决定方向的测试向量：含“对话”的文本彼此相近"""
+    if "对话" in text:
+        return np.array([1.0, 0.1, 0.0], dtype=np.float32)
+    return np.array([0.0, 0.0, 1.0], dtype=np.float32)
+
+
+class TestSemanticCache:
+    """语义缓存测试类"""
+    
+    def test_semantic_hit_and_miss(self):
+        """测试相近请求命中、无关请求未命中"""
+        cache = SemanticCache(maxsize=4, threshold=0.9, embed=_fake_embed)
+        cache.put("生成一段对话", "对话结果")
+        
+        assert cache.lookup("写一段人物对话") == "对话结果"
+        assert cache.lookup("描写一段风景") is None
+        assert cache.cache_info()["hits"] == 1
+    
+    def test_expired_entry_not_returned(self):
+        """测试过期条目不会命中"""
+        cache = SemanticCache(maxsize=4, ttl=-1, embed=_fake_embed)
+        cache.put("生成一段对话", "对话结果")
+        
+        assert cache.lookup("生成一段对话") is None
+    
+    def test_ring_buffer_overwrites_oldest(self):
+        """测试超出容量时覆盖最旧的条目"""
+        cache = SemanticCache(maxsize=1, embed=_fake_embed)
+        cache.put("生成一段对话", "对话结果")
+        cache.put("描写一段风景", "风景结果")
+        
+        assert cache.lookup("生成一段对话") is None
+        assert cache.lookup("描写一段风景") == "风景结果"
+    
+    def test_key_text_normalized(self):
+        """测试键文本规范化"""
+        assert normalize_text("要求  ") == normalize_text("要求")
+    
+    def test_same_context_different_prompts_do_not_collide(self):
+        """测试上下文相同、写作要求不同的请求不会互相命中"""
+        cache = SemanticCache(maxsize=4, threshold=0.9, embed=_fake_embed)
+        context = "第四章：两人的对话不欢而散。" * 50
+        paragraph = make_key("model", "系统", context, "续写下一段", {})
+        dialogue = make_key("model", "系统", context, "生成一段对话", {})
+        cache.put(paragraph.text, "段落结果", scope=paragraph.scope)
+        
+        assert paragraph.scope == dialogue.scope
+        assert cache.lookup(dialogue.text, scope=dialogue.scope) is None
+        assert cache.lookup(paragraph.text, scope=paragraph.scope) == "段落结果"
+    
+    def test_different_context_does_not_match(self):
+        """测试上下文不同时即使写作要求相近也不会命中"""
+        cache = SemanticCache(maxsize=4, threshold=0.9, embed=_fake_embed)
+        key1 = make_key("model", "系统", "上下文一", "生成一段对话", {})
+        key2 = make_key("model", "系统", "上下文二", "写一段人物对话", {})
+        cache.put(key1.text, "对话结果", scope=key1.scope)
+        
+        assert cache.lookup(key2.text, scope=key2.scope) is None
+
+
+class TestExactCache:
+    """精确匹配缓存测试类"""
+    
+    def test_make_key_covers_params(self):
+        """测试摘要区分生成参数，键文本只含写作要求"""
+        key1 = make_key("model", "系统", "上下文", "要求", {"temperature": 0.85})
+        key2 = make_key("model", "系统", "上下文", "要求 ", {"temperature": 0.85})
+        key3 = make_key("model", "系统", "上下文", "要求", {"temperature": 0.2})
+        
+        assert key1 == key2
+        assert key1.digest != key3.digest
+        assert key1.text == key3.text == "要求"
+        assert key1.scope != key3.scope
+    
+    def test_lru_eviction(self):
+        """测试超出容量时淘汰最久未使用的条目"""
+        cache = ExactCache(maxsize=2)
+        cache.put("a", "A")
+        cache.put("b", "B")
+        assert cache.get("a") == "A"
+        cache.put("c", "C")
+        
+        assert cache.get("b") is None
+        assert cache.get("a") == "A"
+        assert cache.get("c") == "C"
+
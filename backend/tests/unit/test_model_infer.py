@@ -0,0 +1,55 @@
+"""
+统一推理入口单元测试
+"""
+import asyncio
+import pytest
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+
+from app import model_infer
+
+
+class TestAsyncCall:
+    """异步模型调用测试类"""
+    
+    @pytest.mark.asyncio
+    async def test_concurrent_identical_requests_coalesced(self):
+        """测试摘要相同的并发请求只调用一次模型"""
+        async def create(**kwargs):
+            await asyncio.sleep(0.01)
+            message = SimpleNamespace(content="生成结果")
+            return SimpleNamespace(choices=[SimpleNamespace(message=message)])
+        
+        client = MagicMock()
+        client.chat.completions.create = MagicMock(side_effect=create)
+        
+        with patch.object(model_infer, "_get_async_openai_client", return_value=client), \
+             patch.object(model_infer.settings, "ai_mode", "api"), \
+             patch.object(model_infer.settings, "llm_cache_enabled", False):
+            results = await asyncio.gather(*[
+                model_infer.model_inference_async("写一段对话", "上下文") for _ in range(5)
+            ])
+        
+        assert results == ["生成结果"] * 5
+        assert client.chat.completions.create.call_count == 1
+        assert model_infer._inflight == {}
+
+
+class TestSyncCall:
+    """同步模型调用测试类"""
+    
+    def test_use_cache_false_bypasses_cache(self):
+        """测试关闭缓存时既不查找也不写入响应缓存"""
+        message = SimpleNamespace(content="最新摘要")
+        client = MagicMock()
+        client.chat.completions.create.return_value = SimpleNamespace(choices=[SimpleNamespace(message=message)])
+        
+        with patch.object(model_infer, "_get_openai_client", return_value=client), \
+             patch.object(model_infer.settings, "ai_mode", "api"), \
+             patch.object(model_infer.llm_cache, "lookup", return_value=("旧摘要", None)) as lookup, \
+             patch.object(model_infer.llm_cache, "store") as store:
+            result = model_infer.model_inference("请压缩以下记录", "", use_cache=False)
+        
+        assert result == "最新摘要"
+        lookup.assert_not_called()
+        store.assert_not_called()
@@ -0,0 +1,27 @@
+"""
+并行推理模块单元测试
+"""
+import time
+
+from app.pipeline.parallel_inference import parallel_generate
+
+
+def _slow_echo(data, context):
+    """先提交的任务耗时更长，完成顺序与提交顺序相反"""
+    time.sleep(data["delay"])
+    if context == "fail":
+        raise ValueError(context)
+    return context
+
+
+class TestParallelGenerate:
+    """并行生成测试类"""
+    
+    def test_results_follow_input_order(self):
+        """测试结果按输入顺序返回，而不是按完成顺序"""
+        data_list = [{"delay": 0.03}, {"delay": 0.02}, {"delay": 0.01}, {"delay": 0.0}]
+        context_list = ["第一块", "第二块", "fail", "第四块"]
+        
+        results = parallel_generate(_slow_echo, data_list, context_list, backend="thread")
+        
+        assert results == ["第一块", "第二块", "", "第四块"]
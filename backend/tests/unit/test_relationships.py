@@ -0,0 +1,79 @@
+"""
+知识图谱关系存储单元测试
+"""
+import contextlib
+from unittest.mock import MagicMock, patch
+
+from app.database import db_utils
+
+
+def _legacy_relationship(rel_id="character_1__KNOWS__character_2"):
+    return {
+        "id": rel_id,
+        "from_node": {"type": "Character", "id": "1"},
+        "to_node": {"type": "Character", "id": "2"},
+        "type": "KNOWS",
+        "properties": {"since": "第一章"}
+    }
+
+
+@contextlib.contextmanager
+def _fake_transaction(cursor):
+    yield MagicMock(), cursor
+
+
+class TestImportLegacyRelationships:
+    """旧版关系迁移测试类"""
+    
+    def test_legacy_relationships_moved_to_table(self):
+        """测试图状态中的旧版关系写入relationships表，并从图状态中删除"""
+        cursor = MagicMock()
+        cursor.fetchone.return_value = {"relationships": [_legacy_relationship()]}
+        
+        with patch.object(db_utils, "db_transaction", return_value=_fake_transaction(cursor)), \
+             patch.object(db_utils, "execute_values") as insert:
+            success, count = db_utils.import_legacy_relationships("project-1")
+        
+        assert (success, count) == (True, 1)
+        query, rows = insert.call_args.args[1:]
+        assert "DO NOTHING" in query
+        assert rows[0][:7] == ("project-1", "character_1__KNOWS__character_2", "Character", "1", "Character", "2", "KNOWS")
+        update_sql, params = cursor.execute.call_args.args
+        assert "state - 'relationships'" in update_sql
+        assert params == ("project-1",)
+    
+    def test_no_legacy_state(self):
+        """测试没有旧版图状态时不写入任何数据"""
+        cursor = MagicMock()
+        cursor.fetchone.return_value = None
+        
+        with patch.object(db_utils, "db_transaction", return_value=_fake_transaction(cursor)), \
+             patch.object(db_utils, "execute_values") as insert:
+            assert db_utils.import_legacy_relationships("project-1") == (True, 0)
+        
+        insert.assert_not_called()
+        cursor.execute.assert_called_once()
+    
+    def test_failure_reported_and_logged(self):
+        """测试数据库错误时返回失败并记录日志"""
+        with patch.object(db_utils, "db_transaction", side_effect=RuntimeError("连接断开")), \
+             patch.object(db_utils, "logger") as logger:
+            success, error = db_utils.import_legacy_relationships("project-1")
+        
+        assert not success
+        assert "连接断开" in error
+        logger.error.assert_called_once()
+
+
+class TestSaveRelationships:
+    """关系批量保存测试类"""
+    
+    def test_failure_logged(self):
+        """测试保存失败时记录日志，而不只是返回错误信息"""
+        with patch.object(db_utils, "db_transaction", side_effect=RuntimeError("连接断开")), \
+             patch.object(db_utils, "logger") as logger:
+            success, error = db_utils.save_relationships("project-1", [_legacy_relationship()])
+        
+        assert not success
+        assert "连接断开" in error
+        logger.error.assert_called_once()
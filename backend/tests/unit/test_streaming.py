@@ -0,0 +1,45 @@
+"""
+流式输出工具单元测试
+"""
+import json
+import pytest
+
+from app.utils.streaming import eloquent_wrap
+
+
+async def _chunks(texts):
+    for text in texts:
+        yield text.encode("utf-8")
+
+
+def _events(raw: bytes):
+    """解析SSE事件，返回 (事件类型, 数据) 列表"""
+    events = []
+    for block in raw.decode("utf-8").strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((fields.get("event", "message"), json.loads(fields["data"])))
+    return events
+
+
+class TestEloquentWrap:
+    """带冗余片段的SSE封装测试类"""
+    
+    @pytest.mark.asyncio
+    async def test_any_frame_recovers_recent_tokens(self):
+        """测试丢失中间事件后，后续事件仍能补齐内容"""
+        texts = ["第", "一", "章", "开", "始"]
+        raw = b"".join([frame async for frame in eloquent_wrap(_chunks(texts), window=3)])
+        events = _events(raw)
+        
+        assert events[-1] == ("done", {"seq": 5})
+        
+        # 模拟客户端：只收到第1个和第4个事件
+        rendered, max_seq = [], 0
+        for _, data in (events[0], events[3]):
+            first_seq = data["seq"] - len(data["tokens"]) + 1
+            for offset, token in enumerate(data["tokens"]):
+                if first_seq + offset > max_seq:
+                    rendered.append(token)
+            max_seq = data["seq"]
+        
+        assert "".join(rendered) == "第一章开"
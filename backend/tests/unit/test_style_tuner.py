@@ -0,0 +1,38 @@
+"""
+风格微调器单元测试
+"""
+import pytest
+
+from app.pipeline import style_tuner
+from app.pipeline.style_tuner import StyleTuner
+
+
+@pytest.fixture
+def tuner_paths(tmp_path, monkeypatch):
+    """使用临时目录的风格元数据"""
+    monkeypatch.setattr(style_tuner, "STYLE_SAMPLES_DIR", tmp_path)
+    monkeypatch.setattr(style_tuner, "METADATA_PATH", tmp_path / "metadata.json")
+    monkeypatch.setattr(style_tuner, "METADATA_LOG_PATH", tmp_path / "metadata.jsonl")
+    return tmp_path
+
+
+class TestMetadataLog:
+    """风格元数据修改日志测试类"""
+    
+    def test_changes_replayed_from_log(self, tuner_paths):
+        """测试修改追加到日志，重新加载时重放"""
+        StyleTuner().add_style_sample("古风", "床前明月光", "古典风格")
+        
+        assert StyleTuner().styles_metadata["古风"]["description"] == "古典风格"
+    
+    def test_append_after_truncated_tail(self, tuner_paths):
+        """测试写了一半的末行被截掉，之后追加的修改不会接在它后面而丢失"""
+        StyleTuner().add_style_sample("古风", "床前明月光")
+        with open(style_tuner.METADATA_LOG_PATH, "ab") as f:
+            f.write(b'{"op": "update", "style_na')
+        
+        StyleTuner().add_style_sample("武侠", "刀光剑影")
+        
+        metadata = StyleTuner().styles_metadata
+        assert "古风" in metadata
+        assert "武侠" in metadata
@@ -0,0 +1,85 @@
+"""
+版本历史压缩与增量回放单元测试
+"""
+from unittest.mock import MagicMock, patch
+
+# 模块导入时会创建存储实例并初始化表结构，这里不连接数据库
+with patch("app.database.db_utils.get_db_connection", return_value=MagicMock()):
+    from app import memory
+
+
+def _row(version, kind, text):
+    codec, data = memory.compress_text(text)
+    return {"version": version, "kind": kind, "codec": codec, "data": data, "text": None}
+
+
+class TestCompression:
+    """版本文本压缩测试类"""
+    
+    def test_round_trip(self):
+        """测试压缩后能还原原文"""
+        text = "夜色渐深，长街上只剩下风声。" * 20
+        codec, data = memory.compress_text(text)
+        
+        assert codec in ("zstd", "zlib")
+        assert len(data) < len(text.encode("utf-8"))
+        assert memory.decompress_text(codec, data) == text
+    
+    def test_legacy_uncompressed_row(self):
+        """测试旧数据（codec为none）直接返回text列"""
+        assert memory.decompress_text("none", None, "旧版本内容") == "旧版本内容"
+
+
+class TestRebuildVersions:
+    """快照与增量回放测试类"""
+    
+    def test_snapshot_then_deltas(self):
+        """测试完整快照之后的增量依次追加"""
+        rows = [_row(1, "full", "第一章"), _row(2, "append", "。第二章"), _row(3, "append", "。第三章")]
+        
+        assert memory._rebuild_versions(rows) == {
+            1: "第一章", 2: "第一章。第二章", 3: "第一章。第二章。第三章"
+        }
+    
+    def test_new_snapshot_replaces_text(self):
+        """测试新的完整快照替换之前回放的文本"""
+        rows = [_row(1, "full", "旧稿"), _row(2, "append", "续写"), _row(3, "full", "新稿")]
+        
+        assert memory._rebuild_versions(rows)[3] == "新稿"
+    
+    def test_gap_skips_versions_until_next_snapshot(self):
+        """测试版本记录缺失时，到下一个完整快照之前的版本都不还原"""
+        rows = [
+            _row(1, "full", "甲"), _row(2, "append", "乙"),
+            # 版本3写入失败
+            _row(4, "append", "丁"), _row(5, "append", "戊"),
+            _row(6, "full", "甲乙丙丁戊己"), _row(7, "append", "庚")
+        ]
+        
+        assert memory._rebuild_versions(rows) == {
+            1: "甲", 2: "甲乙", 6: "甲乙丙丁戊己", 7: "甲乙丙丁戊己庚"
+        }
+    
+    def test_missing_snapshot(self):
+        """测试开头没有完整快照时增量不被当作完整文本"""
+        assert memory._rebuild_versions([_row(2, "append", "乙")]) == {}
+
+
+class TestVersionHistoryWriter:
+    """版本历史写入器测试类"""
+    
+    def test_failed_batch_requests_snapshot(self):
+        """测试一批版本记录写入失败后，相关内存的下一个版本保存完整快照"""
+        writer = memory.VersionHistoryWriter(flush_interval=0.01)
+        with patch.object(memory.VersionHistoryWriter, "_write", side_effect=RuntimeError("连接断开")):
+            writer.put("memory-1", 2, "append", "乙")
+            writer.flush()
+        
+        assert writer.needs_snapshot("memory-1")
+        assert not writer.needs_snapshot("memory-2")
+        
+        with patch.object(memory.VersionHistoryWriter, "_write"):
+            writer.put("memory-1", 3, "full", "甲乙丙")
+            writer.flush()
+        
+        assert not writer.needs_snapshot("memory-1")